@@ -0,0 +1,230 @@
+"""End to end throughput benchmark of scrape_site against the local stand-in recipe site of benchmarks.stand_in_site.
+Reports pages/second, p50 & p99 page latency, peak RSS & bytes written, and appends the result to a JSON Lines file,
+so results of releases can be compared. A run is compared with the last stored run with the same settings on the same machine.
+
+Page latency is measured by the site, from the first request for a page to its last response, so it includes retries.
+
+Usage: python -m benchmarks.end_to_end [--recipes 1000] [--non-recipes 500] [--latency 0.02] [--error-rate 0.01] ...
+"""
+
+import argparse
+import contextlib
+import datetime
+import importlib.metadata
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, fields
+
+from recipe_database_scraper import scrape_site
+
+from .stand_in_site import SiteSettings, StandInSiteProcess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_FILE = os.path.join(REPO_DIR, "benchmarks", "results", "end_to_end.jsonl")
+USER_AGENT = "recipe-database-scraper-benchmark"
+
+
+def package_version() -> str:
+    try:
+        return importlib.metadata.version("recipe-database-scraper")
+    except importlib.metadata.PackageNotFoundError:
+        pass
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11
+        return "unknown"
+    with open(os.path.join(REPO_DIR, "pyproject.toml"), "rb") as pyproject:
+        return tomllib.load(pyproject)["tool"]["poetry"]["version"]
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def peak_rss_bytes() -> int:
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+def directory_size(directory: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, filename))
+        for root, _, filenames in os.walk(directory)
+        for filename in filenames
+    )
+
+
+def percentile(values: list, percent: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1]
+
+
+def run(site_settings: SiteSettings, scrape_settings: dict, verbose: bool) -> dict:
+    """Scrape the stand-in site once with scrape_site & return the measurements"""
+    with StandInSiteProcess(site_settings) as site, tempfile.TemporaryDirectory(
+        prefix="recipe_scraper_benchmark"
+    ) as output_dir:
+        output_file = os.path.join(output_dir, "recipes.json")
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(
+            sys.stdout if verbose else devnull
+        ):
+            start_time = time.perf_counter()
+            scrape_site(
+                site.base_url + "/",
+                USER_AGENT,
+                output_file=output_file,
+                **scrape_settings,
+            )
+            elapsed = time.perf_counter() - start_time
+        site_stats = site.stats()
+        bytes_written = directory_size(output_dir)
+        with open(output_file) as recipes_file:
+            recipes = json.load(recipes_file)
+
+    pages = site_settings.recipes + site_settings.non_recipes
+    latencies_ms = [latency * 1000 for latency in site_stats["page_latencies"]]
+    return {
+        "pages": pages,
+        "recipes": len(recipes) - ("Pages without Recipe" in recipes),
+        "seconds": round(elapsed, 3),
+        "pages_per_second": round(pages / elapsed, 2),
+        "latency_p50_ms": round(percentile(latencies_ms, 50), 2),
+        "latency_p99_ms": round(percentile(latencies_ms, 99), 2),
+        "peak_rss_mb": round(peak_rss_bytes() / 1024**2, 1),
+        "bytes_written": bytes_written,
+        "page_requests": site_stats["page_requests"],
+        "errors_injected": site_stats["errors"],
+        "throttled": site_stats["throttled"],
+    }
+
+
+def machine() -> dict:
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def previous_result(results_file: str, result: dict) -> dict | None:
+    """Return the last stored result with the same settings on the same machine"""
+    if not os.path.isfile(results_file):
+        return None
+    previous = None
+    with open(results_file) as results:
+        for line in results:
+            stored = json.loads(line)
+            if (
+                stored["settings"] == result["settings"]
+                and stored["machine"] == result["machine"]
+            ):
+                previous = stored
+    return previous
+
+
+def _change(metric: str, result: dict, previous: dict | None) -> str:
+    if not previous or not previous["metrics"].get(metric):
+        return ""
+    change = result["metrics"][metric] / previous["metrics"][metric] - 1
+    release = " ".join(filter(None, (previous["version"], previous["commit"])))
+    return f" ({change:+.1%} vs {release})"
+
+
+def report(result: dict, previous: dict | None):
+    metrics = result["metrics"]
+    print(
+        f"Scraped {str(metrics['pages'])} pages, {str(metrics['recipes'])} recipes in {metrics['seconds']:.1f}s: "
+        f"{metrics['pages_per_second']:.1f} pages/second{_change('pages_per_second', result, previous)}"
+    )
+    for metric, label, unit in (
+        ("latency_p50_ms", "p50 page latency", " ms"),
+        ("latency_p99_ms", "p99 page latency", " ms"),
+        ("peak_rss_mb", "Peak RSS", " MB"),
+        ("bytes_written", "Bytes written", ""),
+    ):
+        print(
+            f"{label}: {str(metrics[metric])}{unit}{_change(metric, result, previous)}"
+        )
+    print(
+        f"{str(metrics['page_requests'])} page requests, of which {str(metrics['errors_injected'])} errors & {str(metrics['throttled'])} 429s were injected"
+    )
+    if metrics["recipes"] != result["settings"]["site"]["recipes"]:
+        print(
+            f"WARNING: Expected {str(result['settings']['site']['recipes'])} recipes, scraped {str(metrics['recipes'])}"
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks.end_to_end", description=__doc__.split("\n")[0]
+    )
+    defaults = SiteSettings()
+    for field in fields(SiteSettings):
+        parser.add_argument(
+            "--" + field.name.replace("_", "-"),
+            type=field.type,
+            default=getattr(defaults, field.name),
+        )
+    parser.add_argument("--max-workers", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--stream-sitemaps", action="store_true")
+    parser.add_argument("--parse-processes", type=int, default=None)
+    parser.add_argument("--results", default=RESULTS_FILE)
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--verbose", action="store_true")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    site_settings = SiteSettings(
+        **{field.name: getattr(args, field.name) for field in fields(SiteSettings)}
+    )
+    scrape_settings = {
+        "max_workers": args.max_workers,
+        "batch_size": args.batch_size,
+        "stream_sitemaps": args.stream_sitemaps,
+        "parse_processes": args.parse_processes,
+    }
+    metrics = run(site_settings, scrape_settings, args.verbose)
+
+    result = {
+        "version": package_version(),
+        "commit": git_commit(),
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(
+            timespec="seconds"
+        ),
+        "machine": machine(),
+        "settings": {"site": asdict(site_settings), "scrape": scrape_settings},
+        "metrics": metrics,
+    }
+    previous = previous_result(args.results, result)
+    report(result, previous)
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.results)), exist_ok=True)
+        with open(args.results, "a") as results:
+            results.write(json.dumps(result) + "\n")
+        print(f"Stored result in {args.results}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Memory benchmark of sitemap pages: a list of Page objects with a __dict__ against the array backed Pages.
+
+Usage: python -m benchmarks.pages_memory [number_of_pages]
+"""
+
+import datetime
+import sys
+import time
+import tracemalloc
+
+from recipe_database_scraper.sitemap_scraper import Page, Pages
+
+
+class DictPage:
+    """Page as stored before Pages was array backed"""
+
+    def __init__(self, url, last_modified):
+        self.page_url = url
+        self.last_modified = last_modified
+
+
+def sitemap_pages(number_of_pages: int):
+    start = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+    for index in range(number_of_pages):
+        yield (
+            f"https://www.example.com/recipes/{index % 97}/recipe-{index}-with-a-long-slug/",
+            (start + datetime.timedelta(minutes=index)).isoformat(),
+        )
+
+
+def measure(build) -> tuple[int, float]:
+    # Timed without tracing, as tracemalloc slows down allocations
+    start_time = time.perf_counter()
+    build()
+    elapsed = time.perf_counter() - start_time
+    tracemalloc.start()
+    pages = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del pages
+    return size, elapsed
+
+
+def build_list(number_of_pages: int):
+    return [DictPage(url, lastmod) for url, lastmod in sitemap_pages(number_of_pages)]
+
+
+def build_pages(number_of_pages: int):
+    pages = Pages()
+    for url, lastmod in sitemap_pages(number_of_pages):
+        pages.add(Page(url, lastmod))
+    return pages
+
+
+def main():
+    number_of_pages = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    for name, build in (("list of Page", build_list), ("Pages", build_pages)):
+        size, elapsed = measure(lambda: build(number_of_pages))
+        print(
+            f"{name}: {size / 1024**2:.1f} MB for {str(number_of_pages)} pages ({size / number_of_pages:.0f} bytes per page), built in {elapsed:.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+"""Local stand-in recipe site for offline benchmarks: synthetic recipe & non recipe pages with JSON-LD, nested sitemap indexes and a robots.txt.
+Latency, server errors & 429 responses can be injected into page requests. Faults are drawn per page from the seed and only hit the first request of a page,
+and sitemaps & robots.txt are always served, so every run makes the same requests & scrapes every page.
+
+The site runs in its own process, so serving pages does not compete with the scraper for the GIL.
+Request statistics are served as JSON at /_stats.
+"""
+
+import functools
+import gzip
+import json
+import math
+import multiprocessing
+import random
+import threading
+import time
+import urllib.request
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STATS_PATH = "/_stats"
+
+DISHES = ["soup", "stew", "curry", "salad", "pie", "risotto", "tacos", "lasagna"]
+CUISINES = ["italian", "thai", "mexican", "french", "indian", "greek", "dutch"]
+INGREDIENTS = [
+    "onion",
+    "garlic clove",
+    "carrot",
+    "celery stalk",
+    "olive oil",
+    "butter",
+    "flour",
+    "chicken stock",
+    "tomato",
+    "lemon",
+    "parsley",
+    "salt",
+    "black pepper",
+    "cumin",
+    "paprika",
+]
+NON_RECIPE_SECTIONS = ["blog", "shop", "about", "category"]
+FILLER_PARAGRAPH = (
+    "<p>Cooking at home is easier than it looks. Start with fresh produce, "
+    "take your time with the prep and taste as you go. Leftovers keep for "
+    "three days in the fridge, and most of this freezes well.</p>"
+)
+
+
+@dataclass
+class SiteSettings:
+    """Shape of the stand-in site & the faults injected into its page requests.
+    Latency is in seconds, error_rate & throttle_rate are the shares of pages whose first request is answered with a 503 or a 429
+    """
+
+    recipes: int = 1000
+    non_recipes: int = 500
+    urls_per_sitemap: int = 500
+    sitemaps_per_index: int = 4
+    filler_paragraphs: int = 300
+    latency: float = 0.02
+    latency_jitter: float = 0.5
+    error_rate: float = 0.01
+    throttle_rate: float = 0.01
+    retry_after: int = 1
+    seed: int = 0
+
+
+class StandInSite:
+    """Pages & sitemaps of the stand-in site, generated from its settings"""
+
+    def __init__(self, settings: SiteSettings, base_url: str):
+        self.settings = settings
+        self.base_url = base_url
+        kinds = [True] * settings.recipes + [False] * settings.non_recipes
+        random.Random(settings.seed).shuffle(kinds)
+        self.page_paths = [
+            self._page_path(index, is_recipe) for index, is_recipe in enumerate(kinds)
+        ]
+        self.pages = dict(zip(self.page_paths, enumerate(kinds)))
+        self.n_sitemaps = math.ceil(len(kinds) / settings.urls_per_sitemap)
+        self.n_indexes = math.ceil(self.n_sitemaps / settings.sitemaps_per_index)
+
+    @staticmethod
+    def _page_path(index: int, is_recipe: bool) -> str:
+        if is_recipe:
+            cuisine = CUISINES[index % len(CUISINES)]
+            dish = DISHES[index % len(DISHES)]
+            return f"/recipes/{cuisine}-{dish}-{str(index)}/"
+        section = NON_RECIPE_SECTIONS[index % len(NON_RECIPE_SECTIONS)]
+        return f"/{section}/post-{str(index)}/"
+
+    @staticmethod
+    def _last_modified(index: int) -> str:
+        return f"2024-{index % 12 + 1:02d}-{index % 28 + 1:02d}T08:00:00+00:00"
+
+    def robots_txt(self) -> str:
+        return (
+            "User-agent: *\n"
+            "Disallow: /cart/\n"
+            f"Sitemap: {self.base_url}/sitemap_index.xml\n"
+        )
+
+    def sitemap_index(self) -> str:
+        return self._sitemap_index(
+            f"{self.base_url}/sitemaps/index-{str(index)}.xml"
+            for index in range(self.n_indexes)
+        )
+
+    def nested_index(self, index: int) -> str | None:
+        if not 0 <= index < self.n_indexes:
+            return None
+        first_sitemap = index * self.settings.sitemaps_per_index
+        last_sitemap = min(
+            first_sitemap + self.settings.sitemaps_per_index, self.n_sitemaps
+        )
+        return self._sitemap_index(
+            f"{self.base_url}/sitemaps/pages-{str(sitemap)}.xml"
+            for sitemap in range(first_sitemap, last_sitemap)
+        )
+
+    @staticmethod
+    def _sitemap_index(sitemap_urls) -> str:
+        sitemaps = "".join(
+            f"<sitemap><loc>{sitemap_url}</loc></sitemap>"
+            for sitemap_url in sitemap_urls
+        )
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{sitemaps}</sitemapindex>'
+        )
+
+    def pages_sitemap(self, sitemap: int) -> str | None:
+        if not 0 <= sitemap < self.n_sitemaps:
+            return None
+        first_page = sitemap * self.settings.urls_per_sitemap
+        page_paths = self.page_paths[
+            first_page : first_page + self.settings.urls_per_sitemap
+        ]
+        urls = "".join(
+            f"<url><loc>{self.base_url}{page_path}</loc>"
+            f"<lastmod>{self._last_modified(first_page + offset)}</lastmod></url>"
+            for offset, page_path in enumerate(page_paths)
+        )
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>'
+        )
+
+    def _recipe_schema(self, index: int, title: str, page_url: str) -> dict:
+        rng = random.Random(self.settings.seed * 1_000_003 + index)
+        ingredients = rng.sample(INGREDIENTS, 8)
+        return {
+            "@type": "Recipe",
+            "@id": f"{page_url}#recipe",
+            "name": title,
+            "description": f"An easy {title.lower()} for weeknights.",
+            "author": {"@type": "Person", "name": "Stand-in Cook"},
+            "datePublished": self._last_modified(index),
+            "image": [f"{self.base_url}/images/{str(index)}.jpg"],
+            "recipeYield": [
+                str(rng.randint(2, 8)),
+                f"{str(rng.randint(2, 8))} servings",
+            ],
+            "prepTime": f"PT{str(rng.randint(5, 30))}M",
+            "cookTime": f"PT{str(rng.randint(10, 90))}M",
+            "totalTime": f"PT{str(rng.randint(40, 120))}M",
+            "recipeCategory": ["Main Course"],
+            "recipeCuisine": [title.split()[0]],
+            "recipeIngredient": [
+                f"{str(rng.randint(1, 4))} {ingredient}" for ingredient in ingredients
+            ],
+            "recipeInstructions": [
+                {
+                    "@type": "HowToStep",
+                    "text": f"Add the {ingredient} and stir for {str(rng.randint(1, 10))} minutes.",
+                }
+                for ingredient in ingredients
+            ],
+            "aggregateRating": {
+                "@type": "AggregateRating",
+                "ratingValue": str(round(rng.uniform(3, 5), 1)),
+                "ratingCount": str(rng.randint(1, 500)),
+            },
+            "nutrition": {
+                "@type": "NutritionInformation",
+                "calories": f"{str(rng.randint(200, 800))} kcal",
+                "servingSize": "1 serving",
+            },
+        }
+
+    @functools.lru_cache(maxsize=None)
+    def page(self, page_path: str) -> bytes | None:
+        """Html of a page, with a Recipe in its JSON-LD graph for recipe pages and an Article otherwise"""
+        if page_path not in self.pages:
+            return None
+        index, is_recipe = self.pages[page_path]
+        page_url = self.base_url + page_path
+        title = page_path.strip("/").split("/")[-1].replace("-", " ").title()
+        graph = [
+            {
+                "@type": "WebSite",
+                "@id": f"{self.base_url}/#website",
+                "name": "Stand-in",
+            },
+            {"@type": "WebPage", "@id": page_url, "name": title},
+        ]
+        if is_recipe:
+            graph.append(self._recipe_schema(index, title, page_url))
+        else:
+            graph.append({"@type": "Article", "headline": title})
+        json_ld = json.dumps({"@context": "https://schema.org", "@graph": graph})
+        filler = FILLER_PARAGRAPH * self.settings.filler_paragraphs
+        return (
+            '<!DOCTYPE html><html lang="en"><head><meta charset="utf-8">'
+            f"<title>{title} | Stand-in</title>"
+            f'<link rel="canonical" href="{page_url}">'
+            '<meta property="og:site_name" content="Stand-in">'
+            f'<script type="application/ld+json">{json_ld}</script>'
+            f"</head><body><nav>{' '.join(CUISINES)}</nav><main><h1>{title}</h1>"
+            f"{filler}</main><footer>Stand-in recipes</footer></body></html>"
+        ).encode("utf-8")
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        site = server.site
+        path = self.path.split("?", 1)[0]
+        if path == STATS_PATH:
+            self._send(200, json.dumps(server.stats()).encode(), "application/json")
+            return
+        if path == "/robots.txt":
+            self._send(200, site.robots_txt().encode(), "text/plain")
+            return
+        if path.startswith("/sitemap"):
+            self._send_sitemap(site, path)
+            return
+
+        body = site.page(path)
+        if body is None:
+            self._send(404, b"Not found", "text/plain")
+            return
+        attempt = server.page_requested(path)
+        status = server.inject_faults(path, attempt)
+        if status == 429:
+            self._send(
+                429,
+                b"Too many requests",
+                "text/plain",
+                {"Retry-After": str(site.settings.retry_after)},
+            )
+        elif status == 503:
+            self._send(503, b"Service unavailable", "text/plain")
+        else:
+            self._send(200, body, "text/html; charset=utf-8")
+        server.page_responded(path, status)
+
+    def _send_sitemap(self, site, path):
+        body = None
+        if path == "/sitemap_index.xml":
+            body = site.sitemap_index()
+        elif path.startswith("/sitemaps/index-") and path.endswith(".xml"):
+            body = site.nested_index(_path_number(path))
+        elif path.startswith("/sitemaps/pages-") and path.endswith(".xml"):
+            body = site.pages_sitemap(_path_number(path))
+        if body is None:
+            self._send(404, b"Not found", "text/plain")
+        else:
+            self._send(200, body.encode(), "application/xml")
+
+    def _send(self, status, body, content_type, headers=None):
+        if "gzip" in self.headers.get("Accept-Encoding", "") and len(body) > 1024:
+            body = gzip.compress(body, compresslevel=6)
+            headers = {**(headers or {}), "Content-Encoding": "gzip"}
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _path_number(path: str) -> int:
+    number = path.rsplit("-", 1)[-1].removesuffix(".xml")
+    return int(number) if number.isdigit() else -1
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, settings: SiteSettings):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.site = StandInSite(settings, f"http://127.0.0.1:{self.server_port}")
+        self._lock = threading.Lock()
+        # Page path: [requests, first request time, last response time]
+        self.page_times = {}
+        self.page_requests = 0
+        self.errors = 0
+        self.throttled = 0
+
+    def page_requested(self, path: str) -> int:
+        """Count a request for a page & return its attempt number"""
+        with self._lock:
+            self.page_requests += 1
+            page_times = self.page_times.setdefault(
+                path, [0, time.perf_counter(), None]
+            )
+            page_times[0] += 1
+            return page_times[0]
+
+    def inject_faults(self, path: str, attempt: int) -> int:
+        """Sleep for the injected latency & return the status code of the response"""
+        settings = self.site.settings
+        rng = random.Random(f"{str(settings.seed)}:{path}:{str(attempt)}")
+        jitter = rng.uniform(-1, 1) * settings.latency_jitter
+        time.sleep(max(settings.latency * (1 + jitter), 0))
+        if attempt > 1:
+            return 200
+        draw = rng.random()
+        if draw < settings.throttle_rate:
+            return 429
+        if draw < settings.throttle_rate + settings.error_rate:
+            return 503
+        return 200
+
+    def page_responded(self, path: str, status: int):
+        with self._lock:
+            self.page_times[path][2] = time.perf_counter()
+            if status == 429:
+                self.throttled += 1
+            elif status == 503:
+                self.errors += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "page_requests": self.page_requests,
+                "errors": self.errors,
+                "throttled": self.throttled,
+                "page_latencies": [
+                    last_response - first_request
+                    for _, first_request, last_response in self.page_times.values()
+                    if last_response is not None
+                ],
+            }
+
+
+def _serve(settings: SiteSettings, base_urls):
+    server = StandInServer(settings)
+    base_urls.put(server.site.base_url)
+    server.serve_forever()
+
+
+class StandInSiteProcess:
+    """Run the stand-in site in a child process, as a context manager"""
+
+    def __init__(self, settings: SiteSettings | None = None):
+        self.settings = settings or SiteSettings()
+        self.process = None
+        self.base_url = None
+
+    def __enter__(self) -> "StandInSiteProcess":
+        base_urls = multiprocessing.Queue()
+        self.process = multiprocessing.Process(
+            target=_serve, args=(self.settings, base_urls), daemon=True
+        )
+        self.process.start()
+        self.base_url = base_urls.get(timeout=30)
+        return self
+
+    def stats(self) -> dict:
+        with urllib.request.urlopen(self.base_url + STATS_PATH) as response:
+            return json.load(response)
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        self.process.join()
+
+
+def main():
+    settings = SiteSettings(latency=0, error_rate=0, throttle_rate=0)
+    server = StandInServer(settings)
+    print(
+        f"Serving {str(settings.recipes + settings.non_recipes)} pages at {server.site.base_url}"
+    )
+    print(json.dumps(asdict(settings)))
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
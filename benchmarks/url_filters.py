@@ -0,0 +1,65 @@
+"""Speed benchmark of sitemap & page filtering: a scan per keyword against the compiled UrlFilter.
+
+Usage: python -m benchmarks.url_filters [number_of_pages]
+"""
+
+import sys
+import time
+
+from recipe_database_scraper.sitemap_scraper import (
+    SITEMAP_FILTER_KEYWORDS,
+    URL_FILTER_KEYWORDS,
+)
+from recipe_database_scraper.url_filters import UrlFilter
+
+EXTENSIONS = ["", "", "", "/", ".jpg", ".pdf", ".html"]
+
+
+def sitemap_urls(number_of_pages: int) -> list:
+    return [
+        f"https://www.example.com/recipes/{index % 97}/recipe-{index}-with-a-long-slug{EXTENSIONS[index % len(EXTENSIONS)]}"
+        for index in range(number_of_pages)
+    ]
+
+
+def page_scan(urls: list) -> int:
+    """Page filtering as done before UrlFilter"""
+    return sum(any(word in url.lower() for word in URL_FILTER_KEYWORDS) for url in urls)
+
+
+def sitemap_scan(urls: list) -> int:
+    """Sitemap filtering as done before UrlFilter"""
+    return sum(
+        any(word in url.lower() for word in SITEMAP_FILTER_KEYWORDS) for url in urls
+    )
+
+
+def compiled_page_filter(urls: list) -> int:
+    url_filter = UrlFilter(SITEMAP_FILTER_KEYWORDS, URL_FILTER_KEYWORDS)
+    return sum(map(url_filter.page_filtered, urls))
+
+
+def compiled_sitemap_filter(urls: list) -> int:
+    url_filter = UrlFilter(SITEMAP_FILTER_KEYWORDS, URL_FILTER_KEYWORDS)
+    return sum(map(url_filter.sitemap_filtered, urls))
+
+
+def main():
+    number_of_pages = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    urls = sitemap_urls(number_of_pages)
+    for name, run in (
+        ("URL_FILTER_KEYWORDS scan", page_scan),
+        ("UrlFilter.page_filtered", compiled_page_filter),
+        ("SITEMAP_FILTER_KEYWORDS scan", sitemap_scan),
+        ("UrlFilter.sitemap_filtered", compiled_sitemap_filter),
+    ):
+        start_time = time.perf_counter()
+        filtered_urls = run(urls)
+        elapsed = time.perf_counter() - start_time
+        print(
+            f"{name}: filtered {str(filtered_urls)} of {str(number_of_pages)} urls in {elapsed:.2f}s ({number_of_pages / elapsed:,.0f} urls/second)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,32 @@
-__all__ = ["scrape_site", "extract_domain", "strip_url_to_homepage"]
+__all__ = [
+    "scrape_site",
+    "ascrape_site",
+    "plan_site",
+    "scrape_sites",
+    "extract_domain",
+    "strip_url_to_homepage",
+]
+
+import asyncio
+import inspect
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from .recipe_scraper import RecipeScraper
+from .crawl_plan import CrawlPlan
+from .get_html import DEFAULT_POOL_SIZE, DEFAULT_MAX_BODY_SIZE
+from .politeness import PolitenessScheduler
+from .html_cache import HTMLCache
+from .sitemap_cache import SitemapCache
+from .sqlite_store import RecipeDatabase
+from .exclusion_store import ExclusionStore
+from .url_classifier import UrlClassifier, UrlClassifierStore
+from ._urls import is_valid_url, url_host
 from ._utils import (
-    is_valid_url,
     domain_extractor,
     strip_url_to_homepage as strip_url,
     FileHandler,
+    is_jsonl_file,
 )
 from ._exceptions import (
     ExtractDomainException,
@@ -14,16 +35,16 @@ from ._exceptions import (
 )
 
 
-def scrape_site(
+def _prepare_site_input(
     url: str,
-    user_agent: str,
     *,
-    input_dict: list | None = None,
-    input_file: str | None = None,
-    output_file: str | None = None,
-    batch_size: int | None = None,
-) -> RecipeScraper:
-
+    input_dict: dict | None,
+    input_file: str | None,
+    output_file: str | None,
+    batch_size: int | None,
+    output_db: str | None = None,
+) -> tuple[str, dict | None, list]:
+    """Validate the scrape_site arguments & return the stripped url, input dict and excluded pages"""
     try:
         is_valid_url(url)
     except Exception as ex:
@@ -36,56 +57,465 @@ def scrape_site(
             "Unable to determine whether to use input_file or input_dict. Please use only 1 input option"
         )
 
-    if input_file and not input_file.endswith(".json"):
-        raise InputException("Input file must be of json format, e.g. 'example.json'")
+    if input_file and not input_file.endswith((".json", ".jsonl")):
+        raise InputException(
+            "Input file must be of json or jsonl format, e.g. 'example.json'"
+        )
 
     if input_file:
-        input_dict = FileHandler(input_file).load_json_file()
-
-        all_exclusions_dict = FileHandler(input_file).load_exclusion_json_file()
+        exclusions = ExclusionStore.for_file(input_file).load(stripped_url)
+        if is_jsonl_file(input_file):
+            input_dict, jsonl_exclusions = FileHandler(input_file).load_jsonl_site()
+            exclusions.update(jsonl_exclusions)
+        else:
+            input_dict = FileHandler(input_file).load_json_file()
     else:
-        all_exclusions_dict = None
-
-    exclusions_list = (
-        all_exclusions_dict.get(stripped_url, []) if all_exclusions_dict else []
-    )
-
-    if all_exclusions_dict and len(exclusions_list) == 0:
-        print(
-            "WARNING: URL not found in _recipe_scraper_exclusions.json file. Please ignore this warning if this is the first time scraping the URL"
-        )
+        exclusions = {}
 
     if input_dict and not isinstance(input_dict, dict):
         raise InputException(
             f"""Provided input_{"file content" if input_file else "dict"} is not a valid dict"""
         )
 
-    if output_file and not output_file.endswith(".json"):
-        raise Exception("Output file must be of json format, e.g. 'example.json'")
+    if output_file and not output_file.endswith((".json", ".jsonl")):
+        raise Exception(
+            "Output file must be of json or jsonl format, e.g. 'example.json'"
+        )
 
     if batch_size and batch_size <= 0:
         raise ValueError("Batch size must be a positive integer.")
 
-    if batch_size and not output_file:
-        raise Exception("Writing batches requires having an output file to write to")
+    if output_file and output_db:
+        raise InputException(
+            "Unable to determine whether to use output_file or output_db. Please use only 1 output option"
+        )
+
+    if batch_size and not (output_file or output_db):
+        raise Exception(
+            "Writing batches requires having an output file or database to write to"
+        )
+
+    # Batches are appended to a jsonl output file, so start from an empty file unless it is also the input
+    if (
+        is_jsonl_file(output_file)
+        and os.path.isfile(output_file)
+        and not (input_file and os.path.samefile(input_file, output_file))
+    ):
+        print(f"INFO: Overwriting existing output file {output_file}")
+        open(output_file, "w").close()
+
+    return stripped_url, input_dict, exclusions
+
+
+def _open_output_db(
+    output_db: str | None, stripped_url: str, input_dict: dict | None, exclusions: dict
+) -> tuple[RecipeDatabase | None, dict | None, dict]:
+    """Open the output database. Without other input, the pages stored for the site are used as input dict & excluded pages, so only changed pages are scraped"""
+    if not output_db:
+        return None, input_dict, exclusions
+
+    database = RecipeDatabase(output_db)
+    if not input_dict:
+        input_dict = database.load_site(stripped_url)
+        if input_dict:
+            print(
+                f"INFO: Using pages stored for {stripped_url} in {output_db} as input"
+            )
+            exclusions = {**database.load_exclusions(stripped_url), **exclusions}
+    return database, input_dict, exclusions
+
+
+def _sitemap_cache(sitemap_cache: SitemapCache | str | None) -> SitemapCache | None:
+    """Accept either a SitemapCache or the directory of a SitemapCache with default settings"""
+    if isinstance(sitemap_cache, str):
+        return SitemapCache(sitemap_cache)
+    return sitemap_cache
+
+
+def _check_politeness_settings(
+    requests_per_second: float | None,
+    burst: int | None,
+    max_connections_per_host: int | None,
+):
+    """Check that the per host politeness overrides are positive numbers"""
+    for name, value in [
+        ("Requests per second", requests_per_second),
+        ("Burst", burst),
+        ("Max connections per host", max_connections_per_host),
+    ]:
+        if value is not None and value <= 0:
+            raise ValueError(f"{name} must be a positive number.")
+
+
+def _load_url_classifier(
+    url_classifier: UrlClassifierStore | str | None,
+    stripped_url: str,
+    input_dict: dict | None,
+    exclusions: dict,
+) -> tuple[UrlClassifierStore | None, UrlClassifier | None]:
+    """Accept either a UrlClassifierStore or the directory of a UrlClassifierStore with default settings, and load the classifier of the site"""
+    if url_classifier is None:
+        return None, None
+    if isinstance(url_classifier, str):
+        url_classifier = UrlClassifierStore(url_classifier)
+    return url_classifier, url_classifier.load(
+        stripped_url, input_dict=input_dict, exclusions=exclusions
+    )
 
-    recipes_json = RecipeScraper(stripped_url, user_agent).scrape_to_json(
+
+def _html_cache(html_cache: HTMLCache | str | None) -> HTMLCache | None:
+    """Accept either a HTMLCache or the directory of a HTMLCache with default settings"""
+    if isinstance(html_cache, str):
+        return HTMLCache(html_cache)
+    return html_cache
+
+
+def scrape_site(
+    url: str,
+    user_agent: str,
+    *,
+    input_dict: list | None = None,
+    input_file: str | None = None,
+    output_file: str | None = None,
+    batch_size: int | None = None,
+    max_workers: int | None = None,
+    requests_per_second: float | None = None,
+    burst: int | None = None,
+    max_connections_per_host: int | None = None,
+    retry_budget: int | None = None,
+    html_cache: HTMLCache | str | None = None,
+    sitemap_cache: SitemapCache | str | None = None,
+    output_db: str | None = None,
+    stream_sitemaps: bool = False,
+    plan: CrawlPlan | None = None,
+    scheduler: PolitenessScheduler | None = None,
+    parse_processes: int | None = None,
+    prefilter: bool = True,
+    max_body_size: int | None = DEFAULT_MAX_BODY_SIZE,
+    stop_after_recipe: bool = False,
+    tracking_params: list | None = None,
+    include_urls: list | None = None,
+    exclude_urls: list | None = None,
+    url_classifier: UrlClassifierStore | str | None = None,
+) -> RecipeScraper:
+
+    stripped_url, input_dict, exclusions = _prepare_site_input(
+        url,
         input_dict=input_dict,
-        exclusions_list=exclusions_list,
+        input_file=input_file,
         output_file=output_file,
         batch_size=batch_size,
+        output_db=output_db,
     )
 
-    if output_file:
-        exclusion_list = recipes_json.pop("Pages without Recipe", [])
-        FileHandler(output_file).write_json_file(recipes_json)
-        if exclusion_list:
-            exclusion_dict = {stripped_url: exclusion_list}
-            FileHandler(output_file).write_exclusion_json_file(exclusion_dict)
-    else:
+    if plan is not None and plan.site_url != stripped_url:
+        raise InputException(
+            f"Crawl plan is made for {plan.site_url}, not for {stripped_url}"
+        )
+
+    if max_workers is not None and max_workers <= 0:
+        raise ValueError("Max workers must be a positive integer.")
+
+    if parse_processes is not None and parse_processes <= 0:
+        raise ValueError("Parse processes must be a positive integer.")
+
+    if max_body_size is not None and max_body_size <= 0:
+        raise ValueError("Max body size must be a positive integer.")
+
+    _check_politeness_settings(requests_per_second, burst, max_connections_per_host)
+
+    if retry_budget is not None and retry_budget < 0:
+        raise ValueError("Retry budget must be zero or a positive integer.")
+
+    # Keep a pooled connection available for every worker
+    pool_size = max(DEFAULT_POOL_SIZE, max_workers or 0)
+    database, input_dict, exclusions = _open_output_db(
+        output_db, stripped_url, input_dict, exclusions
+    )
+    try:
+        classifier_store, classifier = _load_url_classifier(
+            url_classifier, stripped_url, input_dict, exclusions
+        )
+        recipe_scraper = RecipeScraper(
+            stripped_url,
+            user_agent,
+            pool_size=pool_size,
+            requests_per_second=requests_per_second,
+            burst=burst,
+            max_connections_per_host=max_connections_per_host,
+            retry_budget=retry_budget,
+            html_cache=_html_cache(html_cache),
+            sitemap_cache=_sitemap_cache(sitemap_cache),
+            scheduler=scheduler,
+            prefilter=prefilter,
+            max_body_size=max_body_size,
+            stop_after_recipe=stop_after_recipe,
+            tracking_params=tracking_params,
+            include_urls=include_urls,
+            exclude_urls=exclude_urls,
+            url_classifier=classifier,
+        )
+        recipes_json = recipe_scraper.scrape_to_json(
+            input_dict=input_dict,
+            exclusions_list=exclusions,
+            output_file=output_file,
+            batch_size=batch_size,
+            max_workers=max_workers,
+            output_db=database,
+            stream_sitemaps=stream_sitemaps,
+            plan=plan,
+            parse_processes=parse_processes,
+        )
+        if classifier_store is not None:
+            classifier_store.save(stripped_url, classifier)
+    finally:
+        if database is not None:
+            database.close()
+
+    if not (output_file or output_db):
+        return recipes_json
+
+
+async def ascrape_site(
+    url: str,
+    user_agent: str,
+    *,
+    input_dict: list | None = None,
+    input_file: str | None = None,
+    output_file: str | None = None,
+    batch_size: int | None = None,
+    concurrency: int = 100,
+    requests_per_second: float | None = None,
+    burst: int | None = None,
+    max_connections_per_host: int | None = None,
+    retry_budget: int | None = None,
+    html_cache: HTMLCache | str | None = None,
+    sitemap_cache: SitemapCache | str | None = None,
+    output_db: str | None = None,
+    parse_processes: int | None = None,
+    prefilter: bool = True,
+    max_body_size: int | None = DEFAULT_MAX_BODY_SIZE,
+    stop_after_recipe: bool = False,
+    tracking_params: list | None = None,
+    include_urls: list | None = None,
+    exclude_urls: list | None = None,
+    url_classifier: UrlClassifierStore | str | None = None,
+) -> RecipeScraper:
+    """Async counterpart of scrape_site, fetching up to `concurrency` pages at the same time on the running event loop. Requires aiohttp"""
+
+    stripped_url, input_dict, exclusions = _prepare_site_input(
+        url,
+        input_dict=input_dict,
+        input_file=input_file,
+        output_file=output_file,
+        batch_size=batch_size,
+        output_db=output_db,
+    )
+
+    if concurrency <= 0:
+        raise ValueError("Concurrency must be a positive integer.")
+
+    if parse_processes is not None and parse_processes <= 0:
+        raise ValueError("Parse processes must be a positive integer.")
+
+    if max_body_size is not None and max_body_size <= 0:
+        raise ValueError("Max body size must be a positive integer.")
+
+    _check_politeness_settings(requests_per_second, burst, max_connections_per_host)
+
+    if retry_budget is not None and retry_budget < 0:
+        raise ValueError("Retry budget must be zero or a positive integer.")
+
+    database, input_dict, exclusions = _open_output_db(
+        output_db, stripped_url, input_dict, exclusions
+    )
+    try:
+        classifier_store, classifier = _load_url_classifier(
+            url_classifier, stripped_url, input_dict, exclusions
+        )
+        # RecipeScraper fetches robots.txt on init, keep that off the event loop
+        recipe_scraper = await asyncio.to_thread(
+            RecipeScraper,
+            stripped_url,
+            user_agent,
+            requests_per_second=requests_per_second,
+            burst=burst,
+            max_connections_per_host=max_connections_per_host,
+            retry_budget=retry_budget,
+            html_cache=_html_cache(html_cache),
+            sitemap_cache=_sitemap_cache(sitemap_cache),
+            prefilter=prefilter,
+            max_body_size=max_body_size,
+            stop_after_recipe=stop_after_recipe,
+            tracking_params=tracking_params,
+            include_urls=include_urls,
+            exclude_urls=exclude_urls,
+            url_classifier=classifier,
+        )
+        recipes_json = await recipe_scraper.ascrape_to_json(
+            input_dict=input_dict,
+            exclusions_list=exclusions,
+            output_file=output_file,
+            batch_size=batch_size,
+            concurrency=concurrency,
+            output_db=database,
+            parse_processes=parse_processes,
+        )
+        if classifier_store is not None:
+            classifier_store.save(stripped_url, classifier)
+    finally:
+        if database is not None:
+            database.close()
+
+    if not (output_file or output_db):
         return recipes_json
 
 
+SITE_SETTINGS = set(inspect.signature(scrape_site).parameters) - {
+    "url",
+    "user_agent",
+    "scheduler",
+}
+"""scrape_site keyword arguments that can be set per site in a scrape_sites manifest"""
+
+
+def _site_settings(site: dict, output_dir: str | None) -> tuple[str, dict]:
+    """Return the url & scrape_site keyword arguments of a manifest entry.
+    With output_dir, sites without output are written to their own <host>.json file, which is also used as input when it exists
+    """
+    site = dict(site)
+    url = site.pop("url", None)
+    if not url:
+        raise InputException(f"Manifest entry without url: {site}")
+
+    unknown_settings = set(site) - SITE_SETTINGS
+    if unknown_settings:
+        raise InputException(
+            f"Unknown settings for {url} in manifest: {', '.join(sorted(unknown_settings))}"
+        )
+
+    if output_dir and not (site.get("output_file") or site.get("output_db")):
+        host = url_host(strip_url(url)).replace(":", "_")
+        site["output_file"] = os.path.join(output_dir, f"{host}.json")
+        if os.path.isfile(site["output_file"]) and not site.get("input_dict"):
+            site.setdefault("input_file", site["output_file"])
+
+    return url, site
+
+
+def scrape_sites(
+    manifest: list,
+    user_agent: str,
+    *,
+    max_sites: int = 4,
+    max_connections: int | None = None,
+    max_bytes_per_second: float | None = None,
+    output_dir: str | None = None,
+) -> dict:
+    """
+    Scrape several sites at the same time, sharing one politeness scheduler.
+
+    :param manifest: List of sites, e.g. [{"url": "https://example.com/", "max_workers": 4, "requests_per_second": 2}]. Every key besides url is passed to scrape_site
+    :param max_sites: Number of sites that are scraped at the same time
+    :param max_connections: Cap on the concurrent requests over all sites
+    :param max_bytes_per_second: Cap on the downloaded bytes per second over all sites
+    :param output_dir: Directory to write sites without output_file or output_db to, as <host>.json with their own exclusions shard
+    :return: Dict of site url: scrape_site result, or the exception of a site that failed
+    """
+    if max_sites <= 0:
+        raise ValueError("Max sites must be a positive integer.")
+    for name, value in [
+        ("Max connections", max_connections),
+        ("Max bytes per second", max_bytes_per_second),
+    ]:
+        if value is not None and value <= 0:
+            raise ValueError(f"{name} must be a positive number.")
+
+    sites = [_site_settings(site, output_dir) for site in manifest]
+    hosts = [url_host(strip_url(url)) for url, _ in sites]
+    duplicate_hosts = {host for host in hosts if hosts.count(host) > 1}
+    if duplicate_hosts:
+        raise InputException(
+            f"Found sites with the same host in manifest: {', '.join(sorted(duplicate_hosts))}"
+        )
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    scheduler = PolitenessScheduler(
+        user_agent,
+        max_connections=max_connections,
+        max_bytes_per_second=max_bytes_per_second,
+    )
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_sites) as executor:
+        futures = {
+            executor.submit(
+                scrape_site, url, user_agent, scheduler=scheduler, **settings
+            ): url
+            for url, settings in sites
+        }
+        for future in as_completed(futures):
+            url = futures[future]
+            try:
+                results[url] = future.result()
+            except Exception as ex:
+                # One failing site should not stop the others
+                print(f"ERROR: Scraping {url} failed: {type(ex).__name__}: {ex}")
+                results[url] = ex
+
+    print(
+        f"Scraped {str(len(sites))} sites, of which {str(sum(isinstance(result, Exception) for result in results.values()))} failed"
+    )
+    # Same order as the manifest
+    return {url: results[url] for url, _ in sites}
+
+
+def plan_site(
+    url: str,
+    user_agent: str,
+    *,
+    input_dict: list | None = None,
+    input_file: str | None = None,
+    sitemap_cache: SitemapCache | str | None = None,
+    output_db: str | None = None,
+    tracking_params: list | None = None,
+    include_urls: list | None = None,
+    exclude_urls: list | None = None,
+) -> CrawlPlan:
+    """
+    Scrape the sitemap of a site & compare it with the input, without fetching any recipe page.
+
+    :return: CrawlPlan with the new, changed, unchanged, excluded, filtered & removed pages. Pass it to scrape_site as plan to scrape only the new & changed pages
+    """
+    stripped_url, input_dict, exclusions = _prepare_site_input(
+        url,
+        input_dict=input_dict,
+        input_file=input_file,
+        output_file=None,
+        batch_size=None,
+        output_db=output_db,
+    )
+
+    database, input_dict, exclusions = _open_output_db(
+        output_db, stripped_url, input_dict, exclusions
+    )
+    if database is not None:
+        database.close()
+
+    recipe_scraper = RecipeScraper(
+        stripped_url,
+        user_agent,
+        sitemap_cache=_sitemap_cache(sitemap_cache),
+        tracking_params=tracking_params,
+        include_urls=include_urls,
+        exclude_urls=exclude_urls,
+    )
+    crawl_plan = recipe_scraper.plan(input_dict=input_dict, exclusions_list=exclusions)
+    print(str(crawl_plan))
+    return crawl_plan
+
+
 def extract_domain(url: str) -> str:
     """
     Extract the domain name from a url
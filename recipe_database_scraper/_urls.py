@@ -0,0 +1,158 @@
+import functools
+import re
+from urllib.parse import urlparse, urlsplit, urlunsplit
+
+from ._exceptions import InvalidURLException
+
+URL_CACHE_SIZE = 2**16
+"""Number of urls of which the validation & canonical url are cached"""
+
+TRACKING_QUERY_PARAMS = frozenset(
+    {
+        "utm_source",
+        "utm_medium",
+        "utm_campaign",
+        "utm_term",
+        "utm_content",
+        "utm_id",
+        "gclid",
+        "dclid",
+        "fbclid",
+        "msclkid",
+        "yclid",
+        "igshid",
+        "mc_cid",
+        "mc_eid",
+        "_ga",
+        "_gl",
+    }
+)
+"""Query parameters that only track where a visitor came from, which are dropped from canonical urls"""
+
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+IPV4_OCTET = r"(25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)"
+"""Number between 0 & 255, without leading zeros"""
+
+RE_URL = re.compile(
+    r"^(https?):\/\/"  # http, https protocols
+    r"((\w+(\-\w+)*\.)+[a-z]{2,}"  # domain name (example.com, etc.)
+    r"|localhost|"
+    + IPV4_OCTET
+    + r"(\."
+    + IPV4_OCTET
+    + r"){3})"  # or a local host (localhost, 127.0.0.1)
+    r"(:[0-9]{1,5})?"  # optional port (e.g., :8080)
+    r"(\/[\w\-]*)*"  # optional path (e.g. /something)
+    r"(\.[a-zA-Z0-9]{1,5})?"  # optional file extension like .html, .jpg, etc.
+    r"(\?\S*)?"  # optional query parameters
+    r"(#\S*)?$",  # optional fragment
+    re.IGNORECASE,
+)
+
+
+@functools.lru_cache(maxsize=URL_CACHE_SIZE)
+def _url_error(url: str) -> str | None:
+    """Return why url is not valid, or None for a valid url"""
+    try:
+        parsed_url = urlparse(url)
+    except Exception as ex:
+        return f"Unable to parse URL {url}: {ex}"
+
+    if not parsed_url.scheme:
+        return "Scheme must be set. Please prefix http:// or https://"
+
+    if parsed_url.scheme.lower() not in ["http", "https"]:
+        return "Scheme must be http:// or https://"
+
+    if not parsed_url.netloc:
+        return f"Cannot determine domain name from {url}"
+
+    if not RE_URL.match(url):
+        return f"Invalid URL: {url}"
+    return None
+
+
+def is_valid_url(url: str) -> bool:
+    """
+    Check whether input string is a valid URL
+
+    :param url: string to check for URL, e.g. "http://www.example.com/page.html".
+    """
+    if not url:
+        raise InvalidURLException("URL is empty.")
+
+    error = _url_error(url)
+    if error:
+        raise InvalidURLException(error)
+    return True
+
+
+def _split_port(host_port: str) -> tuple[str, str]:
+    host, separator, port = host_port.rpartition(":")
+    if not separator or "]" in port or (port and not port.isdigit()):
+        # No port, or the colons of an IPv6 address
+        return host_port, ""
+    return host, port
+
+
+@functools.lru_cache(maxsize=URL_CACHE_SIZE)
+def _canonicalize_url(url: str, tracking_params: frozenset) -> str:
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url
+    if not parts.netloc:
+        return url
+
+    scheme = parts.scheme.lower()
+    user_info, at_sign, host_port = parts.netloc.rpartition("@")
+    host, port = _split_port(host_port)
+    if port == DEFAULT_PORTS.get(scheme):
+        port = ""
+    netloc = f"{user_info}{at_sign}{host.lower()}{':' + port if port else ''}"
+
+    path = parts.path.rstrip("/") or "/"
+    query = "&".join(
+        param
+        for param in parts.query.split("&")
+        if param and param.split("=", 1)[0].lower() not in tracking_params
+    )
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def canonicalize_url(
+    url: str, tracking_params: frozenset = TRACKING_QUERY_PARAMS
+) -> str:
+    """
+    Return the canonical url of a page, the key on which pages are deduplicated & matched with input & exclusions.
+    The scheme & host are lowercased, default ports, trailing slashes, the fragment & tracking query parameters are dropped
+
+    :param url: URL to canonicalize, e.g. "HTTPS://www.Example.com:443/recipe/?utm_source=feed#top".
+    :param tracking_params: lowercase names of the query parameters to drop.
+    :return: Canonical URL, e.g. "https://www.example.com/recipe"
+    """
+    if not isinstance(tracking_params, frozenset):
+        tracking_params = frozenset(param.lower() for param in tracking_params)
+    return _canonicalize_url(url, tracking_params)
+
+
+def url_host(url: str) -> str:
+    """Return the lowercased host of a url, without default port"""
+    return urlsplit(canonicalize_url(url)).netloc
+
+
+class UrlIndex:
+    """Look up the stored spelling of a url by its canonical url"""
+
+    def __init__(self, urls=(), *, tracking_params: frozenset = TRACKING_QUERY_PARAMS):
+        self.tracking_params = tracking_params
+        self.urls = {}
+        for url in urls:
+            self.add(url)
+
+    def add(self, url: str):
+        self.urls[canonicalize_url(url, self.tracking_params)] = url
+
+    def get(self, url: str) -> str | None:
+        return self.urls.get(canonicalize_url(url, self.tracking_params))
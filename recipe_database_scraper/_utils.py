@@ -3,51 +3,12 @@ import os
 from publicsuffix2 import get_sld, get_tld
 from urllib.parse import urlparse, urlunparse
 import robots
+from robots.parser import TokenType
 import json
+import tempfile
 
-from ._exceptions import InvalidURLException, RobotParserException
-
-
-def is_valid_url(url: str) -> bool:
-    """
-    Check whether input string is a valid URL
-
-    :param url: string to check for URL, e.g. "http://www.example.com/page.html".
-    """
-    if not url:
-        raise InvalidURLException("URL is empty.")
-
-    try:
-        parsed_url = urlparse(url)
-    except Exception as ex:
-        raise InvalidURLException(f"Unable to parse URL {url}: {ex}")
-
-    if not parsed_url.scheme:
-        raise InvalidURLException(
-            "Scheme must be set. Please prefix http:// or https://"
-        )
-
-    if parsed_url.scheme.lower() not in ["http", "https"]:
-        raise InvalidURLException("Scheme must be http:// or https://")
-
-    if not parsed_url.netloc:
-        raise InvalidURLException(f"Cannot determine domain name from {url}")
-
-    regex_url = re.compile(
-        r"^(https?):\/\/"  # http, https protocols
-        r"(\w+(\-\w+)*\.)+[a-z]{2,}"  # domain name (example.com, etc.)
-        r"(:[0-9]{1,5})?"  # optional port (e.g., :8080)
-        r"(\/[\w\-]*)*"  # optional path (e.g. /something)
-        r"(\.[a-zA-Z0-9]{1,5})?"  # optional file extension like .html, .jpg, etc.
-        r"(\?\S*)?"  # optional query parameters
-        r"(#\S*)?$",  # optional fragment
-        re.IGNORECASE,
-    )
-
-    if re.match(regex_url, url):
-        return True
-    else:
-        raise InvalidURLException(f"Invalid URL: {url}")
+from ._exceptions import RobotParserException
+from ._urls import is_valid_url  # noqa: F401
 
 
 def domain_extractor(url: str) -> str:
@@ -90,6 +51,75 @@ def strip_url_to_homepage(url: str) -> str:
     return url
 
 
+class RobotsParser(robots.RobotsParser):
+    """robots.RobotsParser that also keeps the Crawl-delay & Request-rate directives per user agent, which robotspy ignores"""
+
+    RE_CRAWL_DELAY = re.compile(r"^crawl-delay\s*:\s*([0-9.]+)", re.IGNORECASE)
+    RE_REQUEST_RATE = re.compile(
+        r"^request-rate\s*:\s*([0-9]+)\s*/\s*([0-9.]+)\s*([smh]?)", re.IGNORECASE
+    )
+    TIME_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600}
+    # Like the User-agent lines in robotspy, a product token stops at the first character that is not a letter, '_' or '-'
+    RE_PRODUCT_TOKEN = re.compile(r"\*|[a-zA-Z_-]+")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.crawl_delays = {}
+        self.request_rates = {}
+        self.group_agents = set()
+
+    def parse_tokens(self, tokens):
+        super().parse_tokens(self._capture_rate_directives(tokens))
+
+    def _capture_rate_directives(self, tokens):
+        """Pass all tokens on to the robotspy parser, while storing rate directives for the user agents of the current group"""
+        current_agents = []
+        group_has_directives = False
+        for token in tokens:
+            if token.type == TokenType.AGENT:
+                if group_has_directives:
+                    current_agents = []
+                    group_has_directives = False
+                current_agents.append(token.value.lower())
+                self.group_agents.add(token.value.lower())
+            elif token.type == TokenType.UNEXPECTED:
+                if m := self.RE_CRAWL_DELAY.match(token.value):
+                    group_has_directives = True
+                    for agent in current_agents:
+                        self.crawl_delays[agent] = float(m.group(1))
+                elif m := self.RE_REQUEST_RATE.match(token.value):
+                    group_has_directives = True
+                    seconds = float(m.group(2)) * self.TIME_UNITS[m.group(3).lower()]
+                    for agent in current_agents:
+                        self.request_rates[agent] = (int(m.group(1)), seconds)
+            elif token.type in (TokenType.ALLOW, TokenType.DISALLOW):
+                group_has_directives = True
+            yield token
+
+    @classmethod
+    def product_token(cls, useragent: str) -> str:
+        """Return the lowercased product token of a user agent, e.g. "mybot" for "MyBot/1.0 (+https://example.com/bot)" """
+        m = cls.RE_PRODUCT_TOKEN.match(useragent.strip())
+        return m.group(0).lower() if m else useragent.lower()
+
+    def find_rules(self, agent: str):
+        """Find the allow/disallow rules on the product token of the user agent, the same way the rate directives are found"""
+        return super().find_rules(self.product_token(agent))
+
+    def _agent_value(self, values: dict, useragent: str):
+        """Like the allow/disallow rules, a group for the specific user agent takes precedence over the wild card group"""
+        agent = self.product_token(useragent)
+        return values.get(agent if agent in self.group_agents else "*")
+
+    def crawl_delay(self, useragent: str) -> float | None:
+        """Return the Crawl-delay in seconds for the user agent, or None if not specified"""
+        return self._agent_value(self.crawl_delays, useragent)
+
+    def request_rate(self, useragent: str) -> tuple[int, float] | None:
+        """Return the Request-rate for the user agent as (requests, seconds), or None if not specified"""
+        return self._agent_value(self.request_rates, useragent)
+
+
 def robots_parser(url: str) -> object:
     """
     Check robots.txt file for allowed/disallowed pages to crawl & crawl conditions
@@ -101,7 +131,7 @@ def robots_parser(url: str) -> object:
     stripped_domain_url = strip_url_to_homepage(url)
     robots_file = stripped_domain_url + "robots.txt"
     try:
-        parser = robots.RobotsParser.from_uri(robots_file)
+        parser = RobotsParser.from_uri(robots_file)
     except Exception as ex:
         raise RobotParserException(
             f"Cannot find robots.txt file for {url}\nPlease check if {robots_file} exists.\nError: {ex}"
@@ -110,59 +140,57 @@ def robots_parser(url: str) -> object:
     return parser
 
 
-class FileHandler:
-    """
-    Handle opening & writing of files
-    """
+REMOVED_PAGE = object()
+"""Record value of a page that is removed from the sitemap & should be pruned from the output"""
 
-    def __init__(self, filename):
-        self.filename = filename
 
-    def load_exclusion_json_file(self):
-        """Look for _recipe_scraper_exclusions.json file in same directory is as the input file and load its content"""
-        input_dir = (
-            os.path.dirname(self.filename)
-            if os.path.dirname(self.filename)
-            else os.getcwd()
-        )
+class PageWithoutRecipe:
+    """Record value of a page without recipe, with the sitemap last modified date it was checked for, so it is re-checked once that date changes"""
+
+    __slots__ = ("last_modified",)
 
-        exclusion_file = os.path.join(input_dir, "_recipe_scraper_exclusions.json")
-
-        if os.path.isfile(exclusion_file):
-            print(f"INFO: Found exclusion file: {exclusion_file}")
-            exclusion_file_content = self.load_json_file(filename=exclusion_file)
-            return exclusion_file_content
-        else:
-            print(
-                "WARNING: No file found with the name '_recipe_scraper_exclusions.json' in the input directory."
-            )
-
-    def write_exclusion_json_file(self, data: dict):
-        """Write or append to the recipe scraper exclusion list file. If it does not exist, create it"""
-        output_dir = (
-            os.path.dirname(self.filename)
-            if os.path.dirname(self.filename)
-            else os.getcwd()
+    def __init__(self, last_modified: str | None = None):
+        self.last_modified = last_modified
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, PageWithoutRecipe)
+            and self.last_modified == other.last_modified
         )
 
-        exclusion_file = os.path.join(output_dir, "_recipe_scraper_exclusions.json")
+    def __repr__(self):
+        return f"PageWithoutRecipe({self.last_modified!r})"
+
 
-        # Extract the single key-value pair from the provided data dict
-        if len(data) != 1:
-            raise ValueError(
-                "Provided data dictionary must contain exactly one key-value pair."
-            )
+def is_page_without_recipe(recipe_dict) -> bool:
+    """Check whether a record value marks a page without recipe. A bare None is a page without recipe with unknown last modified date"""
+    return recipe_dict is None or isinstance(recipe_dict, PageWithoutRecipe)
 
-        key, value = next(iter(data.items()))
 
-        if os.path.isfile(exclusion_file):
-            exclusion_file_content = self.load_json_file(filename=exclusion_file)
-        else:
-            exclusion_file_content = {}
+def _jsonl_record(page_url: str, recipe_dict) -> dict:
+    if recipe_dict is REMOVED_PAGE:
+        return {"url": page_url, "removed": True}
+    if is_page_without_recipe(recipe_dict):
+        return {
+            "url": page_url,
+            "recipe": None,
+            "last_modified": getattr(recipe_dict, "last_modified", None),
+        }
+    return {"url": page_url, "recipe": recipe_dict}
 
-        exclusion_file_content[key] = value
 
-        self.write_json_file(exclusion_file_content, filename=exclusion_file)
+def is_jsonl_file(filename: str | None) -> bool:
+    """Check whether a filename refers to a JSON Lines file"""
+    return bool(filename) and filename.endswith(".jsonl")
+
+
+class FileHandler:
+    """
+    Handle opening & writing of files
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
 
     def load_json_file(self, *, filename: str | None = None):
         """Return the content of the given json file. Unless specified otherwise, this method uses the class's input filename"""
@@ -177,4 +205,99 @@ class FileHandler:
         """Return the content of the given json file. Unless specified otherwise, this method uses the class's input filename"""
         json_file = filename if filename else self.filename
         with open(json_file, "w") as my_file:
-            json.dump(data, my_file)
+            if isinstance(data, dict):
+                json.dump(data, my_file)
+                return
+            # Other mappings, e.g. spooled recipes, are written one item at a time with the same separators as json.dump
+            my_file.write("{")
+            for item_number, (key, value) in enumerate(data.items()):
+                my_file.write(
+                    f"{', ' if item_number else ''}{json.dumps(key)}: {json.dumps(value)}"
+                )
+            my_file.write("}")
+
+    def append_jsonl_file(self, records: list, *, filename: str | None = None):
+        """Append (page_url, recipe_dict) records as JSON Lines. Pages without recipe are written with a null recipe & their last modified date, pages removed from the sitemap as a removed record"""
+        jsonl_file = filename if filename else self.filename
+        lines = [
+            json.dumps(_jsonl_record(page_url, recipe_dict)) + "\n"
+            for page_url, recipe_dict in records
+        ]
+        with open(jsonl_file, "a") as my_file:
+            my_file.writelines(lines)
+            my_file.flush()
+            os.fsync(my_file.fileno())
+
+    def iter_jsonl_file(self, *, filename: str | None = None):
+        """Yield the (page_url, recipe_dict) records of a JSON Lines file, with REMOVED_PAGE as recipe_dict of removed records & a PageWithoutRecipe of pages without recipe.
+        A truncated last line, e.g. after an interrupted run, is skipped
+        """
+        jsonl_file = filename if filename else self.filename
+        with open(jsonl_file) as my_file:
+            for line_number, line in enumerate(my_file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(
+                        f"WARNING: Skipping unreadable line {line_number} in {jsonl_file}"
+                    )
+                    continue
+                if record.get("removed"):
+                    yield record["url"], REMOVED_PAGE
+                elif record["recipe"] is None:
+                    yield record["url"], PageWithoutRecipe(record.get("last_modified"))
+                else:
+                    yield record["url"], record["recipe"]
+
+    def _latest_jsonl_records(self, *, filename: str | None = None) -> dict:
+        """Return the last record of every page that is not removed, ordered by the position of that last record"""
+        latest_records = {}
+        for page_url, recipe_dict in self.iter_jsonl_file(filename=filename):
+            latest_records.pop(page_url, None)
+            if recipe_dict is not REMOVED_PAGE:
+                latest_records[page_url] = recipe_dict
+        return latest_records
+
+    def load_jsonl_file(self, *, filename: str | None = None) -> dict:
+        """Return the content of a JSON Lines file in the same format as the json output.
+        The last record of a page wins & pages without recipe are listed under 'Pages without Recipe'
+        """
+        return self.load_jsonl_site(filename=filename)[0]
+
+    def load_jsonl_site(self, *, filename: str | None = None) -> tuple[dict, dict]:
+        """Return the content of a JSON Lines file like def load_jsonl_file, together with its pages without recipe as dict of url: last modified date"""
+        latest_records = self._latest_jsonl_records(filename=filename)
+
+        content = {
+            page_url: recipe_dict
+            for page_url, recipe_dict in latest_records.items()
+            if not is_page_without_recipe(recipe_dict)
+        }
+        exclusions = {
+            page_url: recipe_dict.last_modified
+            for page_url, recipe_dict in latest_records.items()
+            if is_page_without_recipe(recipe_dict)
+        }
+        if exclusions:
+            content["Pages without Recipe"] = list(exclusions)
+        return content, exclusions
+
+    def compact_jsonl_file(self, *, filename: str | None = None):
+        """Rewrite a JSON Lines file with only the last record of every page. The file is replaced atomically"""
+        jsonl_file = filename if filename else self.filename
+        latest_records = self._latest_jsonl_records(filename=jsonl_file)
+
+        output_dir = os.path.dirname(jsonl_file) or os.getcwd()
+        file_descriptor, temp_file = tempfile.mkstemp(dir=output_dir, suffix=".jsonl")
+        try:
+            with os.fdopen(file_descriptor, "w") as my_file:
+                for page_url, recipe_dict in latest_records.items():
+                    my_file.write(
+                        json.dumps(_jsonl_record(page_url, recipe_dict)) + "\n"
+                    )
+            os.replace(temp_file, jsonl_file)
+        except BaseException:
+            os.remove(temp_file)
+            raise
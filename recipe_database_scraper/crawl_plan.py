@@ -0,0 +1,53 @@
+from .sitemap_scraper import Pages
+
+
+class CrawlPlan:
+    """Sitemap pages of a site, split by the work a scrape needs for them. Built without fetching any recipe page:
+    - new: pages that are not in the input
+    - changed: pages whose input data or exclusion is outdated according to the sitemap lastmod
+    - unchanged: pages whose input data is up-to-date and is reused without a request
+    - excluded: pages without recipe that stay excluded, as a dict of url: last modified date
+    - filtered: pages that should not contain recipes according to the url filters
+    - removed: pages in the input or exclusions that are no longer in the sitemap, which are pruned from the output
+    - missing: pages in the input or exclusions that are missing from a partial sitemap, which are kept in the output as they are
+    """
+
+    def __init__(self, site_url: str, input_dict: dict | None = None):
+        self.site_url = site_url
+        self.input_dict = input_dict
+        # New, changed & unchanged pages, in sitemap order
+        self.pages = Pages()
+        self.new = []
+        self.changed = []
+        self.unchanged = []
+        self.excluded = {}
+        self.filtered = []
+        self.removed = []
+        # Input urls & exclusions, as a dict of url: last modified date, missing from a partial sitemap
+        self.missing_input = []
+        self.missing_excluded = {}
+
+    @property
+    def len_pages_to_fetch(self) -> int:
+        return len(self.new) + len(self.changed)
+
+    def to_json(self) -> dict:
+        """Return the urls of the plan per category"""
+        return {
+            "new": self.new,
+            "changed": self.changed,
+            "unchanged": self.unchanged,
+            "excluded": list(self.excluded),
+            "filtered": self.filtered,
+            "removed": self.removed,
+            "missing": [*self.missing_input, *self.missing_excluded],
+        }
+
+    def __str__(self):
+        return (
+            f"Crawl plan for {self.site_url}: {str(len(self.new))} new, {str(len(self.changed))} changed, "
+            f"{str(len(self.unchanged))} unchanged, {str(len(self.excluded))} excluded, "
+            f"{str(len(self.filtered))} filtered, {str(len(self.removed))} removed & "
+            f"{str(len(self.missing_input) + len(self.missing_excluded))} missing pages. "
+            f"{str(self.len_pages_to_fetch)} pages to fetch"
+        )
@@ -0,0 +1,67 @@
+import json
+import os
+import tempfile
+
+from ._urls import url_host
+
+LEGACY_EXCLUSION_FILE = "_recipe_scraper_exclusions.json"
+EXCLUSION_DIR = "_recipe_scraper_exclusions"
+
+
+class ExclusionStore:
+    """Pages without recipe per site, stored as {url: last_modified} in one shard file per site.
+    Shards are replaced atomically, so concurrent runs for different sites in the same folder do not overwrite each other
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    @classmethod
+    def for_file(cls, filename: str) -> "ExclusionStore":
+        """Return the exclusion store in the same directory as filename"""
+        return cls(os.path.dirname(filename) or os.getcwd())
+
+    def _shard_path(self, site_url: str) -> str:
+        host = url_host(site_url).replace(":", "_")
+        return os.path.join(self.directory, EXCLUSION_DIR, f"{host}.json")
+
+    def load(self, site_url: str) -> dict:
+        """Return the excluded pages of a site as {url: last_modified}.
+        Falls back to the single _recipe_scraper_exclusions.json file of earlier versions, whose pages have no known last_modified
+        """
+        shard_path = self._shard_path(site_url)
+        if os.path.isfile(shard_path):
+            print(f"INFO: Found exclusion file: {shard_path}")
+            with open(shard_path) as shard_file:
+                return json.load(shard_file)
+
+        legacy_path = os.path.join(self.directory, LEGACY_EXCLUSION_FILE)
+        if os.path.isfile(legacy_path):
+            print(f"INFO: Found exclusion file: {legacy_path}")
+            with open(legacy_path) as legacy_file:
+                legacy_exclusions = json.load(legacy_file)
+            if site_url not in legacy_exclusions:
+                print(
+                    f"WARNING: URL not found in {LEGACY_EXCLUSION_FILE} file. Please ignore this warning if this is the first time scraping the URL"
+                )
+            return dict.fromkeys(legacy_exclusions.get(site_url, []))
+
+        print(
+            f"WARNING: No exclusion file found for {site_url} in the input directory."
+        )
+        return {}
+
+    def write(self, site_url: str, exclusions: dict):
+        """Replace the excluded pages of a site with {url: last_modified}"""
+        shard_path = self._shard_path(site_url)
+        os.makedirs(os.path.dirname(shard_path), exist_ok=True)
+        file_descriptor, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(shard_path), suffix=".json"
+        )
+        try:
+            with os.fdopen(file_descriptor, "w") as temp_file:
+                json.dump(exclusions, temp_file)
+            os.replace(temp_path, shard_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
@@ -1,8 +1,25 @@
+import asyncio
+import datetime
+import heapq
+import itertools
+import random
 import requests
+import threading
 import time
+from contextlib import nullcontext
+from email.utils import parsedate_to_datetime
 from http import HTTPStatus
+from requests.adapters import HTTPAdapter
 from requests.exceptions import RequestException
 
+from .prefilter import RE_JSON_LD_RECIPE
+from .transfer_stats import ACCEPT_ENCODING
+
+try:
+    import aiohttp
+except ImportError:  # Optional dependency, only required for AsyncHTMLScraper
+    aiohttp = None
+
 RETRYABLE_HTTP_STATUS_CODES = {
     # Some servers return "400 Bad Request" initially but upon retry start working again, no idea why
     int(HTTPStatus.BAD_REQUEST),
@@ -46,52 +63,601 @@ RETRYABLE_HTTP_STATUS_CODES = {
 """HTTP status codes on which a request should be retried."""
 
 
-class HTMLScraper:
-    def __init__(self, max_retries=3, backoff_factor=1):
+DEFAULT_POOL_SIZE = 10
+"""Number of connections per host that HTMLScraper keeps alive for reuse."""
+
+DNS_CACHE_TTL = 300
+"""Seconds that AsyncHTMLScraper caches resolved host names."""
+
+DEFAULT_MAX_BODY_SIZE = 10 * 1024**2
+"""Bytes after which a page download is aborted."""
+
+READ_CHUNK_SIZE = 64 * 1024
+"""Bytes read at a time from a streamed response body."""
+
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml", "application/octet-stream")
+"""Content types of pages that are downloaded. application/octet-stream is sent by servers that do not know the content type."""
+
+
+class ConnectionCountingAdapter(HTTPAdapter):
+    """HTTPAdapter that counts the connections it opens & the requests it sends, in order to tell opened connections from reused ones"""
+
+    def __init__(self, *args, **kwargs):
+        self.connections_opened = 0
+        self.requests_sent = 0
+        self._counter_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: self._counting_pool_class(pool_class)
+            for scheme, pool_class in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+    def _counting_pool_class(self, pool_class):
+        adapter = self
+
+        class CountingConnection(pool_class.ConnectionCls):
+            def connect(self):
+                # Pooled connections that were dropped reconnect on the same object, so count sockets rather than connection objects
+                with adapter._counter_lock:
+                    adapter.connections_opened += 1
+                return super().connect()
+
+        class CountingConnectionPool(pool_class):
+            ConnectionCls = CountingConnection
+
+        return CountingConnectionPool
+
+    def send(self, request, *args, **kwargs):
+        with self._counter_lock:
+            self.requests_sent += 1
+        return super().send(request, *args, **kwargs)
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Return the seconds to wait from a Retry-After header, which holds either a number of seconds or an HTTP date"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_date.tzinfo is None:
+        retry_date = retry_date.replace(tzinfo=datetime.timezone.utc)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return max((retry_date - now).total_seconds(), 0.0)
+
+
+class RetryBudget:
+    """Thread-safe cap on the total number of retries in a run, so a failing site cannot keep the crawl busy with retries"""
+
+    def __init__(self, max_retries: int | None = None):
+        self.max_retries = max_retries
+        self.retries_used = 0
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        """Use one retry from the budget. Return False when the budget is exhausted"""
+        with self._lock:
+            if self.max_retries is not None and self.retries_used >= self.max_retries:
+                return False
+            self.retries_used += 1
+            return True
+
+
+class RetryPolicy:
+    """Decide whether & when a failed fetch is retried: honoring Retry-After, else an exponential backoff with jitter"""
+
+    def __init__(
+        self,
+        max_retries=3,
+        backoff_factor=1,
+        *,
+        jitter=0.5,
+        retry_budget: RetryBudget | None = None,
+    ):
         self.max_retries = max_retries
         self.backoff_factor = backoff_factor
+        self.jitter = jitter
+        self.retry_budget = retry_budget or RetryBudget()
+
+    def wait_time(
+        self,
+        url: str,
+        attempt: int,
+        *,
+        status_code: int | None = None,
+        retry_after: str | None = None,
+        exception: Exception | None = None,
+    ) -> float | None:
+        """Return the seconds to wait before the next attempt for a failed fetch, or None if the fetch should not be retried
+
+        :param attempt: number of the failed attempt, starting at 1
+        """
+        if exception is not None:
+            reason = f"URL '{url}' encountered exception: {exception}."
+        elif status_code in RETRYABLE_HTTP_STATUS_CODES:
+            reason = f"Status code {status_code} received for URL: '{url}'."
+        else:
+            print(f"Error: Status code {status_code} received for URL: {url}")
+            return None
+
+        if attempt >= self.max_retries:
+            print(f"Max retries exceeded for URL: {url}")
+            return None
+
+        if not self.retry_budget.take():
+            print(f"Retry budget of this run is exhausted, not retrying URL: {url}")
+            return None
+
+        wait_time = parse_retry_after(retry_after)
+        if wait_time is None:
+            wait_time = self.backoff_factor * (2**attempt)
+            wait_time *= random.uniform(1 - self.jitter, 1 + self.jitter)
+
+        print(f"{reason} Retrying in {wait_time:.1f} seconds...")
+        return wait_time
+
+
+class RetryLater:
+    """Result of a single fetch attempt that should be retried once wait_time seconds have passed"""
+
+    def __init__(self, wait_time: float):
+        self.wait_time = wait_time
+
+
+class RetryQueue:
+    """Delayed queue of items to retry, ordered by the moment their backoff expires"""
+
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, item, wait_time: float):
+        heapq.heappush(
+            self._heap, (time.monotonic() + wait_time, next(self._counter), item)
+        )
+
+    def pop_due(self) -> list:
+        """Remove & return all items whose backoff has expired"""
+        now = time.monotonic()
+        due_items = []
+        while self._heap and self._heap[0][0] <= now:
+            due_items.append(heapq.heappop(self._heap)[2])
+        return due_items
+
+    def seconds_until_due(self) -> float | None:
+        """Return the seconds until the next item is due, or None if the queue is empty"""
+        if not self._heap:
+            return None
+        return max(self._heap[0][0] - time.monotonic(), 0.0)
+
+
+NOT_MODIFIED = int(HTTPStatus.NOT_MODIFIED)
+
+
+class FetchedPage:
+    """Content & response headers of a fetched page. A page answered with 304 Not Modified to a conditional request has no content"""
+
+    def __init__(
+        self,
+        url: str,
+        content: bytes | None,
+        *,
+        status_code=200,
+        headers=None,
+        from_cache=False,
+        skipped=None,
+        truncated=False,
+    ):
+        self.url = url
+        self.content = content
+        self.status_code = status_code
+        self.headers = headers if headers is not None else {}
+        self.from_cache = from_cache
+        # Reason the body was not downloaded, e.g. a non html content type
+        self.skipped = skipped
+        # Download stopped after the Recipe JSON-LD block, the rest of the html is missing
+        self.truncated = truncated
+
+    @property
+    def not_modified(self) -> bool:
+        return self.status_code == NOT_MODIFIED
+
+    @property
+    def etag(self) -> str | None:
+        return self.headers.get("ETag")
+
+    @property
+    def last_modified(self) -> str | None:
+        return self.headers.get("Last-Modified")
+
+
+def is_html_content_type(content_type: str | None) -> bool:
+    """Return whether a Content-Type header value is html. Pages without content type are assumed to be html"""
+    if not content_type:
+        return True
+    return content_type.split(";")[0].strip().lower() in HTML_CONTENT_TYPES
+
+
+def skip_reason(headers, max_body_size: int | None) -> str | None:
+    """Return why a page should not be downloaded according to its response headers, or None"""
+    content_type = headers.get("Content-Type")
+    if not is_html_content_type(content_type):
+        return f"content type {content_type}"
+    content_length = headers.get("Content-Length")
+    if (
+        max_body_size
+        and content_length
+        and content_length.isdigit()
+        and int(content_length) > max_body_size
+    ):
+        return f"body of {content_length} bytes exceeds max body size of {str(max_body_size)} bytes"
+    return None
+
+
+class BodyReader:
+    """Collect a streamed response body. Reading stops once the body exceeds max_body_size bytes,
+    and with stop_after_recipe once the closing </script> of a Recipe JSON-LD block is read
+    """
+
+    def __init__(
+        self,
+        *,
+        max_body_size: int | None = DEFAULT_MAX_BODY_SIZE,
+        stop_after_recipe: bool = False,
+    ):
+        self.max_body_size = max_body_size
+        self.stop_after_recipe = stop_after_recipe
+        self.data = bytearray()
+        self.too_large = False
+        self.truncated = False
+        self._recipe_end = None
+
+    def feed(self, chunk: bytes) -> bool:
+        """Add a chunk of the body & return whether to continue reading"""
+        scanned = len(self.data)
+        self.data += chunk
+        if self.max_body_size and len(self.data) > self.max_body_size:
+            self.too_large = True
+            return False
+        if self.stop_after_recipe and self._recipe_read(scanned):
+            self.truncated = True
+            return False
+        return True
+
+    def _recipe_read(self, scanned: int) -> bool:
+        # Only rescan the tail of the data scanned before, in case a marker is split over chunks
+        if self._recipe_end is None:
+            match = RE_JSON_LD_RECIPE.search(self.data, max(0, scanned - 1024))
+            if match is None:
+                return False
+            self._recipe_end = match.end()
+        return self.data.find(b"</script", max(self._recipe_end, scanned - 16)) != -1
+
+    def page(self, url: str, status_code: int, headers) -> FetchedPage:
+        if self.too_large:
+            return FetchedPage(
+                url,
+                None,
+                status_code=status_code,
+                headers=headers,
+                skipped=f"body exceeds max body size of {str(self.max_body_size)} bytes",
+            )
+        return FetchedPage(
+            url,
+            bytes(self.data),
+            status_code=status_code,
+            headers=headers,
+            truncated=self.truncated,
+        )
+
+
+def conditional_headers(etag: str | None, last_modified: str | None) -> dict:
+    """Return the request headers that make a fetch conditional on the page having changed since it was stored"""
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+
+class HTMLScraper:
+    """Fetch webpages on a persistent requests session, so connections (and with them DNS lookups & TLS handshakes) are reused for subsequent requests to the same host"""
+
+    def __init__(
+        self,
+        max_retries=3,
+        backoff_factor=1,
+        *,
+        pool_size=DEFAULT_POOL_SIZE,
+        keep_alive=True,
+        scheduler=None,
+        retry_budget=None,
+        max_body_size=DEFAULT_MAX_BODY_SIZE,
+        stop_after_recipe=False,
+        transfer_stats=None,
+    ):
+        self.retry_policy = RetryPolicy(
+            max_retries, backoff_factor, retry_budget=retry_budget
+        )
         self.user_agent = None
+        self.keep_alive = keep_alive
+        self.scheduler = scheduler
+        self.max_body_size = max_body_size
+        self.stop_after_recipe = stop_after_recipe
+        self.transfer_stats = transfer_stats
+        self.adapter = ConnectionCountingAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+
+    @property
+    def connections_opened(self) -> int:
+        return self.adapter.connections_opened
+
+    @property
+    def connections_reused(self) -> int:
+        return max(self.adapter.requests_sent - self.adapter.connections_opened, 0)
+
+    def close(self):
+        """Close all pooled connections. The session reopens connections when it is used again"""
+        self.session.close()
 
     def _get_headers(self):
-        return {"User-Agent": self.user_agent}
+        headers = {"User-Agent": self.user_agent, "Accept-Encoding": ACCEPT_ENCODING}
+        if not self.keep_alive:
+            headers["Connection"] = "close"
+        return headers
+
+    def _record_transfer(self, url, response, content_bytes):
+        """Count the bytes of a response, as received on the wire & after decompression"""
+        # Bytes read from the connection, before content decoding
+        wire_bytes = response.raw.tell() if hasattr(response.raw, "tell") else None
+        if wire_bytes is None:
+            wire_bytes = content_bytes
+        if self.transfer_stats is not None:
+            self.transfer_stats.record(url, wire_bytes, content_bytes)
+        if self.scheduler:
+            self.scheduler.record_bytes(wire_bytes)
 
-    def _fetch_with_retry(self, url):
-        retry_count = 0
-        while retry_count < self.max_retries:
-            try:
-                response = requests.get(url, headers=self._get_headers())
-
-                if response.status_code == 200:
-                    return response
-                elif response.status_code in RETRYABLE_HTTP_STATUS_CODES:
-                    retry_count += 1
-                    wait_time = self.backoff_factor * (2**retry_count)
-                    print(
-                        f"Status code {response.status_code} received for URL: '{url}'. Retrying in {wait_time} seconds..."
-                    )
-                    time.sleep(wait_time)
-                else:
-                    print(
-                        f"Error: Status code {response.status_code} received for URL: {url}"
-                    )
-                    return None
-            except RequestException as e:
-                retry_count += 1
-                wait_time = self.backoff_factor * (2**retry_count)
-                print(
-                    f"URL '{url}' encountered exception: {e}. Retrying in {wait_time} seconds..."
+    def _read_page(self, url, response) -> FetchedPage:
+        """Stream the body of a 200 response, unless its headers show it is not a page to parse"""
+        reason = skip_reason(response.headers, self.max_body_size)
+        if reason:
+            self._record_transfer(url, response, 0)
+            return FetchedPage(url, None, headers=response.headers, skipped=reason)
+
+        reader = BodyReader(
+            max_body_size=self.max_body_size, stop_after_recipe=self.stop_after_recipe
+        )
+        for chunk in response.iter_content(READ_CHUNK_SIZE):
+            if not reader.feed(chunk):
+                break
+        self._record_transfer(url, response, len(reader.data))
+        return reader.page(url, response.status_code, response.headers)
+
+    def _fetch_once(self, url, attempt, headers=None):
+        """Do a single fetch attempt. Return a FetchedPage, a RetryLater when the fetch should be retried, or None on failure"""
+        try:
+            with self.scheduler.slot(url) if self.scheduler else nullcontext():
+                # Closing a response that is not read to the end closes its connection, so aborted downloads stop right away
+                with self.session.get(
+                    url, headers={**self._get_headers(), **(headers or {})}, stream=True
+                ) as response:
+                    if response.status_code == 200:
+                        page = self._read_page(url, response)
+                    else:
+                        # Read the short body, so the connection can be reused
+                        self._record_transfer(url, response, len(response.content))
+        except RequestException as e:
+            wait_time = self.retry_policy.wait_time(url, attempt, exception=e)
+        else:
+            if response.status_code == 200:
+                return page
+            if response.status_code == NOT_MODIFIED:
+                return FetchedPage(
+                    url, None, status_code=NOT_MODIFIED, headers=response.headers
                 )
-                time.sleep(wait_time)
+            wait_time = self.retry_policy.wait_time(
+                url,
+                attempt,
+                status_code=response.status_code,
+                retry_after=response.headers.get("Retry-After"),
+            )
+        return RetryLater(wait_time) if wait_time is not None else None
 
-        # If we exceed max retries, return None or raise an exception
-        print(f"Max retries exceeded for URL: {url}")
-        return None
+    def _fetch_with_retry(self, url, headers=None):
+        """Fetch url, sleeping inline between attempts"""
+        attempt = 1
+        while True:
+            result = self._fetch_once(url, attempt, headers)
+            if not isinstance(result, RetryLater):
+                return result
+            time.sleep(result.wait_time)
+            attempt += 1
 
     def scrape_page(self, url: str, user_agent: str):
         self.user_agent = user_agent
-        response = self._fetch_with_retry(url)
-        if response:
-            return response.content
+        page = self._fetch_with_retry(url)
+        if page:
+            return page.content
+        else:
+            print(f"Failed to fetch: {url}")
+            return None
+
+    def fetch_page_once(
+        self, url: str, user_agent: str, attempt: int = 1, *, headers=None
+    ):
+        """Do a single fetch attempt without sleeping, with optional extra request headers.
+        Return a FetchedPage, a RetryLater for the caller to schedule, or None on failure
+        """
+        self.user_agent = user_agent
+        result = self._fetch_once(url, attempt, headers)
+        if result is None:
+            print(f"Failed to fetch: {url}")
+        return result
+
+
+class AsyncHTMLScraper:
+    """asyncio counterpart of HTMLScraper. Fetches pages on a shared aiohttp session with the same retry & backoff semantics.
+    Use as async context manager, e.g. `async with AsyncHTMLScraper() as html_scraper:`
+    """
+
+    def __init__(
+        self,
+        max_retries=3,
+        backoff_factor=1,
+        *,
+        max_concurrency=100,
+        keep_alive=True,
+        scheduler=None,
+        retry_budget=None,
+        max_body_size=DEFAULT_MAX_BODY_SIZE,
+        stop_after_recipe=False,
+        transfer_stats=None,
+    ):
+        if aiohttp is None:
+            raise ImportError(
+                "AsyncHTMLScraper requires aiohttp. Please install it with: pip install recipe-database-scraper[async]"
+            )
+        self.retry_policy = RetryPolicy(
+            max_retries, backoff_factor, retry_budget=retry_budget
+        )
+        self.max_concurrency = max_concurrency
+        self.keep_alive = keep_alive
+        self.scheduler = scheduler
+        self.max_body_size = max_body_size
+        self.stop_after_recipe = stop_after_recipe
+        self.transfer_stats = transfer_stats
+        self.user_agent = None
+        self.session = None
+        self.connections_opened = 0
+        self.connections_reused = 0
+        self._semaphore = None
+
+    async def __aenter__(self):
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(self._on_connection_create)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reuse)
+
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=self.max_concurrency,
+                ttl_dns_cache=DNS_CACHE_TTL,
+                force_close=not self.keep_alive,
+            ),
+            trace_configs=[trace_config],
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+        self.session = None
+
+    def _host_slot(self, url):
+        if self.scheduler:
+            return self.scheduler.aslot(url)
+        return nullcontext()
+
+    async def _on_connection_create(self, session, trace_config_ctx, params):
+        self.connections_opened += 1
+
+    async def _on_connection_reuse(self, session, trace_config_ctx, params):
+        self.connections_reused += 1
+
+    def _get_headers(self):
+        return {"User-Agent": self.user_agent}
+
+    def _record_transfer(self, url, response, content_bytes):
+        """Async counterpart of HTMLScraper._record_transfer"""
+        # Bytes received before content decoding, on aiohttp versions that count them
+        wire_bytes = getattr(response.content, "total_raw_bytes", content_bytes)
+        if self.transfer_stats is not None:
+            self.transfer_stats.record(url, wire_bytes, content_bytes)
+        if self.scheduler:
+            self.scheduler.record_bytes(wire_bytes)
+
+    async def _read_page(self, url, response) -> FetchedPage:
+        """Async counterpart of HTMLScraper._read_page"""
+        reason = skip_reason(response.headers, self.max_body_size)
+        if reason:
+            self._record_transfer(url, response, 0)
+            return FetchedPage(url, None, headers=response.headers, skipped=reason)
+
+        reader = BodyReader(
+            max_body_size=self.max_body_size, stop_after_recipe=self.stop_after_recipe
+        )
+        async for chunk in response.content.iter_chunked(READ_CHUNK_SIZE):
+            if not reader.feed(chunk):
+                break
+        self._record_transfer(url, response, len(reader.data))
+        return reader.page(url, response.status, response.headers)
+
+    async def _fetch_once(self, url, attempt, headers=None):
+        """Do a single fetch attempt. Return a FetchedPage, a RetryLater when the fetch should be retried, or None on failure"""
+        try:
+            async with self._semaphore, self._host_slot(url):
+                async with self.session.get(
+                    url, headers={**self._get_headers(), **(headers or {})}
+                ) as response:
+                    if response.status == 200:
+                        return await self._read_page(url, response)
+                    if response.status == NOT_MODIFIED:
+                        return FetchedPage(
+                            url,
+                            None,
+                            status_code=NOT_MODIFIED,
+                            headers=response.headers,
+                        )
+                    status_code = response.status
+                    retry_after = response.headers.get("Retry-After")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            wait_time = self.retry_policy.wait_time(url, attempt, exception=e)
+        else:
+            wait_time = self.retry_policy.wait_time(
+                url, attempt, status_code=status_code, retry_after=retry_after
+            )
+        return RetryLater(wait_time) if wait_time is not None else None
+
+    async def _fetch_with_retry(self, url, headers=None):
+        """Fetch url, awaiting the backoff between attempts"""
+        attempt = 1
+        while True:
+            result = await self._fetch_once(url, attempt, headers)
+            if not isinstance(result, RetryLater):
+                return result
+            await asyncio.sleep(result.wait_time)
+            attempt += 1
+
+    async def scrape_page(self, url: str, user_agent: str):
+        self.user_agent = user_agent
+        page = await self._fetch_with_retry(url)
+        if page:
+            return page.content
         else:
             print(f"Failed to fetch: {url}")
             return None
+
+    async def fetch_page_once(
+        self, url: str, user_agent: str, attempt: int = 1, *, headers=None
+    ):
+        """Async counterpart of HTMLScraper.fetch_page_once"""
+        self.user_agent = user_agent
+        result = await self._fetch_once(url, attempt, headers)
+        if result is None:
+            print(f"Failed to fetch: {url}")
+        return result
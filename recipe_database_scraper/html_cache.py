@@ -0,0 +1,199 @@
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from .get_html import FetchedPage
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency, gzip is used when zstandard is not installed
+    zstandard = None
+
+CACHED_HEADERS = ("ETag", "Last-Modified", "Content-Type")
+"""Response headers that are kept with the cached html."""
+
+COMPRESSION_EXTENSIONS = {"gzip": ".html.gz", "zstd": ".html.zst"}
+
+
+class HTMLCache:
+    """Content-addressed on-disk cache of compressed page html, keyed by URL.
+    Entries are stored with the sitemap last modified date of their page, and ignored once the sitemap has another date. Entries older than max_age seconds are ignored, and the least recently used entries are evicted once the cache exceeds max_size bytes
+    """
+
+    cached_headers = CACHED_HEADERS
+
+    def __init__(
+        self,
+        directory: str,
+        *,
+        max_size: int | None = None,
+        max_age: float | None = None,
+        compression: str | None = None,
+    ):
+        if compression is None:
+            compression = "zstd" if zstandard else "gzip"
+        if compression not in COMPRESSION_EXTENSIONS:
+            raise ValueError(
+                f"Unknown compression '{compression}'. Use one of: {', '.join(COMPRESSION_EXTENSIONS)}"
+            )
+        if compression == "zstd" and zstandard is None:
+            raise ImportError(
+                "zstd compression requires zstandard. Please install it with: pip install recipe-database-scraper[zstd]"
+            )
+
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+        self.compression = compression
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+        # Size & last use of every entry, to evict without rescanning the directory
+        self._entries = {}
+        self._size = 0
+        for dirpath, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                if filename.endswith(tuple(COMPRESSION_EXTENSIONS.values())):
+                    stat = os.stat(os.path.join(dirpath, filename))
+                    self._entries[os.path.join(dirpath, filename)] = (
+                        stat.st_size,
+                        stat.st_mtime,
+                    )
+                    self._size += stat.st_size
+
+    def _key(self, url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+    def _path(self, url: str, compression: str) -> str:
+        key = self._key(url)
+        return os.path.join(
+            self.directory, key[:2], key + COMPRESSION_EXTENSIONS[compression]
+        )
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compression == "zstd":
+            return zstandard.ZstdCompressor().compress(data)
+        return gzip.compress(data)
+
+    @staticmethod
+    def _decompress(data: bytes, compression: str) -> bytes:
+        if compression == "zstd":
+            if zstandard is None:
+                raise ImportError("Cannot read zstd cache entry without zstandard")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+    def get(self, url: str, *, last_modified: str | None = None) -> FetchedPage | None:
+        """Return the cached page for url, or None if it is not cached, cached for another sitemap last modified date or older than max_age"""
+        # Look for entries in the configured compression first, then for entries written with another compression
+        compressions = [self.compression] + [
+            compression
+            for compression in COMPRESSION_EXTENSIONS
+            if compression != self.compression
+        ]
+        for compression in compressions:
+            path = self._path(url, compression)
+            try:
+                with open(path, "rb") as cache_file:
+                    data = self._decompress(cache_file.read(), compression)
+            except FileNotFoundError:
+                continue
+            except Exception as ex:
+                # Treat corrupt entries, or zstd entries without zstandard installed, as a cache miss
+                print(f"WARNING: Unreadable html cache entry for {url}: {ex}")
+                continue
+
+            header, _, content = data.partition(b"\n")
+            metadata = json.loads(header)
+            if metadata["url"] != url:
+                continue
+            # The page changed since it was cached
+            if metadata.get("last_modified") != last_modified:
+                continue
+            if (
+                self.max_age is not None
+                and time.time() - metadata["fetched_at"] > self.max_age
+            ):
+                continue
+
+            self._touch(path)
+            with self._lock:
+                self.hits += 1
+            return FetchedPage(
+                url, content, headers=metadata["headers"], from_cache=True
+            )
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, page: FetchedPage, *, last_modified: str | None = None):
+        """Store the html of a fetched page with its sitemap last modified date, written atomically so concurrent readers never see partial entries"""
+        headers = {
+            name: page.headers.get(name)
+            for name in self.cached_headers
+            if page.headers.get(name)
+        }
+        header = json.dumps(
+            {
+                "url": page.url,
+                "fetched_at": time.time(),
+                "last_modified": last_modified,
+                "headers": headers,
+            }
+        ).encode("utf-8")
+        data = self._compress(header + b"\n" + page.content)
+
+        path = self._path(page.url, self.compression)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(file_descriptor, "wb") as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            previous_size, _ = self._entries.get(path, (0, 0))
+            self._entries[path] = (len(data), time.time())
+            self._size += len(data) - previous_size
+        self._evict()
+
+    def _touch(self, path: str):
+        """Mark an entry as recently used"""
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except FileNotFoundError:
+            return
+        with self._lock:
+            if path in self._entries:
+                self._entries[path] = (self._entries[path][0], now)
+
+    def _evict(self):
+        """Remove least recently used entries until the cache is back under 90% of max_size"""
+        if self.max_size is None or self._size <= self.max_size:
+            return
+
+        with self._lock:
+            target_size = self.max_size * 0.9
+            for path, (size, _) in sorted(
+                self._entries.items(), key=lambda entry: entry[1][1]
+            ):
+                if self._size <= target_size:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                del self._entries[path]
+                self._size -= size
+
+    @property
+    def size(self) -> int:
+        """Total size in bytes of the cached entries"""
+        return self._size
@@ -0,0 +1,242 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from ._urls import url_host
+
+
+class HostThrottle:
+    """Token bucket limiting the request rate to a single host, combined with an optional cap on concurrent connections"""
+
+    def __init__(
+        self,
+        requests_per_second: float | None = None,
+        burst: int = 1,
+        max_connections: int | None = None,
+    ):
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.max_connections = max_connections
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._connections = (
+            threading.BoundedSemaphore(max_connections) if max_connections else None
+        )
+        self._async_connections = None
+
+    def _reserve(self) -> float:
+        """Take a token & return the seconds to wait before using it. Tokens can go negative, which queues callers in order of reservation"""
+        if not self.requests_per_second:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst,
+                self.tokens + (now - self.updated) * self.requests_per_second,
+            )
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.requests_per_second
+
+    @contextmanager
+    def slot(self):
+        """Block until a request to the host is allowed"""
+        if self._connections:
+            self._connections.acquire()
+        try:
+            wait_time = self._reserve()
+            if wait_time:
+                time.sleep(wait_time)
+            yield
+        finally:
+            if self._connections:
+                self._connections.release()
+
+    @asynccontextmanager
+    async def aslot(self):
+        """Async counterpart of def slot, waiting without blocking the event loop"""
+        if self.max_connections and self._async_connections is None:
+            self._async_connections = asyncio.Semaphore(self.max_connections)
+        if self._async_connections:
+            await self._async_connections.acquire()
+        try:
+            wait_time = self._reserve()
+            if wait_time:
+                await asyncio.sleep(wait_time)
+            yield
+        finally:
+            if self._async_connections:
+                self._async_connections.release()
+
+
+class BandwidthLimiter:
+    """Cap the bytes per second downloaded over all hosts.
+    Response sizes are only known once they are downloaded, so every response is paid for by delaying the requests that follow it
+    """
+
+    def __init__(self, bytes_per_second: float):
+        self.bytes_per_second = bytes_per_second
+        self.debt = 0.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _pay_off(self):
+        now = time.monotonic()
+        self.debt = max(0.0, self.debt - (now - self.updated) * self.bytes_per_second)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Return the seconds to wait until the bytes downloaded so far fit in the cap"""
+        with self._lock:
+            self._pay_off()
+            return self.debt / self.bytes_per_second
+
+    def consume(self, n_bytes: int):
+        with self._lock:
+            self._pay_off()
+            self.debt += n_bytes
+
+
+class PolitenessScheduler:
+    """Hand out a HostThrottle per host.
+    Defaults are derived from the Crawl-delay & Request-rate directives in the robots.txt of the host, explicit overrides take precedence.
+    One scheduler can be shared by the scrapers of several sites, with a global cap on concurrent requests & downloaded bytes per second over all hosts
+    """
+
+    def __init__(
+        self,
+        user_agent: str,
+        *,
+        requests_per_second: float | None = None,
+        burst: int | None = None,
+        max_connections_per_host: int | None = None,
+        max_connections: int | None = None,
+        max_bytes_per_second: float | None = None,
+    ):
+        self.user_agent = user_agent
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.max_connections_per_host = max_connections_per_host
+        self.max_connections = max_connections
+        self.robots_parsers = {}
+        self.host_settings = {}
+        self.throttles = {}
+        self.bandwidth = (
+            BandwidthLimiter(max_bytes_per_second) if max_bytes_per_second else None
+        )
+        self._lock = threading.Lock()
+        self._connections = (
+            threading.BoundedSemaphore(max_connections) if max_connections else None
+        )
+        self._async_connections = None
+
+    @staticmethod
+    def _host(url: str) -> str:
+        return url_host(url)
+
+    def add_robots_parser(self, url: str, parser):
+        """Use the rate directives of the robots.txt parser for the host of url"""
+        self.robots_parsers[self._host(url)] = parser
+
+    def set_host_settings(
+        self,
+        url: str,
+        *,
+        requests_per_second: float | None = None,
+        burst: int | None = None,
+        max_connections_per_host: int | None = None,
+    ):
+        """Override the scheduler settings for the host of url. Settings left to None fall back to the scheduler settings"""
+        self.host_settings[self._host(url)] = {
+            "requests_per_second": requests_per_second,
+            "burst": burst,
+            "max_connections_per_host": max_connections_per_host,
+        }
+
+    def _setting(self, host: str, name: str):
+        value = self.host_settings.get(host, {}).get(name)
+        return value if value is not None else getattr(self, name)
+
+    def _robots_requests_per_second(self, host: str) -> float | None:
+        """Return the most restrictive rate of the Crawl-delay & Request-rate directives, or None if neither is set"""
+        parser = self.robots_parsers.get(host)
+        if parser is None:
+            return None
+
+        rates = []
+        crawl_delay = getattr(parser, "crawl_delay", lambda _: None)(self.user_agent)
+        if crawl_delay:
+            rates.append(1 / crawl_delay)
+        request_rate = getattr(parser, "request_rate", lambda _: None)(self.user_agent)
+        if request_rate and request_rate[1] > 0:
+            rates.append(request_rate[0] / request_rate[1])
+
+        return min(rates) if rates else None
+
+    def _new_throttle(self, host: str) -> HostThrottle:
+        requests_per_second = self._setting(host, "requests_per_second")
+        if requests_per_second is None:
+            requests_per_second = self._robots_requests_per_second(host)
+        throttle = HostThrottle(
+            requests_per_second=requests_per_second,
+            burst=self._setting(host, "burst") or 1,
+            max_connections=self._setting(host, "max_connections_per_host"),
+        )
+        if requests_per_second:
+            print(
+                f"INFO: Limiting requests to {host} to {requests_per_second:.2f} per second (burst {throttle.burst})"
+            )
+        return throttle
+
+    def throttle_for(self, url: str) -> HostThrottle:
+        host = self._host(url)
+        with self._lock:
+            if host not in self.throttles:
+                self.throttles[host] = self._new_throttle(host)
+            return self.throttles[host]
+
+    def record_bytes(self, n_bytes: int):
+        """Count downloaded bytes against the bandwidth cap"""
+        if self.bandwidth:
+            self.bandwidth.consume(n_bytes)
+
+    @contextmanager
+    def slot(self, url: str):
+        """Context manager that blocks until a request to url is allowed.
+        The global slot is taken last, so requests waiting for a slow host do not hold it
+        """
+        with self.throttle_for(url).slot():
+            if self._connections:
+                self._connections.acquire()
+            try:
+                if self.bandwidth:
+                    wait_time = self.bandwidth.wait_time()
+                    if wait_time:
+                        time.sleep(wait_time)
+                yield
+            finally:
+                if self._connections:
+                    self._connections.release()
+
+    @asynccontextmanager
+    async def aslot(self, url: str):
+        """Async context manager that waits until a request to url is allowed"""
+        async with self.throttle_for(url).aslot():
+            if self.max_connections and self._async_connections is None:
+                self._async_connections = asyncio.Semaphore(self.max_connections)
+            if self._async_connections:
+                await self._async_connections.acquire()
+            try:
+                if self.bandwidth:
+                    wait_time = self.bandwidth.wait_time()
+                    if wait_time:
+                        await asyncio.sleep(wait_time)
+                yield
+            finally:
+                if self._async_connections:
+                    self._async_connections.release()
@@ -0,0 +1,61 @@
+import re
+
+# "@type": "Recipe", "@type": ["Recipe", ...] or "@type": "http://schema.org/Recipe", also when the JSON-LD is escaped inside a script string
+RE_JSON_LD_RECIPE = re.compile(
+    rb"""\\?["']@type\\?["']\s*:\s*(?:\[[^\]]{0,500}?)?\\?["'](?:https?:(?:\\?/){2}schema\.org(?:\\?/))?Recipe\\?["']""",
+    re.IGNORECASE,
+)
+# Microdata: itemtype="http://schema.org/Recipe"
+RE_MICRODATA_RECIPE = re.compile(
+    rb"""itemtype\s*=\s*["']?[^"'>]{0,200}?schema\.org/Recipe\b""", re.IGNORECASE
+)
+# RDFa: typeof="Recipe" or typeof="schema:Recipe"
+RE_RDFA_RECIPE = re.compile(
+    rb"""typeof\s*=\s*["']?[^"'>]{0,200}?\b(?:schema:)?Recipe\b""", re.IGNORECASE
+)
+
+RECIPE_MARKERS = (RE_JSON_LD_RECIPE, RE_MICRODATA_RECIPE, RE_RDFA_RECIPE)
+
+UTF16_BOMS = (b"\xff\xfe", b"\xfe\xff")
+
+
+def has_recipe_markup(html: bytes | str | None) -> bool:
+    """Scan raw html for schema.org Recipe markup in JSON-LD, microdata or RDFa, without parsing the DOM.
+    Pages without any of these markers cannot be parsed by the generic schema scraper of recipe-scrapers, so they can be skipped
+    """
+    if not html:
+        return False
+    if isinstance(html, str):
+        html = html.encode("utf-8", "replace")
+    if html.startswith(UTF16_BOMS):
+        # Not ASCII compatible, so the markers cannot be matched on the raw bytes
+        return True
+    return any(marker.search(html) for marker in RECIPE_MARKERS)
+
+
+def evaluate_prefilter(pages, parse) -> dict:
+    """Measure the prefilter on a corpus of (page_url, html) tuples against a full parse.
+    parse(page_url, html) should return whether the full parse finds a recipe.
+    A false negative is a recipe page the prefilter would skip
+    """
+    counts = {
+        "pages": 0,
+        "recipes": 0,
+        "skipped": 0,
+        "false_negatives": 0,
+        "false_negative_urls": [],
+    }
+    for page_url, html in pages:
+        counts["pages"] += 1
+        is_recipe = bool(parse(page_url, html))
+        skipped = not has_recipe_markup(html)
+        counts["recipes"] += is_recipe
+        counts["skipped"] += skipped
+        if is_recipe and skipped:
+            counts["false_negatives"] += 1
+            counts["false_negative_urls"].append(page_url)
+
+    counts["false_negative_rate"] = (
+        counts["false_negatives"] / counts["recipes"] if counts["recipes"] else 0.0
+    )
+    return counts
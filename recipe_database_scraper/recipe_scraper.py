@@ -1,15 +1,92 @@
+import asyncio
 import datetime
+import functools
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import contextmanager
 
 from recipe_scrapers import scrape_html, scraper_exists_for
 
 from .sitemap_scraper import SitemapScraper
-from .get_html import HTMLScraper
-from ._utils import FileHandler, robots_parser, is_valid_url
+from .crawl_plan import CrawlPlan
+from .prefilter import has_recipe_markup
+from .transfer_stats import TransferStats
+from .url_filters import UrlFilter
+from .politeness import PolitenessScheduler
+from .get_html import (
+    HTMLScraper,
+    AsyncHTMLScraper,
+    DEFAULT_POOL_SIZE,
+    DEFAULT_MAX_BODY_SIZE,
+    RetryBudget,
+    RetryLater,
+    RetryQueue,
+    conditional_headers,
+)
+from .sqlite_store import RecipeDatabase
+from .exclusion_store import ExclusionStore
+from .recipe_spool import RecipeSpool, SpooledRecipes
+from ._urls import TRACKING_QUERY_PARAMS, UrlIndex, canonicalize_url, is_valid_url
+from ._utils import (
+    FileHandler,
+    robots_parser,
+    is_jsonl_file,
+    REMOVED_PAGE,
+    PageWithoutRecipe,
+)
+
+PREDICTED_NO_RECIPE = object()
+"""Scrape result of a page that is skipped because the url classifier predicts it has no recipe. It is not stored, so the page is predicted again on the next run"""
+
+
+def parse_recipe_html(html, page_url, last_modified, supported_only):
+    """Use recipe-scrapers.scrape_html module for determining if recipe schema is available in the html, and retrieving it. Return the recipe dict, or None"""
+    try:
+        scraper = scrape_html(html, page_url, supported_only=supported_only)
+
+        # Check if recipe schema is available by pulling standard recipe schema fields from recipe_scrapers.scrape_html
+        scraper.title()
+        scraper.ingredients()
+
+        recipe_json = scraper.to_json()
+        recipe_json["last_modified"] = last_modified
+        return recipe_json
+    except (
+        TypeError,
+        NotImplementedError,
+    ):  # NoneType found for scraper.title() OR title not present in recipe-scraper object
+        print(f"Exception: No Recipe Schema found at {page_url}")
+    except Exception as e:
+        print(e)
+    return None
+
+
+def parse_recipe_html_compact(html, page_url, last_modified, supported_only) -> str:
+    """Process pool counterpart of def parse_recipe_html. Return the recipe as a JSON string, which is far cheaper to send back to the main process than a nested dict"""
+    return json.dumps(parse_recipe_html(html, page_url, last_modified, supported_only))
+
+
+def _parse_pool_context():
+    """Start parse processes from a fresh interpreter instead of forking the threaded scraper process"""
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")
 
 
 class Recipe:
-    def __init__(self, recipe_dict: dict):
+    def __init__(self, recipe_dict: dict, *, reused: bool = False):
         self.recipe_dict = recipe_dict
+        # Reused from the input without fetching its page
+        self.reused = reused
 
     def structure(self):
         self.url = self.recipe_dict["page_url"]
@@ -37,37 +114,172 @@ class Recipe:
 class Recipes:
     def __init__(self):
         self.recipes = {}
-        self.pages_without_recipe = []
+        # Recipes moved out of memory by def evict, once they are written to the output
+        self.spool = None
+        # Page url: last modified date, so excluded pages are re-checked once their sitemap lastmod changes
+        self.pages_without_recipe = {}
+        # (page_url, recipe_dict) records added since the last append to a JSON Lines output file
+        self.unwritten_records = []
 
     def add_recipe(self, page_url, recipe: Recipe):
         self.recipes[page_url] = recipe.recipe_dict
+        self.unwritten_records.append((page_url, recipe.recipe_dict))
+
+    def add_non_recipe_page(self, page_url: str, last_modified: str | None = None):
+        self.pages_without_recipe[page_url] = last_modified
+        self.unwritten_records.append((page_url, PageWithoutRecipe(last_modified)))
+
+    def add_non_recipe_page_list(self, page_list: list | dict):
+        """Add a list of urls, or a dict of url: last modified date"""
+        if not isinstance(page_list, dict):
+            page_list = dict.fromkeys(page_list)
+        self.pages_without_recipe.update(page_list)
+        self.unwritten_records.extend(
+            (page_url, PageWithoutRecipe(last_modified))
+            for page_url, last_modified in page_list.items()
+        )
 
-    def add_non_recipe_page(self, page_url: str):
-        self.pages_without_recipe.append(page_url)
+    def remove_page(self, page_url: str):
+        """Prune a page that is no longer in the sitemap from the output"""
+        self.recipes.pop(page_url, None)
+        if self.spool is not None:
+            self.spool.discard(page_url)
+        self.pages_without_recipe.pop(page_url, None)
+        self.unwritten_records.append((page_url, REMOVED_PAGE))
 
-    def add_non_recipe_page_list(self, page_list: list):
-        self.pages_without_recipe.extend(page_list)
+    def pop_unwritten_records(self) -> list:
+        unwritten_records = self.unwritten_records
+        self.unwritten_records = []
+        return unwritten_records
 
-    def to_json(self):
-        if len(self.pages_without_recipe) > 0:
-            self.recipes["Pages without Recipe"] = self.pages_without_recipe
+    def drop_written(self):
+        """Drop the recipes that are written to the output from memory, together with their spool file"""
+        self.recipes = {}
+        self.close()
+
+    def close(self):
+        """Remove the spool file of evicted recipes"""
+        if self.spool is not None:
+            self.spool.close()
+            self.spool = None
+
+    def evict(self, *, spool_dir: str | None = None):
+        """Move the recipes in memory to a spool file on disk, so memory use is bounded by the batch size instead of the site size"""
+        self.recipes.pop("Pages without Recipe", None)
+        if not self.recipes:
+            return
+        if self.spool is None:
+            self.spool = RecipeSpool(spool_dir)
+        self.spool.write(self.recipes.items())
+        self.recipes = {}
+
+    def to_json(self, *, pages_without_recipe: bool = True):
+        """Return the recipes as dict of page url: recipe dict, with the pages without recipe under 'Pages without Recipe'.
+        Once recipes are evicted, a read only mapping is returned that reads them from the spool file on access
+        """
+        if self.spool is not None:
+            return SpooledRecipes(self, pages_without_recipe=pages_without_recipe)
+        if pages_without_recipe and len(self.pages_without_recipe) > 0:
+            self.recipes["Pages without Recipe"] = list(self.pages_without_recipe)
+        else:
+            self.recipes.pop("Pages without Recipe", None)
         return self.recipes
 
 
 class RecipeScraper:
-    def __init__(self, url, user_agent):
+    def __init__(
+        self,
+        url,
+        user_agent,
+        *,
+        pool_size=DEFAULT_POOL_SIZE,
+        keep_alive=True,
+        requests_per_second=None,
+        burst=None,
+        max_connections_per_host=None,
+        retry_budget=None,
+        html_cache=None,
+        sitemap_cache=None,
+        scheduler=None,
+        prefilter=True,
+        max_body_size=DEFAULT_MAX_BODY_SIZE,
+        stop_after_recipe=False,
+        tracking_params=None,
+        include_urls=None,
+        exclude_urls=None,
+        url_classifier=None,
+    ):
         self.url = url
         self.user_agent = user_agent
+        self.keep_alive = keep_alive
         self.recipes = Recipes()
         self.website_supported = False
         self._recipe_scraper_supported()
         self.batch_buffer = 0
+        self.pages_per_second = None
         try:
             self.robots_parser = robots_parser(self.url)
         except Exception:
             print("Cannot find robots.txt ")
             self.robots_parser = None
 
+        if scheduler is None:
+            self.scheduler = PolitenessScheduler(
+                user_agent,
+                requests_per_second=requests_per_second,
+                burst=burst,
+                max_connections_per_host=max_connections_per_host,
+            )
+        else:
+            # Shared with the scrapers of other sites, so the settings of this site only apply to its own host
+            self.scheduler = scheduler
+            self.scheduler.set_host_settings(
+                self.url,
+                requests_per_second=requests_per_second,
+                burst=burst,
+                max_connections_per_host=max_connections_per_host,
+            )
+        if self.robots_parser is not None:
+            self.scheduler.add_robots_parser(self.url, self.robots_parser)
+
+        self.retry_budget = RetryBudget(retry_budget)
+        # Bytes downloaded during this run, for pages & sitemaps
+        self.transfer_stats = TransferStats()
+        self.html_cache = html_cache
+        self.sitemap_cache = sitemap_cache
+        self.parse_executor = None
+        # Only sites without a dedicated recipe-scrapers scraper depend on schema.org markup
+        self.prefilter = prefilter and not self.website_supported
+        self.prefiltered_pages = 0
+        # Guards the counters that are updated from the fetch threads
+        self._counter_lock = threading.Lock()
+        self.max_body_size = max_body_size
+        self.stop_after_recipe = stop_after_recipe
+        # Query parameters dropped from the canonical urls on which pages are matched
+        self.tracking_params = (
+            TRACKING_QUERY_PARAMS
+            if tracking_params is None
+            else frozenset(param.lower() for param in tracking_params)
+        )
+        # Glob or regex rules of the sitemap pages to crawl
+        self.include_urls = include_urls
+        self.exclude_urls = exclude_urls
+        # The include & exclude rules alone, to keep pages they filter out of the pages without recipe
+        self.rule_filter = UrlFilter(include=include_urls, exclude=exclude_urls)
+        # UrlClassifier predicting which pages to skip without fetching them
+        self.url_classifier = url_classifier
+
+        # One session per run, so connections are reused across all pages of the site
+        self.html_scraper = HTMLScraper(
+            pool_size=pool_size,
+            keep_alive=keep_alive,
+            scheduler=self.scheduler,
+            retry_budget=self.retry_budget,
+            max_body_size=max_body_size,
+            stop_after_recipe=stop_after_recipe,
+            transfer_stats=self.transfer_stats,
+        )
+
     def _recipe_scraper_supported(self) -> bool:
         """Check if website is supported by recipe-scrapers lib. If not, return value"""
         website_supported = scraper_exists_for(self.url)
@@ -86,21 +298,25 @@ class RecipeScraper:
                 + "---"
             )
 
-    def _handle_exclusions_list(self, exclusions_list: list, input_dict: dict):
-        """Return pages that should be excluded from def scrape_to_json. Either:
+    def _handle_exclusions_list(
+        self, exclusions_list: list | dict | None, input_dict: dict
+    ) -> dict:
+        """Return pages that should be excluded from def scrape_to_json, as a dict of url: last modified date. Either:
         - 'Pages without Recipe' key values from input_dict (in case of manual dict input)
-        - 'exclusion_list' file content pulled from input_file location
+        - exclusion store content pulled from input_file location, either a list of urls or a dict of url: last modified date
         """
         input_location = "_recipe_scraper_exclusions.json file"
 
-        if input_dict:
-            # Create a copy to avoid modifying the original input_dict
-            input_dict_copy = input_dict.copy()
+        # Copy, to avoid modifying the caller's exclusions
+        if isinstance(exclusions_list, dict):
+            exclusions = dict(exclusions_list)
+        else:
+            exclusions = dict.fromkeys(exclusions_list or [])
 
-            input_dict_exclusions = input_dict_copy.pop("Pages without Recipe", [])
-            if not exclusions_list:
+        if input_dict:
+            input_dict_exclusions = input_dict.get("Pages without Recipe", [])
+            if not exclusions:
                 input_location = "input dict"
-                exclusions_list = input_dict_exclusions
             elif input_dict_exclusions:
                 print(
                     """
@@ -111,14 +327,13 @@ class RecipeScraper:
                     """
                 )
                 input_location += " & input file"
-                exclusions_list.extend(input_dict_exclusions)
+            for url in input_dict_exclusions:
+                exclusions.setdefault(url, None)
 
-        if exclusions_list:
-            # Drop potential duplicate values
-            exclusions_list = list(set(exclusions_list))
-            print(f"Found {len(exclusions_list)} pages to exclude in {input_location}")
+        if exclusions:
+            print(f"Found {len(exclusions)} pages to exclude in {input_location}")
 
-        return exclusions_list
+        return exclusions
 
     def _handle_input_dict(self, input_dict: dict):
         """Check input_dict for:
@@ -164,111 +379,886 @@ class RecipeScraper:
             pass
         return None
 
-    def _scrape_recipe_page(self, page_url, last_modified):
-        """Retrieve html of webpage, then use recipe-scrapers.scrape_html module for determining if recipe schema is available, and retrieving it"""
+    def _parse_recipe_html(self, html, page_url, last_modified):
+        """Parse html for recipe schema, in the parse process pool if there is one"""
+        if self.parse_executor is None:
+            recipe_json = parse_recipe_html(
+                html, page_url, last_modified, self.website_supported
+            )
+        else:
+            recipe_json = json.loads(
+                self.parse_executor.submit(
+                    parse_recipe_html_compact,
+                    html,
+                    page_url,
+                    last_modified,
+                    self.website_supported,
+                ).result()
+            )
+        return Recipe(recipe_json) if recipe_json else None
+
+    @contextmanager
+    def _parse_pool(self, parse_processes):
+        """Parse html on a pool of parse_processes processes for the duration of a run, while pages are fetched on threads or the event loop"""
+        if not parse_processes:
+            yield
+            return
+
+        # Worker processes can be started after the fetch threads, which forking while they hold locks could deadlock
+        self.parse_executor = ProcessPoolExecutor(
+            max_workers=parse_processes, mp_context=_parse_pool_context()
+        )
         try:
-            html = HTMLScraper().scrape_page(page_url, self.user_agent)
-            scraper = scrape_html(html, page_url, supported_only=self.website_supported)
-
-            # Check if recipe schema is available by pulling standard recipe schema fields from recipe_scrapers.scrape_html
-            scraper.title()
-            scraper.ingredients()
-
-            recipe_json = scraper.to_json()
-            recipe_json["last_modified"] = last_modified
-            return Recipe(recipe_json)
-        except (
-            TypeError,
-            NotImplementedError,
-        ):  # NoneType found for scraper.title() OR title not present in recipe-scraper object
-            print(f"Exception: No Recipe Schema found at {page_url}")
-        except Exception as e:
-            print(e)
+            yield
+        finally:
+            self.parse_executor.shutdown()
+            self.parse_executor = None
+
+    def _handle_fetched_page(self, page, page_url, last_modified, stored_recipe):
+        """Turn a fetched page into a Recipe. Reuse the stored recipe if the page was not modified, else parse the html & store the validators of the response"""
+        if page and page.not_modified:
+            if not stored_recipe:
+                # Only a conditional request can be answered with 304, there is no recipe to reuse
+                print(
+                    f"Failed to fetch: {page_url} (304 Not Modified without validators)"
+                )
+                return None
+            print(
+                f"Recipe data not modified since last scrape, fetching from input file URL: {page_url}"
+            )
+            return Recipe({**stored_recipe, "last_modified": last_modified})
+
+        if page and page.skipped:
+            print(f"Skipped downloading {page_url}: {page.skipped}")
+            return None
+
+        # Truncated html is missing the part after the recipe, keep it out of the cache
+        if (
+            self.html_cache
+            and page
+            and page.content
+            and not page.from_cache
+            and not page.truncated
+        ):
+            self.html_cache.put(page, last_modified=last_modified)
+
+        if (
+            self.prefilter
+            and page
+            and page.content
+            and not has_recipe_markup(page.content)
+        ):
+            print(f"Exception: No Recipe Schema markup found at {page_url}")
+            with self._counter_lock:
+                self.prefiltered_pages += 1
+            return None
+
+        recipe = self._parse_recipe_html(
+            page.content if page else None, page_url, last_modified
+        )
+        if recipe and page:
+            if page.etag:
+                recipe.recipe_dict["etag"] = page.etag
+            if page.last_modified:
+                recipe.recipe_dict["http_last_modified"] = page.last_modified
+        return recipe
+
+    def _conditional_headers(self, stored_recipe):
+        if not stored_recipe:
+            return None
+        return conditional_headers(
+            stored_recipe.get("etag"), stored_recipe.get("http_last_modified")
+        )
+
+    def _scrape_recipe_page(
+        self, page_url, last_modified, attempt=1, *, stored_recipe=None
+    ):
+        """Retrieve html of webpage, then parse it for recipe schema. Returns a RetryLater if the fetch should be retried.
+        If a stored recipe with ETag or Last-Modified validators is provided, the request is conditional & the stored recipe is reused when the page has not changed.
+        Html in the html cache is used without going to the network
+        """
+        page = (
+            self.html_cache.get(page_url, last_modified=last_modified)
+            if self.html_cache
+            else None
+        )
+        if page:
+            return self._handle_fetched_page(
+                page, page_url, last_modified, stored_recipe
+            )
+
+        page = self.html_scraper.fetch_page_once(
+            page_url,
+            self.user_agent,
+            attempt,
+            headers=self._conditional_headers(stored_recipe),
+        )
+        if isinstance(page, RetryLater):
+            return page
+        return self._handle_fetched_page(page, page_url, last_modified, stored_recipe)
+
+    async def _ascrape_recipe_page(
+        self, page_url, last_modified, html_scraper, attempt=1, *, stored_recipe=None
+    ):
+        """Retrieve html of webpage on the event loop, then parse it for recipe schema in the default executor to keep the event loop responsive"""
+        loop = asyncio.get_running_loop()
+        page = (
+            await loop.run_in_executor(
+                None,
+                functools.partial(
+                    self.html_cache.get, page_url, last_modified=last_modified
+                ),
+            )
+            if self.html_cache
+            else None
+        )
+        if page:
+            return await loop.run_in_executor(
+                None,
+                self._handle_fetched_page,
+                page,
+                page_url,
+                last_modified,
+                stored_recipe,
+            )
+
+        page = await html_scraper.fetch_page_once(
+            page_url,
+            self.user_agent,
+            attempt,
+            headers=self._conditional_headers(stored_recipe),
+        )
+        if isinstance(page, RetryLater):
+            return page
+        return await loop.run_in_executor(
+            None,
+            self._handle_fetched_page,
+            page,
+            page_url,
+            last_modified,
+            stored_recipe,
+        )
+
+    def _status_message(self, scrape_count, len_pages_to_scrape):
+        current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S,%f")[:-3]
+        return f"{current_time} INFO [{str(scrape_count)}/{str(len_pages_to_scrape)}]: "
+
+    def _fetch_allowed(self, p):
+        """Proceed if robots.txt allows fetching the url or robots.txt isn't found"""
+        if self.robots_parser is None or self.robots_parser.can_fetch(
+            self.user_agent, self.url
+        ):
+            return True
+        print(
+            f"Robots.txt does not allow user agent '{self.user_agent}' to scrape URL: {p}"
+        )
+        return False
+
+    def _reusable_input(self, p, input_dict):
+        """Return the input_dict data of a page if it is up-to-date & can be reused without a request"""
+        input_data = self._url_in_input_data(p, input_dict) if input_dict else None
+        if (
+            input_data
+            and p.last_modified is None
+            and self._conditional_headers(input_data)
+        ):
+            # Without sitemap lastmod the stored recipe may be outdated. Revalidate it with a conditional request instead
+            return None
+        return input_data
+
+    def _input_recipe(self, status_message, p, input_dict):
+        """Return a Recipe from input_dict if its data is up-to-date"""
+        input_data = self._reusable_input(p, input_dict)
+        if input_data:
+            print(
+                status_message
+                + f"Recipe data up-to-date, fetching from input file URL: {p.page_url}"
+            )
+            return Recipe(input_data, reused=True)
         return None
 
-    def _write_batch(self, batch_size, output_file):
+    def _stored_recipe(self, p, input_dict):
+        """Return the recipe of the page in input_dict, regardless of its last_modified date"""
+        return input_dict.get(p.page_url) if input_dict else None
+
+    def _classifier_skip(self, status_message, p, input_dict) -> bool:
+        """Return whether the url classifier predicts the page has no recipe. Pages that had a recipe in input_dict are always fetched"""
+        if self.url_classifier is None or (input_dict and p.page_url in input_dict):
+            return False
+        if self.url_classifier.skip(p.page_url):
+            print(
+                status_message
+                + f"Skipping {p.page_url}, predicted not to contain a recipe"
+            )
+            return True
+        return False
+
+    def _scrape_page(self, scrape_count, p, input_dict, len_pages_to_scrape, attempt=1):
+        """Return the Recipe for a sitemap page, either reused from input_dict or scraped.
+        Returns None for pages without recipe, False for pages disallowed by robots.txt, PREDICTED_NO_RECIPE for pages skipped by the url classifier and a RetryLater for pages to retry
+        """
+        status_message = self._status_message(scrape_count, len_pages_to_scrape)
+        if attempt > 1:
+            print(status_message + f"Retrying {p} (attempt {str(attempt)})")
+        else:
+            if not self._fetch_allowed(p):
+                return False
+
+            recipe = self._input_recipe(status_message, p, input_dict)
+            if recipe:
+                return recipe
+
+            if self._classifier_skip(status_message, p, input_dict):
+                return PREDICTED_NO_RECIPE
+
+            print(status_message + f"Scraping {p}")
+
+        return self._scrape_recipe_page(
+            p.page_url,
+            p.last_modified,
+            attempt,
+            stored_recipe=self._stored_recipe(p, input_dict),
+        )
+
+    async def _ascrape_page(
+        self, scrape_count, p, input_dict, len_pages_to_scrape, html_scraper, attempt=1
+    ):
+        """Async counterpart of def _scrape_page"""
+        status_message = self._status_message(scrape_count, len_pages_to_scrape)
+        if attempt > 1:
+            print(status_message + f"Retrying {p} (attempt {str(attempt)})")
+        else:
+            if not self._fetch_allowed(p):
+                return False
+
+            recipe = self._input_recipe(status_message, p, input_dict)
+            if recipe:
+                return recipe
+
+            if self._classifier_skip(status_message, p, input_dict):
+                return PREDICTED_NO_RECIPE
+
+            print(status_message + f"Scraping {p}")
+
+        return await self._ascrape_recipe_page(
+            p.page_url,
+            p.last_modified,
+            html_scraper,
+            attempt,
+            stored_recipe=self._stored_recipe(p, input_dict),
+        )
+
+    def _scrape_pages(self, scraped_pages, input_dict, max_workers):
+        """Yield (page, recipe) tuples in sitemap order.
+        Pages are fetched & parsed on a pool of max_workers threads, keeping at most 2 * max_workers pages in flight.
+        Pages that should be retried are parked on a delayed retry queue, so other pages keep flowing while their backoff expires
+        """
+        # Streamed pages are scraped before the total number of pages is known
+        len_pages_to_scrape = (
+            len(scraped_pages) if hasattr(scraped_pages, "__len__") else "?"
+        )
+        max_workers = max_workers or 1
+
+        pending_pages = enumerate(scraped_pages, start=1)
+        retry_queue = RetryQueue()
+        in_flight = {}
+        # Pages finish out of order. Hold finished pages until all preceding pages are yielded
+        finished_pages = {}
+        next_scrape_count = 1
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+            def submit(scrape_count, p, attempt):
+                future = executor.submit(
+                    self._scrape_page,
+                    scrape_count,
+                    p,
+                    input_dict,
+                    len_pages_to_scrape,
+                    attempt,
+                )
+                in_flight[future] = (scrape_count, p, attempt)
+
+            while True:
+                for scrape_count, p, attempt in retry_queue.pop_due():
+                    submit(scrape_count, p, attempt)
+
+                while len(in_flight) < 2 * max_workers:
+                    next_page = next(pending_pages, None)
+                    if next_page is None:
+                        break
+                    submit(*next_page, 1)
+
+                if not in_flight:
+                    if not retry_queue:
+                        break
+                    time.sleep(retry_queue.seconds_until_due())
+                    continue
+
+                done, _ = wait(
+                    in_flight,
+                    timeout=retry_queue.seconds_until_due(),
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in done:
+                    scrape_count, p, attempt = in_flight.pop(future)
+                    recipe = future.result()
+                    if isinstance(recipe, RetryLater):
+                        retry_queue.push(
+                            (scrape_count, p, attempt + 1), recipe.wait_time
+                        )
+                    else:
+                        finished_pages[scrape_count] = (p, recipe)
+
+                while next_scrape_count in finished_pages:
+                    yield finished_pages.pop(next_scrape_count)
+                    next_scrape_count += 1
+
+    async def _ascrape_pages(self, scraped_pages, input_dict, concurrency):
+        """Yield (scrape_count, page, recipe) tuples in the order pages finish, with at most `concurrency` pages in flight on the event loop.
+        Pages that should be retried are put back on the work queue once their backoff expires, instead of holding a worker while waiting
+        """
+        len_pages_to_scrape = len(scraped_pages)
+        if len_pages_to_scrape == 0:
+            return
+
+        loop = asyncio.get_running_loop()
+        work = asyncio.Queue()
+        for scrape_count, p in enumerate(scraped_pages, start=1):
+            work.put_nowait((scrape_count, p, 1))
+        results = asyncio.Queue()
+
+        async with AsyncHTMLScraper(
+            max_concurrency=concurrency,
+            keep_alive=self.keep_alive,
+            scheduler=self.scheduler,
+            retry_budget=self.retry_budget,
+            max_body_size=self.max_body_size,
+            stop_after_recipe=self.stop_after_recipe,
+            transfer_stats=self.transfer_stats,
+        ) as html_scraper:
+
+            async def worker():
+                while True:
+                    scrape_count, p, attempt = await work.get()
+                    try:
+                        recipe = await self._ascrape_page(
+                            scrape_count,
+                            p,
+                            input_dict,
+                            len_pages_to_scrape,
+                            html_scraper,
+                            attempt,
+                        )
+                    except Exception as ex:
+                        await results.put(ex)
+                        return
+                    if isinstance(recipe, RetryLater):
+                        loop.call_later(
+                            recipe.wait_time,
+                            work.put_nowait,
+                            (scrape_count, p, attempt + 1),
+                        )
+                    else:
+                        await results.put((scrape_count, p, recipe))
+
+            workers = [
+                asyncio.create_task(worker())
+                for _ in range(min(concurrency, len_pages_to_scrape))
+            ]
+            try:
+                for _ in range(len_pages_to_scrape):
+                    result = await results.get()
+                    if isinstance(result, Exception):
+                        raise result
+                    yield result
+            finally:
+                for task in workers:
+                    task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+            self._report_connections(html_scraper)
+
+    def _write_batch(self, batch_size, output_file, output_db=None):
+        """Write the batch to the output once batch_size pages are recorded.
+        Recipes written to a database or JSON Lines file are dropped from memory. For json output, which is rewritten as a whole, they are evicted to a spool file next to the output file
+        """
         self.batch_buffer += 1
-        if self.batch_buffer >= batch_size:
-            recipes_json = self.recipes.to_json()
-            exclusion_list = recipes_json.pop("Pages without Recipe", [])
-            FileHandler(output_file).write_json_file(recipes_json)
-            if exclusion_list:
-                exclusion_dict = {self.url: exclusion_list}
-                FileHandler(output_file).write_exclusion_json_file(exclusion_dict)
-            self.batch_buffer = 0
+        if self.batch_buffer < batch_size:
+            return
+        if output_db is not None:
+            # Upsert the records added since the previous batch in one transaction
+            output_db.upsert(self.recipes.pop_unwritten_records())
+            self.recipes.drop_written()
+        elif is_jsonl_file(output_file):
+            # Only append the records added since the previous batch
+            FileHandler(output_file).append_jsonl_file(
+                self.recipes.pop_unwritten_records()
+            )
+            self.recipes.drop_written()
+        else:
+            # The json output is rewritten as a whole, so the records are not needed
+            self.recipes.pop_unwritten_records()
+            self.recipes.evict(spool_dir=os.path.dirname(output_file) or None)
+            self._write_json_output(output_file)
+        self.batch_buffer = 0
 
-    def scrape_to_json(
+    def _write_json_output(self, output_file):
+        """Write the recipes to the json output file & the pages without recipe to its exclusions file"""
+        FileHandler(output_file).write_json_file(
+            self.recipes.to_json(pages_without_recipe=False)
+        )
+        if self.recipes.pages_without_recipe:
+            ExclusionStore.for_file(output_file).write(
+                self.url, self.recipes.pages_without_recipe
+            )
+
+    def _keep_excluded(self, p, pages_without_recipe):
+        """Return whether an excluded page stays excluded. Pages that changed since they were excluded are removed from pages_without_recipe, to be checked again"""
+        excluded_last_modified = pages_without_recipe[p.page_url]
+        if excluded_last_modified is None:
+            # Excluded before its last modified date was recorded. Keep excluding it, from now on until its date changes
+            pages_without_recipe[p.page_url] = p.last_modified
+            return True
+        if excluded_last_modified != p.last_modified:
+            del pages_without_recipe[p.page_url]
+            return False
+        return True
+
+    def _url_index(self, stored: dict | None) -> UrlIndex:
+        return UrlIndex(stored or (), tracking_params=self.tracking_params)
+
+    def _match_stored_url(self, p, stored: dict, stored_urls: UrlIndex, respelled_urls):
+        """Return whether a sitemap page is in stored, the exclusions or input_dict, under any spelling of its canonical url.
+        A page stored under another spelling is moved to the spelling of the sitemap, and its old spelling is added to respelled_urls to prune it from the output
+        """
+        stored_url = stored_urls.get(p.page_url)
+        if stored_url is None or stored_url not in stored:
+            return False
+        if stored_url != p.page_url:
+            stored[p.page_url] = stored.pop(stored_url)
+            stored_urls.add(p.page_url)
+            respelled_urls.append(stored_url)
+        return True
+
+    def _removed_urls(
         self,
-        *,
-        input_dict: dict | None = None,
-        exclusions_list: list | None = [],
-        output_file: str | None = None,
-        batch_size: int | None = None,
-    ):
+        pages_without_recipe,
+        input_dict,
+        sitemap_urls,
+        respelled_urls,
+        failed_sitemaps,
+    ) -> list:
+        """Return the stored urls whose canonical url is not in the sitemap, together with the old spellings of respelled pages.
+        When a sitemap failed or the sitemap is empty, pages missing from it may still exist, so only the old spellings are returned
+        """
+        removed_urls = dict.fromkeys(respelled_urls)
+        if failed_sitemaps or not sitemap_urls:
+            print(
+                "WARNING: Not removing pages that are missing from the sitemap, since "
+                + (
+                    f"{str(len(failed_sitemaps))} sitemaps could not be fetched"
+                    if failed_sitemaps
+                    else "the sitemap is empty"
+                )
+            )
+            return list(removed_urls)
+        removed_urls.update(
+            dict.fromkeys(
+                url
+                for url in [*pages_without_recipe, *(input_dict or {})]
+                if canonicalize_url(url, self.tracking_params) not in sitemap_urls
+            )
+        )
+        return list(removed_urls)
+
+    def _missing_urls(self, stored, sitemap_urls, removed_urls) -> list:
+        """Return the stored urls whose canonical url is not in the sitemap, but that are not removed since the sitemap is partial or empty.
+        These pages may still exist, so they are kept in the output as they are
+        """
+        removed_urls = set(removed_urls)
+        return [
+            url
+            for url in stored or ()
+            if url not in removed_urls
+            and canonicalize_url(url, self.tracking_params) not in sitemap_urls
+        ]
+
+    def _keep_missing_pages(self, missing_input, missing_excluded, input_dict):
+        """Add the input recipes & exclusions that are missing from a partial sitemap to the output as they are"""
+        for url in missing_input:
+            self.recipes.add_recipe(url, Recipe(input_dict[url], reused=True))
+        if missing_excluded:
+            self.recipes.add_non_recipe_page_list(missing_excluded)
+        if missing_input or missing_excluded:
+            print(
+                f"Kept {str(len(missing_input) + len(missing_excluded))} pages in the output that are missing from the sitemap"
+            )
 
+    def _stream_pages(self, input_dict, exclusions_list):
+        """Streaming counterpart of def _prepare_pages. Return an iterator of the pages to scrape, which yields pages while the sitemaps are still being fetched, together with the cleaned input_dict"""
         pages_without_recipe = self._handle_exclusions_list(exclusions_list, input_dict)
 
         input_dict = self._handle_input_dict(input_dict)
 
-        scraped_pages, filtered_out_urls = SitemapScraper(self.url).scrape()
+        return self._iter_streamed_pages(pages_without_recipe, input_dict), input_dict
 
-        len_scraped_pages = len(scraped_pages)
-        len_filtered_out_urls = len(filtered_out_urls)
-        len_sitemap_pages = len_scraped_pages + len_filtered_out_urls
+    def _iter_streamed_pages(self, pages_without_recipe, input_dict):
+        excluded_urls = self._url_index(pages_without_recipe)
+        input_urls = self._url_index(input_dict)
+        respelled_urls = []
+        sitemap_urls = set()
+        excluded = {}
+        len_sitemap_pages = 0
+        len_filtered_out_urls = 0
+        len_pages_to_recheck = 0
+        len_pages_to_scrape = 0
 
-        if pages_without_recipe:
-            scraped_pages.drop_url_list(pages_without_recipe)
+        sitemap_scraper = SitemapScraper(
+            self.url,
+            user_agent=self.user_agent,
+            sitemap_cache=self.sitemap_cache,
+            transfer_stats=self.transfer_stats,
+            tracking_params=self.tracking_params,
+            include_urls=self.include_urls,
+            exclude_urls=self.exclude_urls,
+        )
+        for p, filtered in sitemap_scraper.stream():
+            len_sitemap_pages += 1
+            sitemap_urls.add(canonicalize_url(p.page_url, self.tracking_params))
+            if filtered:
+                len_filtered_out_urls += 1
+                self._add_filtered_pages([p.page_url])
+                continue
+            if self._match_stored_url(
+                p, pages_without_recipe, excluded_urls, respelled_urls
+            ):
+                if self._keep_excluded(p, pages_without_recipe):
+                    excluded[p.page_url] = pages_without_recipe[p.page_url]
+                    continue
+                len_pages_to_recheck += 1
+            elif input_dict:
+                self._match_stored_url(p, input_dict, input_urls, respelled_urls)
 
-        len_pages_to_scrape = len(scraped_pages)
-        len_pages_without_recipe = len(pages_without_recipe)
+            len_pages_to_scrape += 1
+            yield p
+
+        # Only known once the last sitemap is fetched: which pages are no longer in the sitemap
+        removed_urls = self._removed_urls(
+            pages_without_recipe,
+            input_dict,
+            sitemap_urls,
+            respelled_urls,
+            sitemap_scraper.failed_sitemaps,
+        )
+        if excluded:
+            self.recipes.add_non_recipe_page_list(excluded)
+        for url in removed_urls:
+            self.recipes.remove_page(url)
 
         print(f"Found {str(len_sitemap_pages)} pages in sitemap")
         print(
             f"Found {str(len_filtered_out_urls)} pages in sitemap that should not contain recipes.\n"
-            f"Ignoring {str(len_filtered_out_urls + len_pages_without_recipe)} pages. Continuing with remaining {str(len_pages_to_scrape)} pages"
+            f"Ignored {str(len_sitemap_pages - len_pages_to_scrape)} pages. Scraped remaining {str(len_pages_to_scrape)} pages"
+            + (
+                f", of which {str(len_pages_to_recheck)} excluded pages that changed since they were excluded"
+                if len_pages_to_recheck
+                else ""
+            )
+        )
+        if removed_urls:
+            print(
+                f"Removed {str(len(removed_urls))} pages from the output that are no longer in the sitemap"
+            )
+        self._keep_missing_pages(
+            self._missing_urls(input_dict, sitemap_urls, removed_urls),
+            {
+                url: pages_without_recipe[url]
+                for url in self._missing_urls(
+                    pages_without_recipe, sitemap_urls, removed_urls
+                )
+            },
+            input_dict,
         )
 
-        if len_filtered_out_urls > 0:
-            self.recipes.add_non_recipe_page_list(filtered_out_urls)
+    def plan(
+        self,
+        *,
+        input_dict: dict | None = None,
+        exclusions_list: list | dict | None = None,
+    ) -> CrawlPlan:
+        """Scrape the sitemap & split its pages into new, changed, unchanged, excluded, filtered, removed & missing pages, without fetching any recipe page"""
+        pages_without_recipe = self._handle_exclusions_list(exclusions_list, input_dict)
 
-        if len_pages_without_recipe > 0:
-            self.recipes.add_non_recipe_page_list(pages_without_recipe)
+        input_dict = self._handle_input_dict(input_dict)
 
-        for scrape_count, p in enumerate(scraped_pages, start=1):
-            current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S,%f")[:-3]
-            status_message = f"{current_time} INFO [{str(scrape_count)}/{str(len_pages_to_scrape)}]: "
+        sitemap_scraper = SitemapScraper(
+            self.url,
+            user_agent=self.user_agent,
+            sitemap_cache=self.sitemap_cache,
+            transfer_stats=self.transfer_stats,
+            tracking_params=self.tracking_params,
+            include_urls=self.include_urls,
+            exclude_urls=self.exclude_urls,
+        )
+        scraped_pages, filtered_out_urls = sitemap_scraper.scrape()
 
-            # Proceed if robots.txt allows fetching the url or robots.txt isn't found
-            if self.robots_parser is None or self.robots_parser.can_fetch(
-                self.user_agent, self.url
+        crawl_plan = CrawlPlan(self.url, input_dict)
+        crawl_plan.filtered = list(filtered_out_urls)
+        excluded_urls = self._url_index(pages_without_recipe)
+        input_urls = self._url_index(input_dict)
+        respelled_urls = []
+        sitemap_urls = {
+            canonicalize_url(url, self.tracking_params) for url in filtered_out_urls
+        }
+        for p in scraped_pages:
+            sitemap_urls.add(canonicalize_url(p.page_url, self.tracking_params))
+            if self._match_stored_url(
+                p, pages_without_recipe, excluded_urls, respelled_urls
+            ):
+                if self._keep_excluded(p, pages_without_recipe):
+                    crawl_plan.excluded[p.page_url] = pages_without_recipe[p.page_url]
+                    continue
+                crawl_plan.changed.append(p.page_url)
+            elif input_dict and self._match_stored_url(
+                p, input_dict, input_urls, respelled_urls
             ):
+                if self._reusable_input(p, input_dict):
+                    crawl_plan.unchanged.append(p.page_url)
+                else:
+                    crawl_plan.changed.append(p.page_url)
+            else:
+                crawl_plan.new.append(p.page_url)
+            crawl_plan.pages.add(p)
 
-                input_data = (
-                    self._url_in_input_data(p, input_dict) if input_dict else None
-                )
+        crawl_plan.removed = self._removed_urls(
+            pages_without_recipe,
+            input_dict,
+            sitemap_urls,
+            respelled_urls,
+            sitemap_scraper.failed_sitemaps,
+        )
+        crawl_plan.missing_input = self._missing_urls(
+            input_dict, sitemap_urls, crawl_plan.removed
+        )
+        crawl_plan.missing_excluded = {
+            url: pages_without_recipe[url]
+            for url in self._missing_urls(
+                pages_without_recipe, sitemap_urls, crawl_plan.removed
+            )
+        }
+        return crawl_plan
 
-                if input_data:
-                    recipe = Recipe(input_data)
-                    print(
-                        status_message
-                        + f"Recipe data up-to-date, fetching from input file URL: {p.page_url}"
-                    )
-                else:
-                    print(status_message + f"Scraping {p}")
-                    recipe = self._scrape_recipe_page(p.page_url, p.last_modified)
+    def _add_filtered_pages(self, page_urls):
+        """Add pages filtered out by the url filters to the pages without recipe.
+        Pages filtered out by the include & exclude rules are left out, so they are crawled once the rules change
+        """
+        page_urls = [
+            url for url in page_urls if not self.rule_filter.page_filtered(url)
+        ]
+        if page_urls:
+            self.recipes.add_non_recipe_page_list(page_urls)
 
-                if recipe:
-                    self.recipes.add_recipe(p.page_url, recipe)
-                else:
-                    self.recipes.add_non_recipe_page(p.page_url)
+    def _apply_plan(self, crawl_plan: CrawlPlan):
+        """Return the pages of a crawl plan left to scrape, together with its input_dict.
+        Pages that are filtered out, other than by the include & exclude rules, or excluded are added to the pages without recipe, removed pages are pruned from the output & missing pages are kept in it
+        """
+        len_filtered_out_urls = len(crawl_plan.filtered)
+        len_sitemap_pages = (
+            len(crawl_plan.pages) + len_filtered_out_urls + len(crawl_plan.excluded)
+        )
+
+        print(f"Found {str(len_sitemap_pages)} pages in sitemap")
+        print(
+            f"Found {str(len_filtered_out_urls)} pages in sitemap that should not contain recipes.\n"
+            f"Ignoring {str(len_filtered_out_urls + len(crawl_plan.excluded))} pages. Continuing with remaining {str(len(crawl_plan.pages))} pages"
+        )
+        print(str(crawl_plan))
+
+        if len_filtered_out_urls > 0:
+            self._add_filtered_pages(crawl_plan.filtered)
+
+        if crawl_plan.excluded:
+            self.recipes.add_non_recipe_page_list(crawl_plan.excluded)
+
+        for url in crawl_plan.removed:
+            self.recipes.remove_page(url)
 
+        self._keep_missing_pages(
+            crawl_plan.missing_input, crawl_plan.missing_excluded, crawl_plan.input_dict
+        )
+
+        return crawl_plan.pages, crawl_plan.input_dict
+
+    def _prepare_pages(self, input_dict, exclusions_list):
+        """Scrape the sitemap and return the pages left to scrape, together with the cleaned input_dict.
+        Pages that are filtered out, other than by the include & exclude rules, or excluded are added to the pages without recipe
+        """
+        return self._apply_plan(
+            self.plan(input_dict=input_dict, exclusions_list=exclusions_list)
+        )
+
+    def _record_page(self, p, recipe, batch_size, output_file, output_db=None):
+        """Add the scrape result of a page to self.recipes & write a batch when due.
+        Pages skipped by the url classifier are not recorded, and the classifier only learns from pages fetched in this run
+        """
+        if recipe is not False and recipe is not PREDICTED_NO_RECIPE:
+            if recipe:
+                self.recipes.add_recipe(p.page_url, recipe)
             else:
-                print(
-                    f"Robots.txt does not allow user agent '{self.user_agent}' to scrape URL: {p}"
-                )
+                self.recipes.add_non_recipe_page(p.page_url, p.last_modified)
+            if self.url_classifier is not None and not (recipe and recipe.reused):
+                self.url_classifier.learn(p.page_url, bool(recipe))
+
+        if batch_size:
+            self._write_batch(batch_size, output_file, output_db)
+
+    def _finish_output(self, output_file, output_db, batch_size):
+        """Write the last records to the output database, the JSON Lines output file, which is compacted, or the json output file.
+        With batch_size, the written recipes are dropped from memory & the spool file is removed
+        """
+        if output_db is not None:
+            output_db.upsert(self.recipes.pop_unwritten_records())
+        elif is_jsonl_file(output_file):
+            file_handler = FileHandler(output_file)
+            file_handler.append_jsonl_file(self.recipes.pop_unwritten_records())
+            file_handler.compact_jsonl_file()
+        elif output_file:
+            self.recipes.pop_unwritten_records()
+            self._write_json_output(output_file)
+
+        if batch_size:
+            self.recipes.drop_written()
+
+    def _report_speed(self, len_pages_to_scrape, start_time):
+        elapsed_time = time.perf_counter() - start_time
+        self.pages_per_second = (
+            len_pages_to_scrape / elapsed_time if elapsed_time > 0 else 0.0
+        )
+        print(
+            f"Processed {str(len_pages_to_scrape)} pages in {elapsed_time:.1f} seconds ({self.pages_per_second:.2f} pages/second)"
+        )
+
+    def _report_prefilter(self):
+        if self.prefiltered_pages:
+            print(
+                f"Skipped parsing {str(self.prefiltered_pages)} pages without Recipe Schema markup"
+            )
+
+    def _report_connections(self, html_scraper):
+        print(
+            f"Opened {str(html_scraper.connections_opened)} connections, reused connections for {str(html_scraper.connections_reused)} requests"
+        )
+
+    def scrape_to_json(
+        self,
+        *,
+        input_dict: dict | None = None,
+        exclusions_list: list | dict | None = None,
+        output_file: str | None = None,
+        batch_size: int | None = None,
+        max_workers: int | None = None,
+        output_db: RecipeDatabase | None = None,
+        stream_sitemaps: bool = False,
+        plan: CrawlPlan | None = None,
+        parse_processes: int | None = None,
+    ):
+        """Scrape all sitemap pages. With stream_sitemaps, pages are scraped while the remaining sitemaps are still being fetched.
+        With a plan from def plan, its sitemap pages are scraped without fetching the sitemap again.
+        With parse_processes, pages are fetched on threads & their html is parsed on a pool of parse_processes processes.
+        With an output file or database & batch_size, recipes are dropped from memory once written, so only the pages without recipe are returned
+        """
+        if plan is not None:
+            scraped_pages, input_dict = self._apply_plan(plan)
+        elif stream_sitemaps:
+            scraped_pages, input_dict = self._stream_pages(input_dict, exclusions_list)
+        else:
+            scraped_pages, input_dict = self._prepare_pages(input_dict, exclusions_list)
+
+        start_time = time.perf_counter()
+
+        len_scraped_pages = 0
+        try:
+            with self._parse_pool(parse_processes):
+                for p, recipe in self._scrape_pages(
+                    scraped_pages, input_dict, max_workers
+                ):
+                    self._record_page(p, recipe, batch_size, output_file, output_db)
+                    len_scraped_pages += 1
+        finally:
+            self.html_scraper.close()
+
+        self._report_speed(len_scraped_pages, start_time)
+        self._report_prefilter()
+        if self.url_classifier is not None:
+            self.url_classifier.report()
+        self._report_connections(self.html_scraper)
+        self.transfer_stats.report()
+
+        self._finish_output(output_file, output_db, batch_size)
+
+        recipes_json = self.recipes.to_json()
+        return recipes_json
+
+    async def aiter_recipes(
+        self,
+        *,
+        input_dict: dict | None = None,
+        exclusions_list: list | dict | None = None,
+        concurrency: int = 100,
+    ):
+        """Async generator yielding (page_url, Recipe) tuples as soon as each recipe page is scraped.
+        All results, including pages without recipe, are also collected in self.recipes
+        """
+        scraped_pages, input_dict = await asyncio.to_thread(
+            self._prepare_pages, input_dict, exclusions_list
+        )
+
+        async for _, p, recipe in self._ascrape_pages(
+            scraped_pages, input_dict, concurrency
+        ):
+            self._record_page(p, recipe, None, None)
+            if isinstance(recipe, Recipe):
+                yield p.page_url, recipe
+
+    async def ascrape_to_json(
+        self,
+        *,
+        input_dict: dict | None = None,
+        exclusions_list: list | dict | None = None,
+        output_file: str | None = None,
+        batch_size: int | None = None,
+        concurrency: int = 100,
+        output_db: RecipeDatabase | None = None,
+        parse_processes: int | None = None,
+    ):
+        """Async counterpart of def scrape_to_json, fetching pages on the event loop with at most `concurrency` requests in flight"""
+        scraped_pages, input_dict = await asyncio.to_thread(
+            self._prepare_pages, input_dict, exclusions_list
+        )
+
+        start_time = time.perf_counter()
+
+        # Pages finish out of order. Hold finished pages until all preceding pages are recorded, so output keys keep the sitemap order
+        finished_pages = {}
+        next_scrape_count = 1
+        with self._parse_pool(parse_processes):
+            async for scrape_count, p, recipe in self._ascrape_pages(
+                scraped_pages, input_dict, concurrency
+            ):
+                finished_pages[scrape_count] = (p, recipe)
+                while next_scrape_count in finished_pages:
+                    p, recipe = finished_pages.pop(next_scrape_count)
+                    self._record_page(p, recipe, batch_size, output_file, output_db)
+                    next_scrape_count += 1
+
+        self._report_speed(len(scraped_pages), start_time)
+        self._report_prefilter()
+        if self.url_classifier is not None:
+            self.url_classifier.report()
+        self.transfer_stats.report()
 
-            if batch_size:
-                self._write_batch(batch_size, output_file)
+        self._finish_output(output_file, output_db, batch_size)
 
         recipes_json = self.recipes.to_json()
         return recipes_json
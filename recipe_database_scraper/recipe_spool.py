@@ -0,0 +1,87 @@
+import json
+import tempfile
+from collections.abc import Mapping
+
+
+class RecipeSpool:
+    """Append only temporary file holding JSON encoded recipe dicts, with an in memory index of page url: (offset, length).
+    A page that is spooled again keeps its position in the index, like a key that is set again in a dict
+    """
+
+    def __init__(self, directory: str | None = None):
+        self.directory = directory
+        self.spool_file = tempfile.TemporaryFile(dir=directory, suffix=".spool")
+        self.index = {}
+        self.size = 0
+
+    def __contains__(self, page_url):
+        return page_url in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def write(self, records):
+        """Append (page_url, recipe_dict) records"""
+        chunks = []
+        for page_url, recipe_dict in records:
+            data = json.dumps(recipe_dict).encode("utf-8")
+            self.index[page_url] = (self.size, len(data))
+            self.size += len(data)
+            chunks.append(data)
+        self.spool_file.seek(0, 2)
+        self.spool_file.writelines(chunks)
+        self.spool_file.flush()
+
+    def read(self, page_url) -> dict:
+        offset, length = self.index[page_url]
+        self.spool_file.seek(offset)
+        return json.loads(self.spool_file.read(length))
+
+    def discard(self, page_url):
+        """Drop a page from the index. Its data stays in the file until the spool is closed"""
+        self.index.pop(page_url, None)
+
+    def close(self):
+        self.spool_file.close()
+
+
+class SpooledRecipes(Mapping):
+    """Read only view of the recipes of a Recipes object with a spool, in the same order & format as its json output.
+    Spooled recipes are read from disk on access, so iterating over the view keeps one recipe in memory at a time
+    """
+
+    def __init__(self, recipes, *, pages_without_recipe: bool = True):
+        self.recipes = recipes
+        self.pages_without_recipe = pages_without_recipe
+
+    def _has_pages_without_recipe(self) -> bool:
+        return self.pages_without_recipe and len(self.recipes.pages_without_recipe) > 0
+
+    def __getitem__(self, page_url):
+        if page_url in self.recipes.recipes:
+            return self.recipes.recipes[page_url]
+        if page_url in self.recipes.spool:
+            return self.recipes.spool.read(page_url)
+        if page_url == "Pages without Recipe" and self._has_pages_without_recipe():
+            return list(self.recipes.pages_without_recipe)
+        raise KeyError(page_url)
+
+    def __iter__(self):
+        spool = self.recipes.spool
+        yield from spool
+        yield from (
+            page_url for page_url in self.recipes.recipes if page_url not in spool
+        )
+        if self._has_pages_without_recipe():
+            yield "Pages without Recipe"
+
+    def __len__(self):
+        spool = self.recipes.spool
+        return (
+            len(spool)
+            + sum(page_url not in spool for page_url in self.recipes.recipes)
+            + self._has_pages_without_recipe()
+        )
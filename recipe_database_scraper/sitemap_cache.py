@@ -0,0 +1,194 @@
+import gzip
+import html
+import re
+import threading
+
+import requests
+from usp.web_client.abstract_client import (
+    RETRYABLE_HTTP_STATUS_CODES,
+    AbstractWebClient,
+    AbstractWebClientSuccessResponse,
+    WebClientErrorResponse,
+)
+
+from .get_html import FetchedPage, NOT_MODIFIED, conditional_headers
+from .html_cache import CACHED_HEADERS, HTMLCache
+from .transfer_stats import ACCEPT_ENCODING
+
+INDEX_LASTMOD_HEADER = "X-Index-Lastmod"
+"""Pseudo header under which a cached sitemap keeps the lastmod its parent sitemap index listed for it"""
+
+SITEMAP_REQUEST_TIMEOUT = (9.05, 60)
+"""Connect & read timeout in seconds, same as ultimate-sitemap-parser. Sitemaps can be generated on the fly, so reads can take long"""
+
+RE_INDEX_SITEMAP = re.compile(
+    rb"<(?:\w+:)?sitemap\b[^>]*>(.*?)</(?:\w+:)?sitemap>", re.IGNORECASE | re.DOTALL
+)
+RE_LOC = re.compile(
+    rb"<(?:\w+:)?loc\b[^>]*>(.*?)</(?:\w+:)?loc>", re.IGNORECASE | re.DOTALL
+)
+RE_LASTMOD = re.compile(
+    rb"<(?:\w+:)?lastmod\b[^>]*>(.*?)</(?:\w+:)?lastmod>", re.IGNORECASE | re.DOTALL
+)
+
+
+class SitemapCache(HTMLCache):
+    """On-disk cache of raw sitemap responses, keyed by sitemap URL"""
+
+    cached_headers = CACHED_HEADERS + (INDEX_LASTMOD_HEADER,)
+
+
+class CachedSitemapResponse(AbstractWebClientSuccessResponse):
+    """Successful sitemap response, either fetched or served from the sitemap cache"""
+
+    def __init__(self, url: str, data: bytes, headers: dict, *, status_code=200):
+        self._url = url
+        self._data = data
+        self._headers = {name.lower(): value for name, value in headers.items()}
+        self._status_code = status_code
+
+    def status_code(self) -> int:
+        return self._status_code
+
+    def status_message(self) -> str:
+        return "OK"
+
+    def header(self, case_insensitive_name: str) -> str | None:
+        return self._headers.get(case_insensitive_name.lower())
+
+    def raw_data(self) -> bytes:
+        return self._data
+
+    def url(self) -> str:
+        return self._url
+
+
+def index_lastmods(data: bytes) -> dict:
+    """Return {sub-sitemap url: lastmod} for the sub-sitemaps of a sitemap index that list a lastmod"""
+    if data[:2] == b"\x1f\x8b":
+        try:
+            data = gzip.decompress(data)
+        except OSError:
+            return {}
+    if b"sitemapindex" not in data[:2048].lower():
+        return {}
+
+    lastmods = {}
+    for sitemap_match in RE_INDEX_SITEMAP.finditer(data):
+        loc = RE_LOC.search(sitemap_match.group(1))
+        lastmod = RE_LASTMOD.search(sitemap_match.group(1))
+        if loc and lastmod:
+            url = html.unescape(loc.group(1).decode("utf-8", "replace").strip())
+            lastmods[url] = lastmod.group(1).decode("utf-8", "replace").strip()
+    return lastmods
+
+
+class SitemapCacheWebClient(AbstractWebClient):
+    """ultimate-sitemap-parser web client backed by a SitemapCache.
+    Sub-sitemaps whose lastmod in the parent sitemap index is unchanged are served from the cache without a request.
+    Other cached sitemaps are requested conditionally with their ETag & Last-Modified validators, and reused when the server answers "304 Not Modified".
+    Without sitemap cache every sitemap is requested. The bytes of all responses are counted in transfer_stats
+    """
+
+    def __init__(
+        self,
+        sitemap_cache: SitemapCache | None,
+        *,
+        session: requests.Session | None = None,
+        user_agent: str | None = None,
+        transfer_stats=None,
+    ):
+        self.sitemap_cache = sitemap_cache
+        self.session = session or requests.Session()
+        self.user_agent = user_agent
+        self.transfer_stats = transfer_stats
+        self.max_response_data_length = None
+        self.served_from_cache = 0
+        self.requests_sent = 0
+        self.not_modified = 0
+        # Sub-sitemap url: lastmod, as listed in the sitemap indexes fetched so far
+        self.index_lastmods = {}
+        self._lock = threading.Lock()
+
+    def report(self):
+        if self.sitemap_cache is None:
+            return
+        print(
+            f"Sitemap cache: reused {str(self.served_from_cache)} unchanged sitemaps without a request, {str(self.not_modified)} of {str(self.requests_sent)} requested sitemaps were not modified"
+        )
+
+    def set_max_response_data_length(self, max_response_data_length: int | None):
+        self.max_response_data_length = max_response_data_length
+
+    def _response(self, url: str, data: bytes, headers: dict):
+        with self._lock:
+            self.index_lastmods.update(index_lastmods(data))
+        if self.max_response_data_length:
+            data = data[: self.max_response_data_length]
+        return CachedSitemapResponse(url, data, headers)
+
+    def _store(self, url: str, content: bytes, headers: dict, index_lastmod):
+        if self.sitemap_cache is None:
+            return
+        headers = dict(headers)
+        if index_lastmod:
+            headers[INDEX_LASTMOD_HEADER] = index_lastmod
+        self.sitemap_cache.put(FetchedPage(url, content, headers=headers))
+
+    def get(self, url: str):
+        cached = self.sitemap_cache.get(url) if self.sitemap_cache else None
+        with self._lock:
+            index_lastmod = self.index_lastmods.get(url)
+
+        if (
+            cached is not None
+            and index_lastmod
+            and cached.headers.get(INDEX_LASTMOD_HEADER) == index_lastmod
+        ):
+            with self._lock:
+                self.served_from_cache += 1
+            return self._response(url, cached.content, cached.headers)
+
+        headers = {"Accept-Encoding": ACCEPT_ENCODING}
+        if self.user_agent:
+            headers["User-Agent"] = self.user_agent
+        if cached is not None:
+            headers.update(conditional_headers(cached.etag, cached.last_modified))
+
+        try:
+            response = self.session.get(
+                url, headers=headers, timeout=SITEMAP_REQUEST_TIMEOUT
+            )
+        except requests.exceptions.Timeout as ex:
+            return WebClientErrorResponse(message=str(ex), retryable=True)
+        except requests.exceptions.RequestException as ex:
+            return WebClientErrorResponse(message=str(ex), retryable=False)
+        with self._lock:
+            self.requests_sent += 1
+        if self.transfer_stats is not None:
+            self.transfer_stats.record(
+                url,
+                (
+                    response.raw.tell()
+                    if hasattr(response.raw, "tell")
+                    else len(response.content)
+                ),
+                len(response.content),
+            )
+
+        if response.status_code == NOT_MODIFIED and cached is not None:
+            with self._lock:
+                self.not_modified += 1
+            # Remember the new index lastmod, so the next run can skip the request
+            if index_lastmod != cached.headers.get(INDEX_LASTMOD_HEADER):
+                self._store(url, cached.content, cached.headers, index_lastmod)
+            return self._response(url, cached.content, cached.headers)
+
+        if 200 <= response.status_code < 300:
+            self._store(url, response.content, response.headers, index_lastmod)
+            return self._response(url, response.content, response.headers)
+
+        return WebClientErrorResponse(
+            message=f"{response.status_code} {response.reason}",
+            retryable=response.status_code in RETRYABLE_HTTP_STATUS_CODES,
+        )
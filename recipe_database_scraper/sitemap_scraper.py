@@ -1,6 +1,19 @@
+import datetime
+import functools
+import queue
+import threading
+from array import array
+from collections import deque
+
+from usp.fetch_parse import SitemapFetcher
+from usp.objects.sitemap import AbstractIndexSitemap, InvalidSitemap
 from usp.tree import sitemap_tree_for_homepage
 
-from ._utils import is_valid_url, strip_url_to_homepage
+from .sitemap_cache import SitemapCache, SitemapCacheWebClient
+from .transfer_stats import TransferStats
+from .url_filters import UrlFilter
+from ._urls import TRACKING_QUERY_PARAMS, canonicalize_url, is_valid_url
+from ._utils import strip_url_to_homepage
 from ._exceptions import SitemapScraperException
 
 SITEMAP_FILTER_KEYWORDS = {
@@ -85,14 +98,27 @@ URL_FILTER_KEYWORDS = {
     ".gif",
     ".pdf",
 }
-"""Url extensions for pages in the sitemap that should not be crawled"""
+"""Url extensions for pages in the sitemap that should not be crawled, matched on the last path segment"""
 
 
 class Page:
+    __slots__ = ("page_url", "last_modified")
+
     def __init__(self, url, last_modified):
         self.page_url = url
         self.last_modified = last_modified
 
+    def __eq__(self, other):
+        if not isinstance(other, Page):
+            return NotImplemented
+        return (self.page_url, self.last_modified) == (
+            other.page_url,
+            other.last_modified,
+        )
+
+    def __hash__(self):
+        return hash((self.page_url, self.last_modified))
+
     def __str__(self):
         last_modified_value = (
             "Unknown" if self.last_modified is None else self.last_modified
@@ -100,120 +126,356 @@ class Page:
         return f"URL: {self.page_url}, Last Modified: {last_modified_value}"
 
 
+UNKNOWN_LAST_MODIFIED = -(2**63)
+"""Epoch seconds stored for pages without last modified date"""
+
+NAIVE_OFFSET = -32768
+"""Utc offset minutes stored for last modified datetimes without timezone"""
+
+DATE_ONLY_OFFSET = -32767
+"""Utc offset minutes stored for last modified dates without time"""
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def _epoch_seconds(date_time: datetime.datetime) -> int:
+    if date_time.tzinfo is None:
+        return (date_time - EPOCH) // datetime.timedelta(seconds=1)
+    return int(date_time.timestamp())
+
+
+def _encode_last_modified(last_modified: str | None) -> tuple[int, int] | None:
+    """Encode an ISO format last modified string as (epoch seconds, utc offset minutes).
+    Returns None for values that would not decode to the exact same string, e.g. with microseconds, which are stored as is
+    """
+    if last_modified is None:
+        return UNKNOWN_LAST_MODIFIED, 0
+    if not isinstance(last_modified, str):
+        return None
+    try:
+        if len(last_modified) == 10:
+            date = datetime.date.fromisoformat(last_modified)
+            encoded = (
+                _epoch_seconds(datetime.datetime(date.year, date.month, date.day)),
+                DATE_ONLY_OFFSET,
+            )
+        else:
+            date_time = datetime.datetime.fromisoformat(last_modified)
+            utc_offset = date_time.utcoffset()
+            encoded = (
+                _epoch_seconds(date_time),
+                (
+                    NAIVE_OFFSET
+                    if utc_offset is None
+                    else utc_offset // datetime.timedelta(minutes=1)
+                ),
+            )
+        if _decode_last_modified(*encoded) == last_modified:
+            return encoded
+    except (ValueError, OverflowError, OSError):
+        pass
+    return None
+
+
+def _decode_last_modified(epoch_seconds: int, utc_offset: int) -> str | None:
+    if epoch_seconds == UNKNOWN_LAST_MODIFIED:
+        return None
+    if utc_offset in (NAIVE_OFFSET, DATE_ONLY_OFFSET):
+        date_time = EPOCH + datetime.timedelta(seconds=epoch_seconds)
+        if utc_offset == DATE_ONLY_OFFSET:
+            return date_time.date().isoformat()
+        return date_time.isoformat()
+    return datetime.datetime.fromtimestamp(
+        epoch_seconds, _timezone(utc_offset)
+    ).isoformat()
+
+
+@functools.lru_cache(maxsize=None)
+def _timezone(utc_offset: int) -> datetime.timezone:
+    return datetime.timezone(datetime.timedelta(minutes=utc_offset))
+
+
+def _split_url(url: str) -> tuple[str, str]:
+    """Split a url in its scheme & host prefix, shared by most pages of a sitemap, and the remainder"""
+    host_start = url.find("://")
+    if host_start == -1:
+        return "", url
+    path_start = url.find("/", host_start + 3)
+    if path_start == -1:
+        return url, ""
+    return url[:path_start], url[path_start:]
+
+
 class Pages:
+    """Sitemap pages in parallel arrays instead of a list of Page objects, to keep million url sitemaps in memory.
+    Host prefixes are interned, url remainders are stored utf-8 encoded in one buffer & last modified dates as epoch seconds.
+    Iteration & indexing return Page objects, which are created on access
+    """
+
     def __init__(self):
-        self.pages = []
+        self._hosts = []
+        self._host_ids = {}
+        self._page_hosts = array("I")
+        self._paths = bytearray()
+        self._path_ends = array("Q")
+        self._last_modified = array("q")
+        self._utc_offsets = array("h")
+        # Index: last modified strings that do not round trip through epoch seconds
+        self._raw_last_modified = {}
 
     def __iter__(self):
-        return iter(self.pages)
+        for index in range(len(self)):
+            yield self._page(index)
 
     def __len__(self):
-        return len(self.pages)
+        return len(self._path_ends)
 
     def __getitem__(self, list_number):
-        return self.pages[list_number]
+        if isinstance(list_number, slice):
+            return [self._page(index) for index in range(len(self))[list_number]]
+        return self._page(range(len(self))[list_number])
+
+    def _url(self, index: int) -> str:
+        path_start = self._path_ends[index - 1] if index else 0
+        return self._hosts[self._page_hosts[index]] + self._paths[
+            path_start : self._path_ends[index]
+        ].decode("utf-8", "surrogatepass")
+
+    def _page(self, index: int) -> Page:
+        if index in self._raw_last_modified:
+            last_modified = self._raw_last_modified[index]
+        else:
+            last_modified = _decode_last_modified(
+                self._last_modified[index], self._utc_offsets[index]
+            )
+        return Page(self._url(index), last_modified)
+
+    def _append(self, url: str, last_modified_fields: tuple, raw_last_modified):
+        host, path = _split_url(url)
+        host_id = self._host_ids.get(host)
+        if host_id is None:
+            host_id = self._host_ids[host] = len(self._hosts)
+            self._hosts.append(host)
+        if raw_last_modified is not None:
+            self._raw_last_modified[len(self)] = raw_last_modified
+        self._page_hosts.append(host_id)
+        self._paths += path.encode("utf-8", "surrogatepass")
+        self._path_ends.append(len(self._paths))
+        self._last_modified.append(last_modified_fields[0])
+        self._utc_offsets.append(last_modified_fields[1])
+
+    def add(self, page: Page):
+        encoded = _encode_last_modified(page.last_modified)
+        if encoded is None:
+            self._append(page.page_url, (UNKNOWN_LAST_MODIFIED, 0), page.last_modified)
+        else:
+            self._append(page.page_url, encoded, None)
 
     def add_list(self, page_list: list):
-        self.pages.extend(page_list)
+        for page in page_list:
+            self.add(page)
 
-    def drop_url_list(self, url_list: list):
-        self.pages = [page for page in self.pages if page.page_url not in url_list]
+    def drop_url_list(self, url_list: list | set | dict):
+        # Hash based membership, so dropping stays linear in the number of pages for large exclusion lists
+        url_set = (
+            url_list if isinstance(url_list, (set, frozenset, dict)) else set(url_list)
+        )
+        kept_pages = Pages()
+        for index in range(len(self)):
+            url = self._url(index)
+            if url in url_set:
+                continue
+            kept_pages._append(
+                url,
+                (self._last_modified[index], self._utc_offsets[index]),
+                self._raw_last_modified.get(index),
+            )
+        self.__dict__.update(kept_pages.__dict__)
 
 
 class SitemapScraper:
-    def __init__(self, homepage):
+    def __init__(
+        self,
+        homepage,
+        *,
+        user_agent: str | None = None,
+        sitemap_cache: SitemapCache | None = None,
+        transfer_stats: TransferStats | None = None,
+        tracking_params: frozenset = TRACKING_QUERY_PARAMS,
+        include_urls: list | None = None,
+        exclude_urls: list | None = None,
+    ):
         self.homepage = homepage
+        self.tracking_params = tracking_params
+        self.url_filter = UrlFilter(
+            SITEMAP_FILTER_KEYWORDS,
+            URL_FILTER_KEYWORDS,
+            include=include_urls,
+            exclude=exclude_urls,
+        )
         self.pages = Pages()
         self.filtered_out_urls = []
+        # Urls of (sub-)sitemaps that could not be fetched or parsed, so pages missing from the sitemap may still exist
+        self.failed_sitemaps = []
         self.sitemap_tree = None
+        self.web_client = SitemapCacheWebClient(
+            sitemap_cache, user_agent=user_agent, transfer_stats=transfer_stats
+        )
 
     def _scrape_sitemap(self):
         """Retrieve a tree of AbstractSitemap subclass objects that represent the sitemap, including webpages, see https://ultimate-sitemap-parser.readthedocs.io/en/latest/usp.objects.html#module-usp.objects.sitemap"""
         stripped_homepage = strip_url_to_homepage(self.homepage)
         try:
-            self.sitemap_tree = sitemap_tree_for_homepage(stripped_homepage)
+            self.sitemap_tree = sitemap_tree_for_homepage(
+                stripped_homepage, web_client=self.web_client
+            )
         except Exception as e:
             raise SitemapScraperException(self.homepage, stripped_homepage, e)
 
-    def _get_all_pages(self) -> list:
-        """Return a list of sitemap page objects"""
-
-        def _get_pages(sitemap):
-            """Recursively extract page objects from the sitemap and it's sub-sitemaps.
-            The all_pages() iterator can in some instances capture pages of sub-sitemaps. Therefore, loop through the sub-sitemaps and dedouble the urls at the end
-            """
-
-            all_pages = []
-
-            all_pages.extend([page for page in sitemap.all_pages()])
-
-            for sub_sitemap in getattr(sitemap, "sub_sitemaps", []):
-                all_pages.extend(_get_pages(sub_sitemap))
-
-            return all_pages
+    def _walk_sitemap(self, sitemap, filtered, seen_urls, seen_sitemap_urls=None):
+        """Yield (sitemap page, filtered) tuples for the unique pages of a sitemap and its sub-sitemaps.
+        Pages are filtered out when their url ends with URL_FILTER_KEYWORDS or does not pass the include & exclude rules, or when they are listed in a (sub-)sitemap matching SITEMAP_FILTER_KEYWORDS
+        """
+        filtered = filtered or self.url_filter.sitemap_filtered(sitemap.url)
+        if seen_sitemap_urls is not None:
+            seen_sitemap_urls.add(sitemap.url)
+        if isinstance(sitemap, InvalidSitemap):
+            self.failed_sitemaps.append(sitemap.url)
+
+        # The all_pages() iterator of an index sitemap yields the pages of all its sub-sitemaps, which are visited below
+        if not isinstance(sitemap, AbstractIndexSitemap):
+            for page in sitemap.all_pages():
+                # Remove duplicate pages on canonical url, since usp's page object __eq__ method is unreliable for this
+                url_key = canonicalize_url(page.url, self.tracking_params)
+                if url_key in seen_urls:
+                    continue
+                seen_urls.add(url_key)
+
+                yield page, filtered or self.url_filter.page_filtered(page.url)
+
+        for sub_sitemap in getattr(sitemap, "sub_sitemaps", []):
+            yield from self._walk_sitemap(
+                sub_sitemap, filtered, seen_urls, seen_sitemap_urls
+            )
 
-        # Remove potential duplicate pages using page URLs in dict method - since set() method may encounter issues with usp's page object __eq__ method
-        page_dict = {page.url.lower(): page for page in _get_pages(self.sitemap_tree)}
-        pages_list = list(page_dict.values())
+    def _iter_pages(self):
+        """Yield (sitemap page, filtered) tuples for every unique page in the sitemap tree, in a single pass"""
+        yield from self._walk_sitemap(self.sitemap_tree, False, set())
 
-        return pages_list
+    def _iter_pages_streaming(self):
+        """Yield (sitemap page, filtered) tuples while the sitemap tree is being fetched.
+        Sub-sitemaps of index sitemaps are deferred & fetched one at a time, so pages of the first sitemaps are available before the last sitemaps are downloaded
+        """
+        deferred_sitemaps = deque()
 
-    def _get_filter_urls(self) -> list:
-        """Return a list of urls filtered from the sitemap pages for specified keywords."""
+        def defer_sub_sitemaps(urls, recursion_level, parent_urls):
+            deferred_sitemaps.append((urls, recursion_level, parent_urls))
+            return []
 
-        def _filter_out_pages(sitemap):
-            """Recursively extract page objects from the sitemap  and it's sub-sitemaps that match unwanted URLs or sitemaps.
-            The all_pages() iterator can in some instances capture pages of sub-sitemaps. Therefore, loop through the sub-sitemaps and dedouble the urls at the end
-            """
+        stripped_homepage = strip_url_to_homepage(self.homepage)
+        try:
+            self.sitemap_tree = sitemap_tree_for_homepage(
+                stripped_homepage,
+                web_client=self.web_client,
+                recurse_list_callback=defer_sub_sitemaps,
+            )
+        except Exception as e:
+            raise SitemapScraperException(self.homepage, stripped_homepage, e)
 
-            filter_page_urls = []
+        seen_urls = set()
+        seen_sitemap_urls = set()
+        yield from self._walk_sitemap(
+            self.sitemap_tree, False, seen_urls, seen_sitemap_urls
+        )
 
-            if any(word in sitemap.url.lower() for word in SITEMAP_FILTER_KEYWORDS):
-                filter_page_urls.extend([page.url for page in sitemap.all_pages()])
-            else:
-                filter_page_urls.extend(
-                    [
-                        page.url
-                        for page in sitemap.all_pages()
-                        if any(word in page.url.lower() for word in URL_FILTER_KEYWORDS)
-                    ]
+        while deferred_sitemaps:
+            urls, recursion_level, parent_urls = deferred_sitemaps.popleft()
+            # A sub-sitemap inherits the filter of any of the sitemaps it is listed in
+            filtered = any(
+                self.url_filter.sitemap_filtered(parent_url)
+                for parent_url in parent_urls
+            )
+            for url in urls:
+                if url in seen_sitemap_urls:
+                    continue
+                try:
+                    sub_sitemap = SitemapFetcher(
+                        url=url,
+                        recursion_level=recursion_level + 1,
+                        web_client=self.web_client,
+                        parent_urls=parent_urls,
+                        recurse_list_callback=defer_sub_sitemaps,
+                    ).sitemap()
+                except Exception as e:
+                    # Same as ultimate-sitemap-parser, skip sub-sitemaps that cannot be fetched
+                    print(f"WARNING: Unable to add sub-sitemap from URL {url}: {e}")
+                    self.failed_sitemaps.append(url)
+                    continue
+                yield from self._walk_sitemap(
+                    sub_sitemap, filtered, seen_urls, seen_sitemap_urls
                 )
 
-            # Sitemaps can contain sub_sitemaps. Recursively extract URLs from sub-sitemaps
-            for sub_sitemap in getattr(sitemap, "sub_sitemaps", []):
-                filter_page_urls.extend(_filter_out_pages(sub_sitemap))
-
-            return filter_page_urls
-
-        # Remove potential duplicate filtered pages
-        urls_dedoubled = set(_filter_out_pages(self.sitemap_tree))
-        url_list = list(urls_dedoubled)
-
-        return url_list
+        self.web_client.report()
+
+    def stream(self, max_queued_pages: int = 10000):
+        """Yield (Page, filtered) tuples as soon as their sitemap is parsed.
+        Sitemaps are fetched on a background thread, which waits when max_queued_pages pages are waiting to be consumed
+        """
+        print(f"Streaming sitemaps of {self.homepage} in order to fetch all webpages")
+        page_queue = queue.Queue(maxsize=max_queued_pages)
+        stopped = threading.Event()
+
+        def put(item):
+            # Give up when the consumer stopped, instead of blocking on a full queue forever
+            while not stopped.is_set():
+                try:
+                    page_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                for sitemap_page, filtered in self._iter_pages_streaming():
+                    if not put((self._to_page(sitemap_page), filtered)):
+                        return
+            except Exception as e:
+                put(e)
+                return
+            put(None)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = page_queue.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stopped.set()
+
+    @staticmethod
+    def _to_page(sitemap_page) -> Page:
+        return Page(
+            sitemap_page.url,
+            getattr(
+                sitemap_page.last_modified, "isoformat", lambda: None
+            )(),  # Fallback to None in case sitemaps do not capture last modified dates
+        )
 
     def _scrape_domain(self):
         """Populate self.pages with Page objects of url & last modified date for filtered pages & populate self.filtered_out_urls list with all other urls"""
         self._scrape_sitemap()
 
-        all_pages = self._get_all_pages()
-
-        self.filtered_out_urls = self._get_filter_urls()
-        filter_urls_set = set(
-            self.filtered_out_urls
-        )  # Convert list of urls to set for faster membership checking
-
-        filtered_page_list = [
-            Page(
-                p.url,
-                getattr(
-                    p.last_modified, "isoformat", lambda: None
-                )(),  # Fallback to None in case sitemaps do not capture last modified dates
-            )
-            for p in all_pages
-            if p.url not in filter_urls_set
-        ]
-
-        self.pages.add_list(filtered_page_list)
+        for sitemap_page, filtered in self._iter_pages():
+            if filtered:
+                self.filtered_out_urls.append(sitemap_page.url)
+            else:
+                self.pages.add(self._to_page(sitemap_page))
 
     def scrape(self) -> tuple[Pages, list]:
         if is_valid_url(self.homepage):
@@ -221,6 +483,7 @@ class SitemapScraper:
                 f"Retrieving sitemaps of {self.homepage} in order to fetch all webpages"
             )
             self._scrape_domain()
+            self.web_client.report()
 
             return self.pages, self.filtered_out_urls
         else:
@@ -0,0 +1,205 @@
+import datetime
+import json
+import sqlite3
+
+from ._urls import url_host
+from ._utils import REMOVED_PAGE, is_page_without_recipe
+
+FETCH_METADATA_KEYS = ("etag", "http_last_modified")
+"""Recipe keys that are stored in the fetch_metadata table instead of the recipe json"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS recipes (
+    url TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    last_modified TEXT,
+    recipe TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_recipes_host ON recipes (host);
+CREATE INDEX IF NOT EXISTS idx_recipes_last_modified ON recipes (last_modified);
+
+CREATE TABLE IF NOT EXISTS exclusions (
+    url TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    last_modified TEXT,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_exclusions_host ON exclusions (host);
+
+CREATE TABLE IF NOT EXISTS fetch_metadata (
+    url TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    etag TEXT,
+    http_last_modified TEXT,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_fetch_metadata_host ON fetch_metadata (host);
+"""
+
+# Only rewrite rows whose content changed, so incremental runs leave unchanged recipes untouched
+UPSERT_RECIPE = """
+INSERT INTO recipes (url, host, last_modified, recipe, updated_at)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (url) DO UPDATE SET
+    host = excluded.host,
+    last_modified = excluded.last_modified,
+    recipe = excluded.recipe,
+    updated_at = excluded.updated_at
+WHERE recipes.recipe IS NOT excluded.recipe
+    OR recipes.last_modified IS NOT excluded.last_modified
+"""
+
+UPSERT_FETCH_METADATA = """
+INSERT INTO fetch_metadata (url, host, etag, http_last_modified, updated_at)
+VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (url) DO UPDATE SET
+    etag = excluded.etag,
+    http_last_modified = excluded.http_last_modified,
+    updated_at = excluded.updated_at
+WHERE fetch_metadata.etag IS NOT excluded.etag
+    OR fetch_metadata.http_last_modified IS NOT excluded.http_last_modified
+"""
+
+UPSERT_EXCLUSION = """
+INSERT INTO exclusions (url, host, last_modified, updated_at) VALUES (?, ?, ?, ?)
+ON CONFLICT (url) DO UPDATE SET
+    last_modified = excluded.last_modified,
+    updated_at = excluded.updated_at
+WHERE exclusions.last_modified IS NOT excluded.last_modified
+"""
+
+
+def _host(url: str) -> str:
+    return url_host(url)
+
+
+class RecipeDatabase:
+    """SQLite database of recipes, pages without recipe & fetch metadata of any number of sites"""
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(SCHEMA)
+        self._migrate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def _migrate(self):
+        """Add columns that are missing in databases created by older versions"""
+        exclusion_columns = {
+            row[1] for row in self.connection.execute("PRAGMA table_info(exclusions)")
+        }
+        if "last_modified" not in exclusion_columns:
+            with self.connection:
+                self.connection.execute(
+                    "ALTER TABLE exclusions ADD COLUMN last_modified TEXT"
+                )
+
+    def upsert(self, records: list):
+        """Write (page_url, recipe_dict) records in a single transaction. A recipe_dict of None or PageWithoutRecipe marks a page without recipe, REMOVED_PAGE a page that is deleted"""
+        updated_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        recipe_rows = []
+        fetch_metadata_rows = []
+        exclusion_rows = []
+        removed_urls = []
+        for page_url, recipe_dict in records:
+            host = _host(page_url)
+            if recipe_dict is REMOVED_PAGE:
+                removed_urls.append((page_url,))
+                continue
+            if is_page_without_recipe(recipe_dict):
+                exclusion_rows.append(
+                    (
+                        page_url,
+                        host,
+                        getattr(recipe_dict, "last_modified", None),
+                        updated_at,
+                    )
+                )
+                continue
+
+            recipe_dict = dict(recipe_dict)
+            fetch_metadata = [recipe_dict.pop(key, None) for key in FETCH_METADATA_KEYS]
+            recipe_rows.append(
+                (
+                    page_url,
+                    host,
+                    recipe_dict.get("last_modified"),
+                    json.dumps(recipe_dict),
+                    updated_at,
+                )
+            )
+            if any(fetch_metadata):
+                fetch_metadata_rows.append(
+                    (page_url, host, *fetch_metadata, updated_at)
+                )
+
+        recipe_urls = [(row[0],) for row in recipe_rows]
+        exclusion_urls = [(row[0],) for row in exclusion_rows]
+        with self.connection:
+            self.connection.executemany(UPSERT_RECIPE, recipe_rows)
+            self.connection.executemany(UPSERT_FETCH_METADATA, fetch_metadata_rows)
+            self.connection.executemany(
+                "DELETE FROM exclusions WHERE url = ?", recipe_urls
+            )
+            self.connection.executemany(UPSERT_EXCLUSION, exclusion_rows)
+            self.connection.executemany(
+                "DELETE FROM recipes WHERE url = ?", exclusion_urls
+            )
+            self.connection.executemany(
+                "DELETE FROM fetch_metadata WHERE url = ?", exclusion_urls
+            )
+            for table in ("recipes", "exclusions", "fetch_metadata"):
+                self.connection.executemany(
+                    f"DELETE FROM {table} WHERE url = ?", removed_urls
+                )
+
+    def load_site(self, url: str) -> dict | None:
+        """Return the stored pages of the host of url in the same format as the json output, or None if nothing is stored"""
+        host = _host(url)
+        content = {}
+        rows = self.connection.execute(
+            """
+            SELECT recipes.url, recipes.recipe, fetch_metadata.etag, fetch_metadata.http_last_modified
+            FROM recipes LEFT JOIN fetch_metadata ON fetch_metadata.url = recipes.url
+            WHERE recipes.host = ?
+            ORDER BY recipes.rowid
+            """,
+            (host,),
+        )
+        for page_url, recipe, *fetch_metadata in rows:
+            recipe_dict = json.loads(recipe)
+            for key, value in zip(FETCH_METADATA_KEYS, fetch_metadata):
+                if value is not None:
+                    recipe_dict[key] = value
+            content[page_url] = recipe_dict
+
+        pages_without_recipe = [
+            page_url
+            for (page_url,) in self.connection.execute(
+                "SELECT url FROM exclusions WHERE host = ? ORDER BY rowid", (host,)
+            )
+        ]
+        if pages_without_recipe:
+            content["Pages without Recipe"] = pages_without_recipe
+
+        return content or None
+
+    def load_exclusions(self, url: str) -> dict:
+        """Return the pages without recipe of the host of url as dict of url: last modified date"""
+        return dict(
+            self.connection.execute(
+                "SELECT url, last_modified FROM exclusions WHERE host = ? ORDER BY rowid",
+                (_host(url),),
+            )
+        )
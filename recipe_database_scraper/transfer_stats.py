@@ -0,0 +1,73 @@
+import threading
+
+from ._urls import url_host
+
+try:
+    from urllib3.util.request import ACCEPT_ENCODING as URLLIB3_ACCEPT_ENCODING
+except ImportError:  # urllib3 < 1.26
+    URLLIB3_ACCEPT_ENCODING = "gzip,deflate"
+
+ACCEPT_ENCODING = ", ".join(
+    encoding.strip() for encoding in URLLIB3_ACCEPT_ENCODING.split(",")
+)
+"""Content encodings that requests can decode: gzip & deflate, plus br & zstd when their optional decoders are installed."""
+
+
+def _format_bytes(n_bytes: int) -> str:
+    return f"{n_bytes / 1024**2:.2f} MB"
+
+
+class TransferStats:
+    """Bytes received on the wire, before decompression, and content bytes, after decompression, per host & in total"""
+
+    def __init__(self):
+        # Host: [responses, wire_bytes, content_bytes]
+        self.hosts = {}
+        self._lock = threading.Lock()
+
+    def record(self, url: str, wire_bytes: int, content_bytes: int):
+        host = url_host(url)
+        with self._lock:
+            host_stats = self.hosts.setdefault(host, [0, 0, 0])
+            host_stats[0] += 1
+            host_stats[1] += wire_bytes
+            host_stats[2] += content_bytes
+
+    @property
+    def responses(self) -> int:
+        return sum(host_stats[0] for host_stats in self.hosts.values())
+
+    @property
+    def wire_bytes(self) -> int:
+        return sum(host_stats[1] for host_stats in self.hosts.values())
+
+    @property
+    def content_bytes(self) -> int:
+        return sum(host_stats[2] for host_stats in self.hosts.values())
+
+    def to_json(self) -> dict:
+        return {
+            "responses": self.responses,
+            "wire_bytes": self.wire_bytes,
+            "content_bytes": self.content_bytes,
+            "hosts": {
+                host: {
+                    "responses": responses,
+                    "wire_bytes": wire_bytes,
+                    "content_bytes": content_bytes,
+                }
+                for host, (responses, wire_bytes, content_bytes) in self.hosts.items()
+            },
+        }
+
+    def report(self):
+        if not self.hosts:
+            return
+        print(
+            f"Downloaded {_format_bytes(self.wire_bytes)} on the wire for {_format_bytes(self.content_bytes)} of content in {str(self.responses)} responses"
+        )
+        if len(self.hosts) > 1:
+            for host, (responses, wire_bytes, content_bytes) in self.hosts.items():
+                print(
+                    f"- {host}: {_format_bytes(wire_bytes)} on the wire for {_format_bytes(content_bytes)} of content in {str(responses)} responses"
+                )
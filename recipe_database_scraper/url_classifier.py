@@ -0,0 +1,182 @@
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+from urllib.parse import urlsplit
+
+from ._urls import url_host
+
+CLASSIFIER_DIR = "_recipe_scraper_classifier"
+
+MAX_PREFIX_DEPTH = 2
+"""Number of leading path sections that are learned as prefixes, e.g. /shop/ & /shop/kitchen/"""
+
+RE_DIGITS = re.compile(r"\d+")
+RE_SLUG_SEPARATOR = re.compile(r"[-_.+]")
+
+
+def url_features(url: str) -> list:
+    """Return the features a page url is classified on: its leading path sections, e.g. 'prefix:/shop/', and the first word of its slug, e.g. 'slug:best'.
+    Numbers are replaced by '#', so '10-best-soups' & '25-best-stews' share the feature 'slug:#'
+    """
+    segments = [segment for segment in urlsplit(url).path.split("/") if segment]
+    if not segments:
+        return []
+    features = [
+        "prefix:/" + "/".join(segments[:depth]).lower() + "/"
+        for depth in range(1, min(len(segments) - 1, MAX_PREFIX_DEPTH) + 1)
+    ]
+    first_word = RE_SLUG_SEPARATOR.split(segments[-1], 1)[0].lower()
+    if first_word:
+        features.append("slug:" + RE_DIGITS.sub("#", first_word))
+    return features
+
+
+class UrlClassifier:
+    """Predict from its url whether a page contains a recipe, learned from the recipe & non recipe pages of earlier results.
+    A page is skipped when every feature with at least min_samples observations predicts no recipe with a probability of at least threshold.
+    A verification_rate share of the pages that would be skipped is fetched anyway, so wrong predictions are unlearned
+    """
+
+    def __init__(
+        self,
+        counts: dict | None = None,
+        *,
+        threshold: float = 0.98,
+        verification_rate: float = 0.05,
+        min_samples: int = 20,
+        seed=None,
+    ):
+        # Feature: [recipe pages, non recipe pages]
+        self.counts = counts if counts is not None else {}
+        self.threshold = threshold
+        self.verification_rate = verification_rate
+        self.min_samples = min_samples
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._skipped_urls = set()
+        self._verification_urls = set()
+        self.skipped_pages = 0
+        self.verified_pages = 0
+        self.verified_recipes = 0
+
+    def learn(self, page_url: str, is_recipe: bool):
+        """Count the features of a page of which it is known whether it contains a recipe. Skipped pages are not learned, as their outcome is unknown"""
+        with self._lock:
+            if page_url in self._skipped_urls:
+                return
+            if page_url in self._verification_urls:
+                self._verification_urls.discard(page_url)
+                self.verified_pages += 1
+                self.verified_recipes += bool(is_recipe)
+            for feature in url_features(page_url):
+                self.counts.setdefault(feature, [0, 0])[0 if is_recipe else 1] += 1
+
+    def learn_results(self, recipe_urls, non_recipe_urls):
+        for page_url in recipe_urls:
+            self.learn(page_url, True)
+        for page_url in non_recipe_urls:
+            self.learn(page_url, False)
+
+    def non_recipe_probability(self, page_url: str) -> float | None:
+        """Return the probability that a page contains no recipe, according to its least confident feature. None when no feature has enough observations"""
+        probabilities = []
+        for feature in url_features(page_url):
+            recipes, non_recipes = self.counts.get(feature, (0, 0))
+            if recipes + non_recipes >= self.min_samples:
+                # Laplace smoothing, so a feature never predicts with certainty
+                probabilities.append((non_recipes + 1) / (recipes + non_recipes + 2))
+        return min(probabilities) if probabilities else None
+
+    def skip(self, page_url: str) -> bool:
+        """Return whether fetching a page should be skipped, because it is predicted not to contain a recipe"""
+        probability = self.non_recipe_probability(page_url)
+        if probability is None or probability < self.threshold:
+            return False
+        with self._lock:
+            if self._random.random() < self.verification_rate:
+                self._verification_urls.add(page_url)
+                return False
+            self._skipped_urls.add(page_url)
+            self.skipped_pages += 1
+        return True
+
+    def to_json(self) -> dict:
+        return {"counts": self.counts}
+
+    def report(self):
+        if not (self.skipped_pages or self.verified_pages):
+            return
+        print(
+            f"Saved {str(self.skipped_pages)} fetches of pages predicted not to contain a recipe. "
+            f"Verified {str(self.verified_pages)} predicted pages, of which {str(self.verified_recipes)} contained a recipe"
+        )
+
+
+class UrlClassifierStore:
+    """Url classifiers per site, stored as their feature counts in one shard file per site.
+    Without a stored classifier, a site's classifier starts from the recipes & pages without recipe of its input
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        *,
+        threshold: float = 0.98,
+        verification_rate: float = 0.05,
+        min_samples: int = 20,
+    ):
+        if not 0 < threshold <= 1:
+            raise ValueError("Classifier threshold must be between 0 and 1.")
+        if not 0 <= verification_rate <= 1:
+            raise ValueError("Classifier verification rate must be between 0 and 1.")
+        self.directory = directory
+        self.threshold = threshold
+        self.verification_rate = verification_rate
+        self.min_samples = min_samples
+
+    def _shard_path(self, site_url: str) -> str:
+        host = url_host(site_url).replace(":", "_")
+        return os.path.join(self.directory, CLASSIFIER_DIR, f"{host}.json")
+
+    def load(
+        self,
+        site_url: str,
+        *,
+        input_dict: dict | None = None,
+        exclusions: dict | list | None = None,
+    ) -> UrlClassifier:
+        classifier = UrlClassifier(
+            threshold=self.threshold,
+            verification_rate=self.verification_rate,
+            min_samples=self.min_samples,
+        )
+        shard_path = self._shard_path(site_url)
+        if os.path.isfile(shard_path):
+            print(f"INFO: Found url classifier file: {shard_path}")
+            with open(shard_path) as shard_file:
+                classifier.counts = json.load(shard_file)["counts"]
+            return classifier
+
+        input_dict = input_dict or {}
+        classifier.learn_results(
+            [url for url in input_dict if url != "Pages without Recipe"],
+            [*input_dict.get("Pages without Recipe", []), *(exclusions or [])],
+        )
+        return classifier
+
+    def save(self, site_url: str, classifier: UrlClassifier):
+        shard_path = self._shard_path(site_url)
+        os.makedirs(os.path.dirname(shard_path), exist_ok=True)
+        file_descriptor, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(shard_path), suffix=".json"
+        )
+        try:
+            with os.fdopen(file_descriptor, "w") as temp_file:
+                json.dump(classifier.to_json(), temp_file)
+            os.replace(temp_path, shard_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
@@ -0,0 +1,92 @@
+import fnmatch
+import re
+
+
+def compile_keywords(keywords) -> re.Pattern | None:
+    """Compile substring keywords into a single alternation of the lowercased keywords, so a lowercased url is scanned once instead of once per keyword.
+    Lowercasing the url first is several times faster than a re.IGNORECASE alternation
+    """
+    if not keywords:
+        return None
+    # Longest first, so overlapping keywords match the same way as a scan per keyword
+    return re.compile(
+        "|".join(
+            re.escape(keyword.lower())
+            for keyword in sorted(keywords, key=len, reverse=True)
+        )
+    )
+
+
+def compile_rules(rules) -> re.Pattern | None:
+    """Compile url rules into a single pattern. Strings are globs that should match the whole url, e.g. 'https://example.com/recipes/*'.
+    Compiled regexes, e.g. re.compile(r'/\\d{4}/'), may match anywhere in the url
+    """
+    if not rules:
+        return None
+    if isinstance(rules, (str, re.Pattern)):
+        rules = [rules]
+    patterns = []
+    for rule in rules:
+        if isinstance(rule, re.Pattern) and isinstance(rule.pattern, str):
+            patterns.append(
+                f"(?i:{rule.pattern})"
+                if rule.flags & re.IGNORECASE
+                else f"(?:{rule.pattern})"
+            )
+        elif isinstance(rule, str):
+            patterns.append(f"^{fnmatch.translate(rule)}")
+        else:
+            raise TypeError(f"Url rule {rule} must be a glob string or compiled regex")
+    return re.compile("|".join(patterns))
+
+
+def url_extension(url: str) -> str:
+    """Return the lowercased extension of the last path segment of a url, e.g. '.jpg', or an empty string"""
+    path_end = len(url)
+    for separator in "?#":
+        separator_index = url.find(separator, 0, path_end)
+        if separator_index != -1:
+            path_end = separator_index
+    segment_start = url.rfind("/", 0, path_end) + 1
+    dot_index = url.rfind(".", segment_start, path_end)
+    if dot_index == -1:
+        return ""
+    return url[dot_index:path_end].lower()
+
+
+class UrlFilter:
+    """Decide which sitemaps & pages should not be crawled, with compiled rules:
+    - sitemap_keywords: sub-sitemaps whose url contains any of these are filtered out with all their pages
+    - url_extensions: pages whose path ends with any of these extensions are filtered out
+    - exclude: glob or regex rules, pages matching any of them are filtered out
+    - include: glob or regex rules, when given, pages matching none of them are filtered out
+    """
+
+    def __init__(
+        self,
+        sitemap_keywords=(),
+        url_extensions=(),
+        *,
+        include=None,
+        exclude=None,
+    ):
+        self.sitemap_pattern = compile_keywords(sitemap_keywords)
+        self.url_extensions = frozenset(
+            extension.lower() for extension in url_extensions
+        )
+        self.include_pattern = compile_rules(include)
+        self.exclude_pattern = compile_rules(exclude)
+
+    def sitemap_filtered(self, sitemap_url: str) -> bool:
+        return bool(
+            self.sitemap_pattern and self.sitemap_pattern.search(sitemap_url.lower())
+        )
+
+    def page_filtered(self, page_url: str) -> bool:
+        if url_extension(page_url) in self.url_extensions:
+            return True
+        if self.exclude_pattern and self.exclude_pattern.search(page_url):
+            return True
+        if self.include_pattern and not self.include_pattern.search(page_url):
+            return True
+        return False
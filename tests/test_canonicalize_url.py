@@ -0,0 +1,64 @@
+import pytest
+from recipe_database_scraper._urls import (
+    canonicalize_url,
+    url_host,
+    UrlIndex,
+    _canonicalize_url,
+)
+
+
+@pytest.mark.util
+@pytest.mark.parametrize(
+    "url, expected_url",
+    [
+        ("https://www.example.com/recipe", "https://www.example.com/recipe"),
+        ("HTTPS://WWW.Example.COM/Recipe", "https://www.example.com/Recipe"),
+        ("https://example.com:443/recipe", "https://example.com/recipe"),
+        ("http://example.com:80/recipe", "http://example.com/recipe"),
+        ("https://example.com:8443/recipe", "https://example.com:8443/recipe"),
+        ("https://example.com/recipe/", "https://example.com/recipe"),
+        ("https://example.com/recipe//", "https://example.com/recipe"),
+        ("https://example.com", "https://example.com/"),
+        ("https://example.com/", "https://example.com/"),
+        ("https://example.com/recipe#comments", "https://example.com/recipe"),
+        (
+            "https://example.com/recipe?utm_source=feed&page=2&UTM_MEDIUM=rss&fbclid=x",
+            "https://example.com/recipe?page=2",
+        ),
+        ("https://example.com/recipe?utm_source=feed", "https://example.com/recipe"),
+        ("https://user@Example.com:443/recipe", "https://user@example.com/recipe"),
+        ("http://[::1]:8080/recipe/", "http://[::1]:8080/recipe"),
+        ("not a url", "not a url"),
+    ],
+)
+def test_canonicalize_url(url, expected_url):
+    """Test that urls that refer to the same page get the same canonical url."""
+    assert canonicalize_url(url) == expected_url
+
+
+@pytest.mark.util
+def test_canonicalize_url_tracking_params():
+    """Test that the dropped query parameters are configurable, and that each configuration is cached separately."""
+    url = "https://example.com/recipe?ref=home&utm_source=feed"
+
+    assert canonicalize_url(url, ["REF"]) == (
+        "https://example.com/recipe?utm_source=feed"
+    )
+    assert canonicalize_url(url) == "https://example.com/recipe?ref=home"
+
+    hits = _canonicalize_url.cache_info().hits
+    canonicalize_url(url)
+    assert _canonicalize_url.cache_info().hits == hits + 1
+
+
+@pytest.mark.util
+def test_url_host_and_index():
+    """Test the host of a url & the lookup of stored urls by canonical url."""
+    assert url_host("https://Example.com:443/recipe") == "example.com"
+    assert url_host("http://example.com:8080/") == "example.com:8080"
+
+    url_index = UrlIndex(["https://example.com/recipe/"])
+    assert url_index.get("https://EXAMPLE.com/recipe#top") == (
+        "https://example.com/recipe/"
+    )
+    assert url_index.get("https://example.com/other") is None
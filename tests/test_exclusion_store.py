@@ -0,0 +1,45 @@
+import os
+import json
+import pytest
+from tempfile import TemporaryDirectory
+from recipe_database_scraper.exclusion_store import ExclusionStore
+
+
+@pytest.mark.util
+def test_exclusion_store_shards_per_site():
+    """Test that every site is written to its own shard & loads back with last modified dates."""
+    with TemporaryDirectory() as tmp_dir:
+        exclusion_store = ExclusionStore.for_file(os.path.join(tmp_dir, "output.json"))
+        exclusion_store.write(
+            "https://example.com/", {"https://example.com/about": "2024-01-01"}
+        )
+        exclusion_store.write("https://other.com/", {"https://other.com/about": None})
+
+        assert exclusion_store.load("https://example.com/") == {
+            "https://example.com/about": "2024-01-01"
+        }
+        assert exclusion_store.load("https://other.com/") == {
+            "https://other.com/about": None
+        }
+        assert sorted(
+            os.listdir(os.path.join(tmp_dir, "_recipe_scraper_exclusions"))
+        ) == [
+            "example.com.json",
+            "other.com.json",
+        ]
+
+
+@pytest.mark.util
+def test_exclusion_store_legacy_file(capsys):
+    """Test that the single exclusions file of earlier versions is read when a site has no shard."""
+    with TemporaryDirectory() as tmp_dir:
+        with open(os.path.join(tmp_dir, "_recipe_scraper_exclusions.json"), "w") as f:
+            json.dump({"https://example.com/": ["https://example.com/about"]}, f)
+
+        exclusion_store = ExclusionStore(tmp_dir)
+
+        assert exclusion_store.load("https://example.com/") == {
+            "https://example.com/about": None
+        }
+        assert exclusion_store.load("https://other.com/") == {}
+        assert "URL not found" in capsys.readouterr().out
@@ -0,0 +1,316 @@
+import asyncio
+import gzip
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from recipe_database_scraper.get_html import (
+    BodyReader,
+    HTMLScraper,
+    AsyncHTMLScraper,
+    RetryBudget,
+    RetryLater,
+    RetryPolicy,
+    RetryQueue,
+    conditional_headers,
+    is_html_content_type,
+    parse_retry_after,
+)
+from recipe_database_scraper.transfer_stats import TransferStats
+
+
+class MockSiteHandler(BaseHTTPRequestHandler):
+    """Keep-alive capable handler serving the responses queued on the server, or a 200 page when none are queued"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        status, headers, body = (
+            self.server.responses.pop(0)
+            if self.server.responses
+            else (200, {}, b"<html>recipe</html>")
+        )
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def mock_site():
+    """Local HTTP server, with `requests` & `responses` lists to inspect & steer the traffic"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockSiteHandler)
+    server.requests = []
+    server.responses = []
+    server.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.util
+def test_scrape_page_reuses_connection(mock_site):
+    """Test that HTMLScraper reuses its pooled connection for subsequent requests to the same host."""
+    html_scraper = HTMLScraper(backoff_factor=0)
+
+    for page in ["/recipe-1", "/recipe-2", "/recipe-3"]:
+        content = html_scraper.scrape_page(mock_site.base_url + page, "test-agent")
+        assert content == b"<html>recipe</html>"
+
+    assert html_scraper.connections_opened == 1
+    assert html_scraper.connections_reused == 2
+    assert mock_site.requests[0][1]["User-Agent"] == "test-agent"
+
+
+@pytest.mark.util
+def test_scrape_page_without_keep_alive(mock_site):
+    """Test that HTMLScraper opens a connection per request when keep-alive is disabled."""
+    html_scraper = HTMLScraper(backoff_factor=0, keep_alive=False)
+
+    for page in ["/recipe-1", "/recipe-2"]:
+        html_scraper.scrape_page(mock_site.base_url + page, "test-agent")
+
+    assert html_scraper.connections_opened == 2
+    assert html_scraper.connections_reused == 0
+
+
+@pytest.mark.util
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("120", 120.0),
+        ("Wed, 21 Oct 2015 07:28:00 GMT", 0.0),  # Date in the past
+        ("not a date", None),
+        (None, None),
+    ],
+)
+def test_parse_retry_after(value, expected):
+    assert parse_retry_after(value) == expected
+
+
+@pytest.mark.util
+def test_retry_policy_honors_retry_after():
+    """Test that the Retry-After header takes precedence over the backoff."""
+    retry_policy = RetryPolicy(backoff_factor=1)
+    wait_time = retry_policy.wait_time(
+        "https://example.com", 1, status_code=429, retry_after="7"
+    )
+    assert wait_time == 7.0
+
+
+@pytest.mark.util
+def test_retry_policy_backoff_with_jitter():
+    """Test that the backoff grows exponentially, with jitter around it."""
+    retry_policy = RetryPolicy(max_retries=5, backoff_factor=1, jitter=0.5)
+    for attempt in [1, 2, 3]:
+        wait_time = retry_policy.wait_time(
+            "https://example.com", attempt, status_code=503
+        )
+        assert 0.5 * 2**attempt <= wait_time <= 1.5 * 2**attempt
+
+
+@pytest.mark.util
+def test_retry_policy_gives_up():
+    """Test that the RetryPolicy gives up on non-retryable codes, after max retries & once the budget is used."""
+    retry_policy = RetryPolicy(max_retries=3, retry_budget=RetryBudget(1))
+    assert retry_policy.wait_time("https://example.com", 1, status_code=404) is None
+    assert retry_policy.wait_time("https://example.com", 3, status_code=503) is None
+    assert retry_policy.wait_time("https://example.com", 1, status_code=503)
+    assert retry_policy.wait_time("https://example.com", 1, status_code=503) is None
+
+
+@pytest.mark.util
+@patch("recipe_database_scraper.get_html.time.monotonic", return_value=10.0)
+def test_retry_queue(mock_monotonic):
+    """Test that the RetryQueue releases items once their wait time has passed."""
+    retry_queue = RetryQueue()
+    retry_queue.push("later", 5)
+    retry_queue.push("sooner", 1)
+
+    assert retry_queue.pop_due() == []
+    assert retry_queue.seconds_until_due() == 1
+
+    mock_monotonic.return_value = 12.0
+    assert retry_queue.pop_due() == ["sooner"]
+    assert len(retry_queue) == 1
+
+
+@pytest.mark.util
+def test_fetch_page_once_returns_retry_later(mock_site):
+    """Test that fetch_page_once does not sleep on a 429, but returns the Retry-After wait time."""
+    mock_site.responses.append((429, {"Retry-After": "30"}, b""))
+    html_scraper = HTMLScraper()
+
+    result = html_scraper.fetch_page_once(mock_site.base_url + "/recipe", "test-agent")
+
+    assert isinstance(result, RetryLater)
+    assert result.wait_time == 30.0
+    page = html_scraper.fetch_page_once(mock_site.base_url + "/recipe", "test-agent", 2)
+    assert page.content == b"<html>recipe</html>"
+
+
+@pytest.mark.util
+def test_fetch_page_once_conditional_request(mock_site):
+    """Test that conditional request headers are sent & a 304 response is returned as not modified page."""
+    mock_site.responses.append((304, {"ETag": '"v1"'}, b""))
+    html_scraper = HTMLScraper()
+
+    page = html_scraper.fetch_page_once(
+        mock_site.base_url + "/recipe",
+        "test-agent",
+        headers=conditional_headers('"v1"', "Wed, 01 Jan 2025 00:00:00 GMT"),
+    )
+
+    assert page.not_modified
+    assert page.content is None
+    assert page.etag == '"v1"'
+    request_headers = mock_site.requests[0][1]
+    assert request_headers["If-None-Match"] == '"v1"'
+    assert request_headers["If-Modified-Since"] == "Wed, 01 Jan 2025 00:00:00 GMT"
+
+
+@pytest.mark.util
+@pytest.mark.parametrize(
+    "content_type, expected_result",
+    [
+        (None, True),
+        ("text/html; charset=utf-8", True),
+        ("application/xhtml+xml", True),
+        ("application/pdf", False),
+        ("image/jpeg", False),
+    ],
+)
+def test_is_html_content_type(content_type, expected_result):
+    """Test that only html content types are downloaded."""
+    assert is_html_content_type(content_type) == expected_result
+
+
+@pytest.mark.util
+def test_fetch_page_once_skips_non_html_and_large_pages(mock_site):
+    """Test that pages with a non html content type or a body over max_body_size are not downloaded."""
+    mock_site.responses.append((200, {"Content-Type": "application/pdf"}, b"%PDF"))
+    mock_site.responses.append((200, {}, b"<html>" + b"x" * 2000 + b"</html>"))
+    html_scraper = HTMLScraper(max_body_size=1000)
+
+    pdf_page = html_scraper.fetch_page_once(mock_site.base_url + "/a.pdf", "agent")
+    large_page = html_scraper.fetch_page_once(mock_site.base_url + "/large", "agent")
+    page = html_scraper.fetch_page_once(mock_site.base_url + "/recipe", "agent")
+
+    assert pdf_page.content is None
+    assert pdf_page.skipped == "content type application/pdf"
+    assert large_page.content is None
+    assert "exceeds max body size" in large_page.skipped
+    assert page.content == b"<html>recipe</html>"
+    assert page.skipped is None
+
+
+@pytest.mark.util
+def test_body_reader():
+    """Test that BodyReader stops at max_body_size, and with stop_after_recipe after the Recipe JSON-LD block."""
+    reader = BodyReader(max_body_size=10)
+    assert reader.feed(b"0123456789")
+    assert not reader.feed(b"0")
+    assert reader.page("https://example.com/", 200, {}).content is None
+
+    reader = BodyReader(stop_after_recipe=True)
+    chunks = [
+        b'<script type="application/ld+json">{"@ty',
+        b'pe": "Recipe", "name": "Soup"}</scr',
+        b"ipt><body>comments</body>",
+    ]
+    assert [reader.feed(chunk) for chunk in chunks] == [True, True, False]
+    page = reader.page("https://example.com/", 200, {})
+    assert page.truncated
+    assert page.content == b"".join(chunks)
+
+    reader = BodyReader(stop_after_recipe=True)
+    assert reader.feed(b"<script>var a = 1;</script><p>No recipe</p>")
+
+
+@pytest.mark.util
+def test_fetch_page_once_counts_compressed_bytes(mock_site):
+    """Test that compressed responses are decoded & counted both on the wire and after decompression."""
+    html = b"<html>" + b"recipe " * 1000 + b"</html>"
+    mock_site.responses.append((200, {"Content-Encoding": "gzip"}, gzip.compress(html)))
+    transfer_stats = TransferStats()
+    html_scraper = HTMLScraper(transfer_stats=transfer_stats)
+
+    page = html_scraper.fetch_page_once(mock_site.base_url + "/recipe", "agent")
+    html_scraper.fetch_page_once(mock_site.base_url + "/other", "agent")
+
+    assert page.content == html
+    assert "gzip" in mock_site.requests[0][1]["Accept-Encoding"]
+    host_stats = transfer_stats.to_json()["hosts"][mock_site.base_url[7:]]
+    assert host_stats["responses"] == 2
+    assert host_stats["wire_bytes"] == len(gzip.compress(html)) + 19
+    assert host_stats["content_bytes"] == len(html) + 19
+    assert transfer_stats.wire_bytes < transfer_stats.content_bytes
+
+
+def _run_with_server(routes, coroutine_function):
+    """Serve the given aiohttp routes on a local test server & run the coroutine function against its base url"""
+    pytest.importorskip("aiohttp")
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+
+    async def main():
+        app = web.Application()
+        app.add_routes(routes)
+        async with TestServer(app) as server:
+            return await coroutine_function(str(server.make_url("")))
+
+    return asyncio.run(main())
+
+
+@pytest.mark.util
+def test_async_scrape_page_retries_retryable_status():
+    """Test that AsyncHTMLScraper retries on a retryable status code and returns the page content."""
+    web = pytest.importorskip("aiohttp.web")
+    calls = []
+
+    async def flaky_page(request):
+        calls.append(request.headers["User-Agent"])
+        if len(calls) == 1:
+            return web.Response(status=503)
+        return web.Response(body=b"<html>recipe</html>")
+
+    async def scrape(base_url):
+        async with AsyncHTMLScraper(backoff_factor=0) as html_scraper:
+            content = await html_scraper.scrape_page(base_url + "/recipe", "test-agent")
+            return content, html_scraper.connections_opened
+
+    content, connections_opened = _run_with_server(
+        [web.get("/recipe", flaky_page)], scrape
+    )
+
+    assert content == b"<html>recipe</html>"
+    assert calls == ["test-agent", "test-agent"]
+    assert connections_opened == 1
+
+
+@pytest.mark.util
+def test_async_scrape_page_non_retryable_status():
+    """Test that AsyncHTMLScraper gives up immediately on a non-retryable status code."""
+    web = pytest.importorskip("aiohttp.web")
+    calls = []
+
+    async def missing_page(request):
+        calls.append(request.path)
+        return web.Response(status=404)
+
+    async def scrape(base_url):
+        async with AsyncHTMLScraper(backoff_factor=0) as html_scraper:
+            return await html_scraper.scrape_page(base_url + "/missing", "test-agent")
+
+    content = _run_with_server([web.get("/missing", missing_page)], scrape)
+
+    assert content is None
+    assert calls == ["/missing"]
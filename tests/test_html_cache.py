@@ -0,0 +1,96 @@
+import os
+import pytest
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+from recipe_database_scraper.get_html import FetchedPage
+from recipe_database_scraper.html_cache import HTMLCache
+
+RECIPE_HTML = b"<html><script type='application/ld+json'>{}</script></html>"
+
+
+@pytest.mark.util
+@pytest.mark.parametrize("compression", ["gzip", "zstd"])
+def test_html_cache_round_trip(compression):
+    """Test that cached html & validators are returned for the same URL only."""
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+
+    with TemporaryDirectory() as tmp_dir:
+        html_cache = HTMLCache(tmp_dir, compression=compression)
+        html_cache.put(
+            FetchedPage(
+                "https://example.com/recipe", RECIPE_HTML, headers={"ETag": '"v1"'}
+            )
+        )
+
+        page = html_cache.get("https://example.com/recipe")
+
+        assert page.content == RECIPE_HTML
+        assert page.etag == '"v1"'
+        assert page.from_cache
+        assert html_cache.get("https://example.com/other-recipe") is None
+        assert (html_cache.hits, html_cache.misses) == (1, 1)
+
+
+@pytest.mark.util
+def test_html_cache_last_modified():
+    """Test that cached html is only used for the sitemap last modified date it was cached for."""
+    with TemporaryDirectory() as tmp_dir:
+        html_cache = HTMLCache(tmp_dir, compression="gzip")
+        html_cache.put(
+            FetchedPage("https://example.com/recipe", RECIPE_HTML),
+            last_modified="2024-01-01T00:00:00",
+        )
+
+        assert html_cache.get(
+            "https://example.com/recipe", last_modified="2024-01-01T00:00:00"
+        )
+        assert (
+            html_cache.get(
+                "https://example.com/recipe", last_modified="2024-02-01T00:00:00"
+            )
+            is None
+        )
+        assert html_cache.get("https://example.com/recipe") is None
+
+
+@pytest.mark.util
+def test_html_cache_max_age():
+    """Test that entries older than max_age are ignored."""
+    with TemporaryDirectory() as tmp_dir:
+        html_cache = HTMLCache(tmp_dir, max_age=60, compression="gzip")
+        with patch("recipe_database_scraper.html_cache.time.time", return_value=1000):
+            html_cache.put(FetchedPage("https://example.com/recipe", RECIPE_HTML))
+
+        with patch("recipe_database_scraper.html_cache.time.time", return_value=1030):
+            assert html_cache.get("https://example.com/recipe") is not None
+        with patch("recipe_database_scraper.html_cache.time.time", return_value=1090):
+            assert html_cache.get("https://example.com/recipe") is None
+
+
+@pytest.mark.util
+def test_html_cache_lru_eviction():
+    """Test that the least recently used entries are evicted once max_size is exceeded."""
+    with TemporaryDirectory() as tmp_dir:
+        html_cache = HTMLCache(tmp_dir, compression="gzip")
+        urls = [f"https://example.com/recipe-{i}" for i in range(3)]
+        for second, url in enumerate(urls):
+            with patch(
+                "recipe_database_scraper.html_cache.time.time", return_value=second
+            ):
+                html_cache.put(FetchedPage(url, os.urandom(1000)))
+        entry_size = html_cache.size // 3
+
+        # Use the oldest entry, so the second entry becomes least recently used
+        with patch("recipe_database_scraper.html_cache.time.time", return_value=10):
+            html_cache.get(urls[0])
+
+        html_cache.max_size = entry_size * 3 - 1
+        html_cache._evict()
+
+        assert html_cache.get(urls[1]) is None
+        assert html_cache.get(urls[0]) is not None
+        assert html_cache.get(urls[2]) is not None
+
+        # The size index is rebuilt from disk
+        assert HTMLCache(tmp_dir, compression="gzip").size == html_cache.size
@@ -15,6 +15,9 @@ from recipe_database_scraper._exceptions import InvalidURLException
         "https://example.com#fragment",
         "https://example.co.uk",
         "http://www.example.com:8080",
+        "http://localhost:8000/recipe",
+        "http://127.0.0.1:8000",
+        "http://255.255.255.255",
     ],
 )
 def test_valid_urls(url):
@@ -37,6 +40,9 @@ def test_valid_urls(url):
         "://example.com",  # Missing scheme before '://'
         "http://example.com:-80",  # Invalid port number
         "http://example.com:port",  # Non-numeric port
+        "http://127.0.0:8000",  # Incomplete IP address
+        "http://999.999.999.999",  # IP address octets above 255
+        "http://127.0.0.256:8000",  # IP address octet above 255
     ],
 )
 def test_invalid_urls(url):
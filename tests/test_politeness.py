@@ -0,0 +1,122 @@
+import pytest
+from unittest.mock import patch
+from recipe_database_scraper._utils import RobotsParser
+from recipe_database_scraper.politeness import (
+    BandwidthLimiter,
+    HostThrottle,
+    PolitenessScheduler,
+)
+
+robots_rate_content = """
+User-agent: *
+Crawl-delay: 2
+Disallow: /private/
+
+User-agent: Fast-Bot
+Request-rate: 10/1s
+
+User-agent: Slow-Bot
+Crawl-delay: 1
+Request-rate: 1/5m
+"""
+
+
+@pytest.mark.util
+@patch("recipe_database_scraper.politeness.time.monotonic", return_value=100.0)
+def test_host_throttle_token_bucket(mock_monotonic):
+    """Test that HostThrottle allows a burst of requests, then spaces requests by the configured rate."""
+    throttle = HostThrottle(requests_per_second=2, burst=3)
+
+    assert [throttle._reserve() for _ in range(5)] == [0.0, 0.0, 0.0, 0.5, 1.0]
+
+    # Tokens are refilled over time
+    mock_monotonic.return_value = 102.0
+    assert throttle._reserve() == 0.0
+
+
+@pytest.mark.util
+def test_host_throttle_unlimited():
+    """Test that a HostThrottle without rate never waits."""
+    throttle = HostThrottle()
+    assert [throttle._reserve() for _ in range(10)] == [0.0] * 10
+
+
+@pytest.mark.util
+@pytest.mark.parametrize(
+    "user_agent, expected_requests_per_second",
+    [
+        ("Hungry Scraper", 0.5),  # Crawl-delay of the wild card group
+        ("Fast-Bot", 10.0),  # Request-rate of its own group
+        ("Slow-Bot", 1 / 300),  # Most restrictive of Crawl-delay & Request-rate
+    ],
+)
+def test_scheduler_robots_defaults(user_agent, expected_requests_per_second):
+    """Test that the PolitenessScheduler derives the host rate from robots.txt directives."""
+    scheduler = PolitenessScheduler(user_agent)
+    scheduler.add_robots_parser(
+        "https://example.com/", RobotsParser.from_string(robots_rate_content)
+    )
+
+    throttle = scheduler.throttle_for("https://example.com/recipe/1")
+
+    assert throttle.requests_per_second == pytest.approx(expected_requests_per_second)
+    assert scheduler.throttle_for("https://example.com/recipe/2") is throttle
+
+
+@pytest.mark.util
+def test_scheduler_overrides():
+    """Test that explicit PolitenessScheduler settings take precedence over robots.txt directives."""
+    scheduler = PolitenessScheduler(
+        "Hungry Scraper", requests_per_second=5, burst=4, max_connections_per_host=2
+    )
+    scheduler.add_robots_parser(
+        "https://example.com/", RobotsParser.from_string(robots_rate_content)
+    )
+
+    throttle = scheduler.throttle_for("https://example.com/recipe/1")
+
+    assert throttle.requests_per_second == 5
+    assert throttle.burst == 4
+    assert throttle.max_connections == 2
+    assert scheduler.throttle_for("https://other.com/").requests_per_second == 5
+
+
+@pytest.mark.util
+def test_scheduler_host_settings():
+    """Test that host settings of a shared scheduler only apply to their own host."""
+    scheduler = PolitenessScheduler("Hungry Scraper", requests_per_second=5)
+    scheduler.set_host_settings(
+        "https://slow.com/", requests_per_second=0.5, max_connections_per_host=1
+    )
+
+    slow_throttle = scheduler.throttle_for("https://slow.com/recipe/1")
+    assert slow_throttle.requests_per_second == 0.5
+    assert slow_throttle.max_connections == 1
+    assert scheduler.throttle_for("https://fast.com/").requests_per_second == 5
+
+
+@pytest.mark.util
+@patch("recipe_database_scraper.politeness.time.monotonic", return_value=100.0)
+def test_bandwidth_limiter(mock_monotonic):
+    """Test that downloaded bytes delay the following requests until they fit in the cap."""
+    bandwidth = BandwidthLimiter(bytes_per_second=1000)
+    assert bandwidth.wait_time() == 0.0
+
+    bandwidth.consume(3000)
+    assert bandwidth.wait_time() == 3.0
+
+    mock_monotonic.return_value = 102.0
+    assert bandwidth.wait_time() == 1.0
+
+    mock_monotonic.return_value = 110.0
+    assert bandwidth.wait_time() == 0.0
+
+
+@pytest.mark.util
+def test_scheduler_max_connections():
+    """Test that the global slot caps concurrent requests over all hosts."""
+    scheduler = PolitenessScheduler("Hungry Scraper", max_connections=2)
+
+    with scheduler.slot("https://a.com/"), scheduler.slot("https://b.com/"):
+        assert not scheduler._connections.acquire(blocking=False)
+    assert scheduler._connections.acquire(blocking=False)
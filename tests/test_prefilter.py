@@ -0,0 +1,101 @@
+import pytest
+from unittest.mock import patch
+from recipe_database_scraper.prefilter import has_recipe_markup, evaluate_prefilter
+from recipe_database_scraper.recipe_scraper import RecipeScraper, parse_recipe_html
+from recipe_database_scraper.get_html import FetchedPage
+
+RECIPE_JSON_LD = """{"@context": "https://schema.org", "@type": "Recipe", "name": "Test Soup",
+"recipeIngredient": ["Water", "Salt"], "recipeInstructions": "Boil water"}"""
+
+# (page_url, html) tuples of recipe & non recipe pages, in the markup variants found on recipe sites
+prefilter_corpus = [
+    (
+        "https://example.com/json-ld",
+        f'<script type="application/ld+json">{RECIPE_JSON_LD}</script>',
+    ),
+    (
+        "https://example.com/json-ld-graph",
+        '<script type="application/ld+json">{"@context": "https://schema.org", "@graph": ['
+        '{"@type": "WebPage", "name": "Soup"}, {"@type": ["Recipe", "NewsArticle"], "name": "Test Soup", '
+        '"recipeIngredient": ["Water"], "recipeInstructions": "Boil water"}]}</script>',
+    ),
+    (
+        "https://example.com/json-ld-url-type",
+        '<script type="application/ld+json">'
+        + RECIPE_JSON_LD.replace('"Recipe"', '"http://schema.org/Recipe"')
+        + "</script>",
+    ),
+    (
+        "https://example.com/microdata",
+        '<div itemscope itemtype="http://schema.org/Recipe"><h1 itemprop="name">Test Soup</h1>'
+        '<span itemprop="recipeIngredient">Water</span>'
+        '<div itemprop="recipeInstructions">Boil water</div></div>',
+    ),
+    (
+        "https://example.com/article",
+        '<script type="application/ld+json">{"@context": "https://schema.org", "@type": "Article", '
+        '"headline": "Our 10 favourite recipes"}</script><p>Recipe roundup</p>',
+    ),
+    (
+        "https://example.com/shop",
+        '<div itemscope itemtype="http://schema.org/Product"><span itemprop="name">Recipe book</span></div>',
+    ),
+    ("https://example.com/empty", "<html><body>Recipes coming soon</body></html>"),
+]
+
+
+@pytest.mark.util
+@pytest.mark.parametrize(
+    "html, expected_result",
+    [
+        (b'"@type":"Recipe"', True),
+        (b'"@type" : [ "WebPage", "Recipe" ]', True),
+        (b'\\"@type\\":\\"Recipe\\"', True),  # JSON-LD inside a javascript string
+        (b"\"@type\": 'recipe'", True),
+        (b'itemtype="https://schema.org/Recipe"', True),
+        (b'<div vocab="https://schema.org/" typeof="Recipe">', True),
+        (b'<div typeof="schema:Recipe">', True),
+        (b'"@type": "Article"', False),
+        (b'"@type": "RecipeCollection"', False),
+        (b'<a href="/recipes">Recipe index</a>', False),
+        ("utf-16".encode("utf-16"), True),  # Cannot be scanned on raw bytes
+        (b"", False),
+        (None, False),
+    ],
+)
+def test_has_recipe_markup(html, expected_result):
+    """Test that has_recipe_markup finds the schema.org Recipe markers without matching similar types."""
+    assert has_recipe_markup(html) == expected_result
+
+
+@pytest.mark.util
+def test_prefilter_false_negative_rate():
+    """Test that the prefilter skips none of the recipe pages of the corpus that a full parse finds."""
+    report = evaluate_prefilter(
+        prefilter_corpus,
+        lambda page_url, html: parse_recipe_html(html, page_url, None, False),
+    )
+
+    assert report["pages"] == 7
+    assert report["recipes"] == 4
+    assert report["false_negatives"] == 0
+    assert report["false_negative_rate"] == 0.0
+    assert report["skipped"] == 3
+
+
+@pytest.mark.recipe
+@patch("recipe_database_scraper.recipe_scraper.scrape_html")
+def test_prefilter_skips_parse(mock_scrape_html):
+    """Test that fetched pages without recipe markup are recorded as pages without recipe without a DOM parse."""
+    recipe_scraper = RecipeScraper("https://example.com", "test-agent")
+
+    recipe = recipe_scraper._handle_fetched_page(
+        FetchedPage("https://example.com/article", b"<html>No recipe</html>"),
+        "https://example.com/article",
+        None,
+        None,
+    )
+
+    assert recipe is None
+    assert recipe_scraper.prefiltered_pages == 1
+    mock_scrape_html.assert_not_called()
@@ -1,8 +1,16 @@
+import asyncio
+import json
+import os
 import pytest
+from tempfile import TemporaryDirectory
 from unittest.mock import patch, MagicMock
 from recipe_scrapers import get_supported_urls
 from recipe_database_scraper.recipe_scraper import Recipe, Recipes, RecipeScraper
-from recipe_database_scraper.sitemap_scraper import Pages
+from recipe_database_scraper.sitemap_scraper import Page, Pages
+from recipe_database_scraper.get_html import FetchedPage, RetryLater
+from recipe_database_scraper.html_cache import HTMLCache
+from recipe_database_scraper._utils import FileHandler, REMOVED_PAGE
+from recipe_database_scraper.sqlite_store import RecipeDatabase
 
 # Mock data for testing
 MOCK_RECIPE_DICT = {
@@ -29,6 +37,11 @@ MOCK_RECIPE_DICT = {
 }
 
 
+MOCK_RECIPE_HTML = (
+    b'<html><script type="application/ld+json">{"@type": "Recipe"}</script></html>'
+)
+
+
 # ---- Tests for Recipe class ----
 
 
@@ -88,6 +101,46 @@ def test_recipes_to_json():
     assert recipe.recipe_dict["page_url"] in output
 
 
+@pytest.mark.recipe
+def test_recipes_evict():
+    """Test that evicted recipes leave memory, and are output in the same order & format as recipes kept in memory."""
+    kept_recipes, evicted_recipes = Recipes(), Recipes()
+
+    def record(recipes, evict):
+        recipes.add_recipe("https://example.com/1", Recipe({"title": "Soup"}))
+        recipes.add_non_recipe_page("https://example.com/about", "2024-01-01")
+        recipes.add_recipe("https://example.com/2", Recipe({"title": "Stew", "n": 1.5}))
+        if evict:
+            recipes.evict()
+            assert recipes.recipes == {}
+        recipes.add_recipe("https://example.com/3", Recipe({"title": "Pie"}))
+        recipes.add_recipe("https://example.com/1", Recipe({"title": "Soup ünïcode"}))
+        recipes.remove_page("https://example.com/2")
+        if evict:
+            recipes.evict()
+        recipes.add_recipe("https://example.com/2", Recipe({"title": "Stew"}))
+
+    record(kept_recipes, False)
+    record(evicted_recipes, True)
+
+    output = evicted_recipes.to_json()
+    assert list(output) == list(kept_recipes.to_json())
+    assert dict(output) == kept_recipes.to_json()
+
+    with TemporaryDirectory() as tmp_dir:
+        kept_file = os.path.join(tmp_dir, "kept.json")
+        evicted_file = os.path.join(tmp_dir, "evicted.json")
+        FileHandler(kept_file).write_json_file(
+            kept_recipes.to_json(pages_without_recipe=False)
+        )
+        FileHandler(evicted_file).write_json_file(
+            evicted_recipes.to_json(pages_without_recipe=False)
+        )
+
+        with open(kept_file, "rb") as f_kept, open(evicted_file, "rb") as f_evicted:
+            assert f_evicted.read() == f_kept.read()
+
+
 # ---- Tests for RecipeScraper class ----
 
 
@@ -213,11 +266,13 @@ def test_url_in_input_data(mock_recipe_scraper):
 
 
 @pytest.mark.recipe
-@patch("recipe_database_scraper.recipe_scraper.HTMLScraper")
 @patch("recipe_database_scraper.recipe_scraper.scrape_html")
-def test_scrape_recipe_page(mock_scrape_html, mock_html_scraper, mock_recipe_scraper):
+def test_scrape_recipe_page(mock_scrape_html, mock_recipe_scraper):
     """Test scraping a recipe page for valid schema data."""
-    mock_html_scraper().scrape_page.return_value = "<html></html>"
+    mock_recipe_scraper.html_scraper = MagicMock()
+    mock_recipe_scraper.html_scraper.fetch_page_once.return_value = FetchedPage(
+        "https://example.com/recipe", MOCK_RECIPE_HTML
+    )
     mock_scrape_html.return_value.to_json.return_value = MOCK_RECIPE_DICT
     recipe = mock_recipe_scraper._scrape_recipe_page(
         "https://example.com/recipe", "2000-01-01"
@@ -226,36 +281,104 @@ def test_scrape_recipe_page(mock_scrape_html, mock_html_scraper, mock_recipe_scr
 
 
 @pytest.mark.recipe
+def test_scrape_recipe_page_parse_processes(mock_recipe_scraper):
+    """Test that html parsed in the parse process pool gives the same recipe as html parsed in the fetching thread."""
+    recipe_html = b"""<html><head><script type="application/ld+json">
+    {"@context": "https://schema.org", "@type": "Recipe", "name": "Test Soup",
+    "recipeIngredient": ["Water", "Salt"], "recipeInstructions": "Boil water"}
+    </script></head><body></body></html>"""
+    mock_recipe_scraper.html_scraper = MagicMock()
+    mock_recipe_scraper.html_scraper.fetch_page_once.return_value = FetchedPage(
+        "https://example.com/recipe", recipe_html
+    )
+
+    expected_recipe = mock_recipe_scraper._scrape_recipe_page(
+        "https://example.com/recipe", "2000-01-01"
+    )
+    with mock_recipe_scraper._parse_pool(2):
+        assert mock_recipe_scraper.parse_executor is not None
+        # Workers are not forked from the threaded scraper process
+        assert (
+            mock_recipe_scraper.parse_executor._mp_context.get_start_method() != "fork"
+        )
+        recipe = mock_recipe_scraper._scrape_recipe_page(
+            "https://example.com/recipe", "2000-01-01"
+        )
+        no_recipe = mock_recipe_scraper._parse_recipe_html(
+            b"<html></html>", "https://example.com/about", None
+        )
+    assert mock_recipe_scraper.parse_executor is None
+
+    assert recipe.recipe_dict["title"] == "Test Soup"
+    assert recipe.recipe_dict == expected_recipe.recipe_dict
+    assert no_recipe is None
+
+
+@pytest.mark.recipe
+@patch("recipe_database_scraper.recipe_scraper.ExclusionStore")
 @patch("recipe_database_scraper.recipe_scraper.FileHandler")
-def test_write_batch(mock_file_handler, mock_recipe_scraper):
+def test_write_batch(mock_file_handler, mock_exclusion_store, mock_recipe_scraper):
     """Test that _write_batch writes to file and handles exclusions after reaching batch size."""
-    mock_file_handler_instance = mock_file_handler.return_value
     mock_recipe_scraper.url = "https://example.com"
     mock_recipe_scraper.batch_buffer = 3
     mock_recipe_scraper.recipes = MagicMock()
-    mock_input_dict_copy = mock_input_dict.copy()
-    mock_recipe_scraper.recipes.to_json.return_value = mock_input_dict_copy
+    mock_recipe_scraper.recipes.to_json.return_value = {
+        "https://example.com/recipe": MOCK_RECIPE_DICT
+    }
+    mock_recipe_scraper.recipes.pages_without_recipe = {
+        "https://example.com/non-recipe": "2000-01-01",
+        "https://example.com/non-recipe-2": None,
+    }
 
     mock_recipe_scraper._write_batch(3, "test_output.json")
 
+    mock_recipe_scraper.recipes.evict.assert_called_once_with(spool_dir=None)
+    mock_recipe_scraper.recipes.to_json.assert_called_once_with(
+        pages_without_recipe=False
+    )
     expected_json_output = {"https://example.com/recipe": MOCK_RECIPE_DICT}
     mock_file_handler.return_value.write_json_file.assert_called_once_with(
         expected_json_output
     )
 
-    expected_exclusion_dict = {
-        "https://example.com": [
-            "https://example.com/non-recipe",
-            "https://example.com/non-recipe-2",
-        ]
-    }
-    mock_file_handler_instance.write_exclusion_json_file.assert_called_once_with(
-        expected_exclusion_dict
+    mock_exclusion_store.for_file.assert_called_once_with("test_output.json")
+    mock_exclusion_store.for_file.return_value.write.assert_called_once_with(
+        "https://example.com",
+        {
+            "https://example.com/non-recipe": "2000-01-01",
+            "https://example.com/non-recipe-2": None,
+        },
     )
 
     assert mock_recipe_scraper.batch_buffer == 0
 
 
+@pytest.mark.recipe
+def test_write_batch_jsonl(mock_recipe_scraper):
+    """Test that batches to a jsonl output file only append the records added since the previous batch."""
+    with TemporaryDirectory() as tmp_dir:
+        output_file = os.path.join(tmp_dir, "output.jsonl")
+        mock_recipe_scraper.recipes.add_recipe(
+            "https://example.com/recipe", Recipe(MOCK_RECIPE_DICT)
+        )
+        mock_recipe_scraper._write_batch(1, output_file)
+        mock_recipe_scraper.recipes.add_non_recipe_page("https://example.com/about")
+        mock_recipe_scraper._write_batch(1, output_file)
+
+        with open(output_file) as f:
+            lines = [json.loads(line) for line in f]
+
+        assert not os.path.exists(
+            os.path.join(tmp_dir, "_recipe_scraper_exclusions.json")
+        )
+
+    assert lines == [
+        {"url": "https://example.com/recipe", "recipe": MOCK_RECIPE_DICT},
+        {"url": "https://example.com/about", "recipe": None, "last_modified": None},
+    ]
+    assert mock_recipe_scraper.batch_buffer == 0
+
+
 @pytest.mark.recipe
 @patch("recipe_database_scraper.recipe_scraper.RecipeScraper._scrape_recipe_page")
 @patch("recipe_database_scraper.recipe_scraper.SitemapScraper")
@@ -284,3 +407,593 @@ def test_scrape_to_json(
     assert "Pages without Recipe" in json_output
     assert "https://example.com/not-a-recipe" in json_output["Pages without Recipe"]
     assert "https://example.com/recipe" not in json_output["Pages without Recipe"]
+
+
+@pytest.mark.recipe
+@patch("recipe_database_scraper.recipe_scraper.SitemapScraper")
+def test_prepare_pages_rechecks_changed_exclusions(
+    mock_sitemap_scraper, mock_recipe_scraper
+):
+    """Test that excluded pages are only scraped again once their sitemap lastmod changed."""
+    pages_obj = Pages()
+    pages_obj.add_list(
+        [
+            Page("https://example.com/unchanged", "2024-01-01"),
+            Page("https://example.com/changed", "2024-02-01"),
+            Page("https://example.com/unknown", "2024-03-01"),
+            Page("https://example.com/new", "2024-04-01"),
+        ]
+    )
+    mock_sitemap_scraper.return_value.scrape.return_value = (pages_obj, [])
+
+    scraped_pages, _ = mock_recipe_scraper._prepare_pages(
+        None,
+        {
+            "https://example.com/unchanged": "2024-01-01",
+            "https://example.com/changed": "2024-01-01",
+            "https://example.com/unknown": None,
+        },
+    )
+
+    assert [p.page_url for p in scraped_pages] == [
+        "https://example.com/changed",
+        "https://example.com/new",
+    ]
+    assert mock_recipe_scraper.recipes.pages_without_recipe == {
+        "https://example.com/unchanged": "2024-01-01",
+        "https://example.com/unknown": "2024-03-01",
+    }
+
+
+@pytest.mark.recipe
+@patch("recipe_database_scraper.recipe_scraper.RecipeScraper._scrape_recipe_page")
+@patch("recipe_database_scraper.recipe_scraper.SitemapScraper")
+def test_scrape_to_json_stream_sitemaps(
+    mock_sitemap_scraper, mock_scrape_recipe_page, mock_recipe_scraper
+):
+    """Test that streamed sitemap pages are scraped with the same exclusion bookkeeping as a full sitemap scrape."""
+    mock_recipe_scraper.robots_parser = None
+    mock_sitemap_scraper.return_value.failed_sitemaps = []
+    mock_sitemap_scraper.return_value.stream.return_value = iter(
+        [
+            (Page("https://example.com/recipe", "2024-01-01"), False),
+            (Page("https://example.com/image.jpg", None), True),
+            (Page("https://example.com/excluded", "2024-01-01"), False),
+            (Page("https://example.com/changed", "2024-02-01"), False),
+        ]
+    )
+    mock_scrape_recipe_page.side_effect = (
+        lambda page_url, last_modified, attempt, **kwargs: (
+            Recipe({"title": page_url}) if page_url.endswith("recipe") else None
+        )
+    )
+
+    json_output = mock_recipe_scraper.scrape_to_json(
+        exclusions_list={
+            "https://example.com/excluded": "2024-01-01",
+            "https://example.com/changed": "2024-01-01",
+            "https://example.com/removed": None,
+        },
+        max_workers=2,
+        stream_sitemaps=True,
+    )
+
+    assert [call.args[0] for call in mock_scrape_recipe_page.call_args_list] == [
+        "https://example.com/recipe",
+        "https://example.com/changed",
+    ]
+    assert list(json_output)[:-1] == ["https://example.com/recipe"]
+    assert mock_recipe_scraper.recipes.pages_without_recipe == {
+        "https://example.com/image.jpg": None,
+        "https://example.com/changed": "2024-02-01",
+        "https://example.com/excluded": "2024-01-01",
+    }
+    assert (
+        "https://example.com/removed",
+        REMOVED_PAGE,
+    ) in mock_recipe_scraper.recipes.unwritten_records
+    mock_sitemap_scraper.return_value.scrape.assert_not_called()
+
+
+@pytest.mark.recipe
+@patch("recipe_database_scraper.recipe_scraper.RecipeScraper._scrape_recipe_page")
+@patch("recipe_database_scraper.recipe_scraper.SitemapScraper")
+def test_plan_and_scrape_to_json_with_plan(
+    mock_sitemap_scraper, mock_scrape_recipe_page, mock_recipe_scraper
+):
+    """Test that a crawl plan splits sitemap pages without fetching them, and that scraping with it only fetches new & changed pages."""
+    mock_recipe_scraper.robots_parser = None
+    pages_obj = Pages()
+    pages_obj.add_list(
+        [
+            Page("https://example.com/new", "2024-01-01"),
+            Page("https://example.com/changed", "2024-02-01"),
+            Page("https://example.com/unchanged", "2024-01-01"),
+            Page("https://example.com/excluded", "2024-01-01"),
+        ]
+    )
+    mock_sitemap_scraper.return_value.scrape.return_value = (
+        pages_obj,
+        ["https://example.com/image.jpg"],
+    )
+    mock_sitemap_scraper.return_value.failed_sitemaps = []
+    mock_scrape_recipe_page.side_effect = (
+        lambda page_url, last_modified, attempt, **kwargs: Recipe(
+            {"title": page_url, "last_modified": last_modified}
+        )
+    )
+
+    crawl_plan = mock_recipe_scraper.plan(
+        input_dict={
+            "https://example.com/changed": {"last_modified": "2024-01-01"},
+            "https://example.com/unchanged": {"last_modified": "2024-01-01"},
+            "https://example.com/gone": {"last_modified": "2024-01-01"},
+        },
+        exclusions_list={
+            "https://example.com/excluded": "2024-01-01",
+            "https://example.com/gone-excluded": "2024-01-01",
+        },
+    )
+
+    assert crawl_plan.to_json() == {
+        "new": ["https://example.com/new"],
+        "changed": ["https://example.com/changed"],
+        "unchanged": ["https://example.com/unchanged"],
+        "excluded": ["https://example.com/excluded"],
+        "filtered": ["https://example.com/image.jpg"],
+        "removed": ["https://example.com/gone-excluded", "https://example.com/gone"],
+        "missing": [],
+    }
+    assert crawl_plan.len_pages_to_fetch == 2
+    mock_scrape_recipe_page.assert_not_called()
+
+    json_output = mock_recipe_scraper.scrape_to_json(plan=crawl_plan)
+
+    assert [call.args[0] for call in mock_scrape_recipe_page.call_args_list] == [
+        "https://example.com/new",
+        "https://example.com/changed",
+    ]
+    assert mock_sitemap_scraper.return_value.scrape.call_count == 1
+    assert list(json_output) == [
+        "https://example.com/new",
+        "https://example.com/changed",
+        "https://example.com/unchanged",
+        "Pages without Recipe",
+    ]
+    assert json_output["Pages without Recipe"] == [
+        "https://example.com/image.jpg",
+        "https://example.com/excluded",
+    ]
+
+
+@pytest.mark.recipe
+@patch("recipe_database_scraper.recipe_scraper.SitemapScraper")
+def test_plan_canonical_urls(mock_sitemap_scraper, mock_recipe_scraper):
+    """Test that input & exclusions match sitemap pages on canonical url, and that their old spelling is pruned from the output."""
+    pages_obj = Pages()
+    pages_obj.add_list(
+        [
+            Page("https://example.com/recipe/", "2024-01-01"),
+            Page("https://example.com/about?utm_source=feed", "2024-01-01"),
+        ]
+    )
+    mock_sitemap_scraper.return_value.scrape.return_value = (pages_obj, [])
+    mock_sitemap_scraper.return_value.failed_sitemaps = []
+
+    crawl_plan = mock_recipe_scraper.plan(
+        input_dict={"https://EXAMPLE.com:443/recipe": {"last_modified": "2024-01-01"}},
+        exclusions_list={"https://example.com/about": "2024-01-01"},
+    )
+
+    assert crawl_plan.unchanged == ["https://example.com/recipe/"]
+    assert crawl_plan.excluded == {
+        "https://example.com/about?utm_source=feed": "2024-01-01"
+    }
+    assert crawl_plan.removed == [
+        "https://EXAMPLE.com:443/recipe",
+        "https://example.com/about",
+    ]
+    assert list(crawl_plan.input_dict) == ["https://example.com/recipe/"]
+
+
+@pytest.mark.recipe
+@patch("recipe_database_scraper.recipe_scraper.SitemapScraper")
+def test_apply_plan_url_rules(mock_sitemap_scraper):
+    """Test that pages filtered out by the include & exclude rules are not stored as pages without recipe."""
+    recipe_scraper = RecipeScraper(
+        "https://example.com", "test-agent", exclude_urls=["*/print/*"]
+    )
+    mock_sitemap_scraper.return_value.scrape.return_value = (
+        Pages(),
+        ["https://example.com/image.jpg", "https://example.com/print/soup"],
+    )
+    mock_sitemap_scraper.return_value.failed_sitemaps = []
+
+    crawl_plan = recipe_scraper.plan()
+    recipe_scraper._apply_plan(crawl_plan)
+
+    assert crawl_plan.filtered == [
+        "https://example.com/image.jpg",
+        "https://example.com/print/soup",
+    ]
+    assert recipe_scraper.recipes.pages_without_recipe == {
+        "https://example.com/image.jpg": None
+    }
+
+
+@pytest.mark.recipe
+@patch("recipe_database_scraper.recipe_scraper.RecipeScraper._scrape_recipe_page")
+@patch("recipe_database_scraper.recipe_scraper.SitemapScraper")
+def test_plan_failed_sitemaps(
+    mock_sitemap_scraper, mock_scrape_recipe_page, mock_recipe_scraper
+):
+    """Test that stored pages missing from the sitemap are kept in the output when a sitemap failed or the sitemap is empty, while old spellings are still pruned."""
+    mock_recipe_scraper.robots_parser = None
+    pages_obj = Pages()
+    pages_obj.add_list([Page("https://example.com/recipe/", "2024-01-01")])
+    mock_sitemap_scraper.return_value.scrape.return_value = (pages_obj, [])
+    mock_sitemap_scraper.return_value.stream.return_value = iter(
+        [(Page("https://example.com/recipe/", "2024-01-01"), False)]
+    )
+    mock_sitemap_scraper.return_value.failed_sitemaps = [
+        "https://example.com/broken-sitemap.xml"
+    ]
+    input_dict = {
+        "https://example.com/recipe": {"last_modified": "2024-01-01"},
+        "https://example.com/other": {"last_modified": "2024-01-01"},
+    }
+    exclusions_list = {"https://example.com/about": "2024-01-01"}
+
+    crawl_plan = mock_recipe_scraper.plan(
+        input_dict=dict(input_dict), exclusions_list=exclusions_list
+    )
+
+    assert crawl_plan.removed == ["https://example.com/recipe"]
+    assert crawl_plan.missing_input == ["https://example.com/other"]
+    assert crawl_plan.missing_excluded == exclusions_list
+
+    json_output = mock_recipe_scraper.scrape_to_json(plan=crawl_plan)
+
+    stream_scraper = RecipeScraper("https://example.com", "test-agent")
+    stream_scraper.robots_parser = None
+    stream_output = stream_scraper.scrape_to_json(
+        input_dict=dict(input_dict),
+        exclusions_list=exclusions_list,
+        stream_sitemaps=True,
+    )
+
+    mock_scrape_recipe_page.assert_not_called()
+    for recipe_scraper, output in [
+        (mock_recipe_scraper, json_output),
+        (stream_scraper, stream_output),
+    ]:
+        assert recipe_scraper.recipes.pages_without_recipe == exclusions_list
+        assert set(output) == {
+            "https://example.com/recipe/",
+            "https://example.com/other",
+            "Pages without Recipe",
+        }
+        assert (
+            output["https://example.com/other"]
+            == input_dict["https://example.com/other"]
+        )
+        assert output["Pages without Recipe"] == ["https://example.com/about"]
+
+    mock_sitemap_scraper.return_value.scrape.return_value = (Pages(), [])
+    mock_sitemap_scraper.return_value.failed_sitemaps = []
+
+    crawl_plan = mock_recipe_scraper.plan(input_dict=dict(input_dict))
+
+    assert crawl_plan.removed == []
+
+
+@pytest.mark.recipe
+@patch("recipe_database_scraper.recipe_scraper.RecipeScraper._scrape_recipe_page")
+@patch("recipe_database_scraper.recipe_scraper.SitemapScraper")
+def test_scrape_to_json_max_workers(
+    mock_sitemap_scraper, mock_scrape_recipe_page, mock_recipe_scraper
+):
+    """Test that scraping on a thread pool keeps the sitemap order of the output keys."""
+    mock_recipe_scraper.robots_parser = None
+    pages_obj = Pages()
+    page_urls = [f"https://example.com/recipe-{i}" for i in range(20)]
+    pages_obj.add_list(
+        [MagicMock(page_url=url, last_modified=None) for url in page_urls]
+    )
+
+    mock_sitemap_scraper.return_value.scrape.return_value = (pages_obj, [])
+    mock_scrape_recipe_page.side_effect = (
+        lambda page_url, last_modified, attempt, **kwargs: (
+            Recipe({"title": page_url}) if page_url.endswith(("0", "5")) else None
+        )
+    )
+
+    json_output = mock_recipe_scraper.scrape_to_json(max_workers=4)
+
+    recipe_urls = [url for url in page_urls if url.endswith(("0", "5"))]
+    assert list(json_output)[:-1] == recipe_urls
+    assert json_output["Pages without Recipe"] == [
+        url for url in page_urls if url not in recipe_urls
+    ]
+    assert mock_recipe_scraper.pages_per_second > 0
+
+
+@pytest.mark.recipe
+@patch("recipe_database_scraper.recipe_scraper.RecipeScraper._scrape_recipe_page")
+@patch("recipe_database_scraper.recipe_scraper.SitemapScraper")
+def test_scrape_to_json_jsonl_output(
+    mock_sitemap_scraper, mock_scrape_recipe_page, mock_recipe_scraper
+):
+    """Test that a jsonl output file holds every page once after the run, and loads as the json output."""
+    mock_recipe_scraper.robots_parser = None
+    pages_obj = Pages()
+    page_urls = [f"https://example.com/recipe-{i}" for i in range(7)]
+    pages_obj.add_list(
+        [MagicMock(page_url=url, last_modified=None) for url in page_urls]
+    )
+
+    mock_sitemap_scraper.return_value.scrape.return_value = (pages_obj, [])
+    mock_scrape_recipe_page.side_effect = (
+        lambda page_url, last_modified, attempt, **kwargs: (
+            Recipe({"title": page_url}) if page_url.endswith(("0", "5")) else None
+        )
+    )
+
+    with TemporaryDirectory() as tmp_dir:
+        output_file = os.path.join(tmp_dir, "output.jsonl")
+        json_output = mock_recipe_scraper.scrape_to_json(
+            output_file=output_file, batch_size=3
+        )
+
+        with open(output_file) as f:
+            assert len(f.readlines()) == len(page_urls)
+        assert FileHandler(output_file).load_jsonl_file() == {
+            "https://example.com/recipe-0": {"title": "https://example.com/recipe-0"},
+            "https://example.com/recipe-5": {"title": "https://example.com/recipe-5"},
+            "Pages without Recipe": json_output["Pages without Recipe"],
+        }
+    # Written recipes are dropped from memory instead of spooled
+    assert list(json_output) == ["Pages without Recipe"]
+    assert mock_recipe_scraper.recipes.spool is None
+
+
+@pytest.mark.recipe
+@patch("recipe_database_scraper.recipe_scraper.RecipeScraper._scrape_recipe_page")
+@patch("recipe_database_scraper.recipe_scraper.SitemapScraper")
+def test_scrape_to_json_json_output_batches(
+    mock_sitemap_scraper, mock_scrape_recipe_page, mock_recipe_scraper
+):
+    """Test that a json output file written in batches holds every recipe, and that the spool file is closed at the end of the run."""
+    mock_recipe_scraper.robots_parser = None
+    pages_obj = Pages()
+    page_urls = [f"https://example.com/recipe-{i}" for i in range(7)]
+    pages_obj.add_list(
+        [MagicMock(page_url=url, last_modified=None) for url in page_urls]
+    )
+    mock_sitemap_scraper.return_value.scrape.return_value = (pages_obj, [])
+    mock_scrape_recipe_page.side_effect = (
+        lambda page_url, last_modified, attempt, **kwargs: Recipe({"title": page_url})
+    )
+    spools = []
+    evict = mock_recipe_scraper.recipes.evict
+
+    def tracked_evict(**kwargs):
+        evict(**kwargs)
+        spools.append(mock_recipe_scraper.recipes.spool)
+
+    mock_recipe_scraper.recipes.evict = tracked_evict
+
+    with TemporaryDirectory() as tmp_dir:
+        output_file = os.path.join(tmp_dir, "output.json")
+        json_output = mock_recipe_scraper.scrape_to_json(
+            output_file=output_file, batch_size=3
+        )
+
+        assert list(FileHandler(output_file).load_json_file()) == page_urls
+    assert json_output == {}
+    assert spools and all(spool.spool_file.closed for spool in spools)
+    assert mock_recipe_scraper.recipes.spool is None
+
+
+@pytest.mark.recipe
+@patch("recipe_database_scraper.recipe_scraper.RecipeScraper._scrape_recipe_page")
+@patch("recipe_database_scraper.recipe_scraper.SitemapScraper")
+def test_scrape_to_json_output_db(
+    mock_sitemap_scraper, mock_scrape_recipe_page, mock_recipe_scraper
+):
+    """Test that batches are upserted into the output database."""
+    mock_recipe_scraper.robots_parser = None
+    pages_obj = Pages()
+    page_urls = [f"https://example.com/recipe-{i}" for i in range(7)]
+    pages_obj.add_list(
+        [MagicMock(page_url=url, last_modified=None) for url in page_urls]
+    )
+
+    mock_sitemap_scraper.return_value.scrape.return_value = (pages_obj, [])
+    mock_scrape_recipe_page.side_effect = (
+        lambda page_url, last_modified, attempt, **kwargs: (
+            Recipe({"title": page_url}) if page_url.endswith(("0", "5")) else None
+        )
+    )
+
+    with TemporaryDirectory() as tmp_dir:
+        with RecipeDatabase(os.path.join(tmp_dir, "recipes.sqlite")) as database:
+            database.upsert = MagicMock(wraps=database.upsert)
+            json_output = mock_recipe_scraper.scrape_to_json(
+                batch_size=3, output_db=database
+            )
+
+            assert [len(call.args[0]) for call in database.upsert.call_args_list] == [
+                3,
+                3,
+                1,
+            ]
+            assert database.load_site("https://example.com") == {
+                "https://example.com/recipe-0": {
+                    "title": "https://example.com/recipe-0"
+                },
+                "https://example.com/recipe-5": {
+                    "title": "https://example.com/recipe-5"
+                },
+                "Pages without Recipe": json_output["Pages without Recipe"],
+            }
+        assert list(json_output) == ["Pages without Recipe"]
+
+
+@pytest.mark.recipe
+@patch("recipe_database_scraper.recipe_scraper.AsyncHTMLScraper")
+@patch("recipe_database_scraper.recipe_scraper.SitemapScraper")
+def test_ascrape_to_json(
+    mock_sitemap_scraper, mock_async_html_scraper, mock_recipe_scraper
+):
+    """Test that ascrape_to_json keeps the sitemap order while pages finish out of order."""
+    mock_recipe_scraper.robots_parser = None
+    mock_async_html_scraper.return_value.__aenter__.return_value = MagicMock()
+    pages_obj = Pages()
+    page_urls = [f"https://example.com/recipe-{i}" for i in range(10)]
+    pages_obj.add_list(
+        [MagicMock(page_url=url, last_modified=None) for url in page_urls]
+    )
+    mock_sitemap_scraper.return_value.scrape.return_value = (pages_obj, [])
+
+    async def mock_ascrape_recipe_page(
+        page_url, last_modified, html_scraper, attempt, **kwargs
+    ):
+        # Earlier pages take longer, so pages finish in reverse order
+        await asyncio.sleep(0.001 * (10 - int(page_url.split("-")[-1])))
+        return Recipe({"title": page_url})
+
+    with patch.object(
+        mock_recipe_scraper, "_ascrape_recipe_page", mock_ascrape_recipe_page
+    ):
+        json_output = asyncio.run(mock_recipe_scraper.ascrape_to_json(concurrency=5))
+
+    assert list(json_output) == page_urls
+
+
+@pytest.mark.recipe
+@patch("recipe_database_scraper.recipe_scraper.RecipeScraper._scrape_recipe_page")
+@patch("recipe_database_scraper.recipe_scraper.SitemapScraper")
+def test_scrape_to_json_retry_queue(
+    mock_sitemap_scraper, mock_scrape_recipe_page, mock_recipe_scraper
+):
+    """Test that a page to retry is parked on the retry queue while the next pages are scraped."""
+    mock_recipe_scraper.robots_parser = None
+    pages_obj = Pages()
+    page_urls = [f"https://example.com/recipe-{i}" for i in range(3)]
+    pages_obj.add_list(
+        [MagicMock(page_url=url, last_modified=None) for url in page_urls]
+    )
+    mock_sitemap_scraper.return_value.scrape.return_value = (pages_obj, [])
+
+    calls = []
+
+    def mock_scrape(page_url, last_modified, attempt, **kwargs):
+        calls.append((page_url, attempt))
+        if page_url.endswith("-0") and attempt == 1:
+            return RetryLater(0.05)
+        return Recipe({"title": page_url})
+
+    mock_scrape_recipe_page.side_effect = mock_scrape
+
+    json_output = mock_recipe_scraper.scrape_to_json()
+
+    assert calls == [
+        ("https://example.com/recipe-0", 1),
+        ("https://example.com/recipe-1", 1),
+        ("https://example.com/recipe-2", 1),
+        ("https://example.com/recipe-0", 2),
+    ]
+    assert list(json_output) == page_urls
+
+
+@pytest.mark.recipe
+@patch("recipe_database_scraper.recipe_scraper.scrape_html")
+def test_scrape_recipe_page_stores_validators(mock_scrape_html, mock_recipe_scraper):
+    """Test that the ETag & Last-Modified response headers are stored with the recipe."""
+    mock_recipe_scraper.html_scraper = MagicMock()
+    mock_recipe_scraper.html_scraper.fetch_page_once.return_value = FetchedPage(
+        "https://example.com/recipe",
+        MOCK_RECIPE_HTML,
+        headers={"ETag": '"v1"', "Last-Modified": "Wed, 01 Jan 2025 00:00:00 GMT"},
+    )
+    mock_scrape_html.return_value.to_json.return_value = {"title": "Test Recipe"}
+
+    recipe = mock_recipe_scraper._scrape_recipe_page("https://example.com/recipe", None)
+
+    assert recipe.recipe_dict["etag"] == '"v1"'
+    assert recipe.recipe_dict["http_last_modified"] == "Wed, 01 Jan 2025 00:00:00 GMT"
+
+
+@pytest.mark.recipe
+@patch("recipe_database_scraper.recipe_scraper.scrape_html")
+def test_scrape_recipe_page_not_modified(mock_scrape_html, mock_recipe_scraper):
+    """Test that a 304 response to a conditional request reuses the stored recipe without parsing."""
+    stored_recipe = {**MOCK_RECIPE_DICT, "etag": '"v1"', "last_modified": None}
+    mock_recipe_scraper.html_scraper = MagicMock()
+    mock_recipe_scraper.html_scraper.fetch_page_once.return_value = FetchedPage(
+        "https://example.com/recipe", None, status_code=304
+    )
+
+    recipe = mock_recipe_scraper._scrape_recipe_page(
+        "https://example.com/recipe", "2001-01-01", stored_recipe=stored_recipe
+    )
+
+    _, kwargs = mock_recipe_scraper.html_scraper.fetch_page_once.call_args
+    assert kwargs["headers"] == {"If-None-Match": '"v1"'}
+    assert recipe.recipe_dict == {**stored_recipe, "last_modified": "2001-01-01"}
+    mock_scrape_html.assert_not_called()
+
+
+@pytest.mark.recipe
+@patch("recipe_database_scraper.recipe_scraper.scrape_html")
+def test_scrape_recipe_page_unconditional_not_modified(
+    mock_scrape_html, mock_recipe_scraper
+):
+    """Test that a 304 response without a stored recipe is handled as a failed fetch."""
+    mock_recipe_scraper.html_scraper = MagicMock()
+    mock_recipe_scraper.html_scraper.fetch_page_once.return_value = FetchedPage(
+        "https://example.com/recipe", None, status_code=304
+    )
+
+    recipe = mock_recipe_scraper._scrape_recipe_page(
+        "https://example.com/recipe", "2001-01-01"
+    )
+
+    assert recipe is None
+    mock_scrape_html.assert_not_called()
+
+
+@pytest.mark.recipe
+def test_input_recipe_revalidates_without_lastmod(mock_recipe_scraper):
+    """Test that stored recipes with validators are revalidated when the sitemap has no lastmod."""
+    page = MagicMock(page_url="https://example.com/recipe", last_modified=None)
+    with_validators = {
+        "https://example.com/recipe": {"last_modified": None, "etag": '"v1"'}
+    }
+    without_validators = {"https://example.com/recipe": {"last_modified": None}}
+
+    assert mock_recipe_scraper._input_recipe("", page, with_validators) is None
+    assert mock_recipe_scraper._input_recipe("", page, without_validators)
+
+
+@pytest.mark.recipe
+@patch("recipe_database_scraper.recipe_scraper.scrape_html")
+def test_scrape_recipe_page_html_cache(mock_scrape_html, mock_recipe_scraper):
+    """Test that fetched html is cached & subsequent scrapes of the page do not go to the network."""
+    mock_recipe_scraper.html_scraper = MagicMock()
+    mock_recipe_scraper.html_scraper.fetch_page_once.return_value = FetchedPage(
+        "https://example.com/recipe", MOCK_RECIPE_HTML
+    )
+    mock_scrape_html.return_value.to_json.return_value = {"title": "Test Recipe"}
+
+    with TemporaryDirectory() as tmp_dir:
+        mock_recipe_scraper.html_cache = HTMLCache(tmp_dir)
+        for _ in range(2):
+            recipe = mock_recipe_scraper._scrape_recipe_page(
+                "https://example.com/recipe", None
+            )
+            assert recipe.recipe_dict["title"] == "Test Recipe"
+
+    mock_recipe_scraper.html_scraper.fetch_page_once.assert_called_once()
+    assert mock_scrape_html.call_args_list[1].args[0] == MOCK_RECIPE_HTML
@@ -1,7 +1,7 @@
 import pytest
 import robots
 from unittest.mock import patch
-from recipe_database_scraper._utils import robots_parser
+from recipe_database_scraper._utils import robots_parser, RobotsParser
 from recipe_database_scraper._exceptions import RobotParserException
 
 robots_mock_content = """
@@ -72,3 +72,49 @@ def test_robot_parser_no_robots_file(mock_from_uri):
         RobotParserException, match=f"Cannot find robots.txt file for {url}"
     ):
         robots_parser(url)
+
+
+@pytest.mark.util
+def test_robot_parser_rate_directives():
+    """Test that the RobotsParser keeps Crawl-delay & Request-rate directives per user agent."""
+    parser = RobotsParser.from_string(
+        """
+User-agent: *
+Crawl-delay: 5
+Disallow: /private/
+
+User-agent: Bingbot
+Request-rate: 30/1m
+Disallow: /no-bing/
+"""
+    )
+
+    assert parser.crawl_delay("Itsame Mario") == 5.0
+    assert parser.request_rate("Itsame Mario") is None
+    assert parser.crawl_delay("Bingbot") is None
+    assert parser.request_rate("Bingbot") == (30, 60.0)
+    assert not parser.can_fetch("Bingbot", "/no-bing/")
+
+
+@pytest.mark.util
+def test_robot_parser_product_token():
+    """Test that rules & rate directives of a group apply to full user agent strings with its product token."""
+    parser = RobotsParser.from_string(
+        """
+User-agent: *
+Crawl-delay: 5
+Disallow: /private/
+
+User-agent: MyBot
+Crawl-delay: 2
+Request-rate: 30/1m
+Disallow: /no-mybot/
+"""
+    )
+
+    useragent = "MyBot/1.0 (+https://example.com/bot)"
+    assert parser.crawl_delay(useragent) == 2.0
+    assert parser.request_rate(useragent) == (30, 60.0)
+    assert not parser.can_fetch(useragent, "/no-mybot/")
+    assert parser.crawl_delay("OtherBot/2.0") == 5.0
+    assert parser.can_fetch("OtherBot/2.0", "/no-mybot/")
@@ -0,0 +1,65 @@
+import os
+import pytest
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+from recipe_database_scraper import scrape_sites
+from recipe_database_scraper._exceptions import InputException
+
+
+@pytest.mark.recipe
+@patch("recipe_database_scraper.scrape_site")
+def test_scrape_sites(mock_scrape_site):
+    """Test that scrape_sites shares one scheduler, writes every site to its own output file & keeps going when a site fails."""
+
+    def scrape_site(url, user_agent, **kwargs):
+        if "broken" in url:
+            raise Exception("No sitemap found")
+        return {"url": url}
+
+    mock_scrape_site.side_effect = scrape_site
+
+    with TemporaryDirectory() as tmp_dir:
+        results = scrape_sites(
+            [
+                {"url": "https://example.com/", "max_workers": 4},
+                {"url": "https://broken.com/"},
+                {"url": "https://other.com/", "output_db": "recipes.sqlite"},
+            ],
+            "Hungry Scraper",
+            max_sites=2,
+            max_connections=8,
+            output_dir=tmp_dir,
+        )
+
+        calls = {call.args[0]: call.kwargs for call in mock_scrape_site.call_args_list}
+        assert calls["https://example.com/"]["output_file"] == os.path.join(
+            tmp_dir, "example.com.json"
+        )
+        assert calls["https://example.com/"]["max_workers"] == 4
+        assert "output_file" not in calls["https://other.com/"]
+        schedulers = {id(kwargs["scheduler"]) for kwargs in calls.values()}
+        assert len(schedulers) == 1
+        assert calls["https://example.com/"]["scheduler"].max_connections == 8
+
+    assert list(results) == [
+        "https://example.com/",
+        "https://broken.com/",
+        "https://other.com/",
+    ]
+    assert results["https://example.com/"] == {"url": "https://example.com/"}
+    assert isinstance(results["https://broken.com/"], Exception)
+
+
+@pytest.mark.recipe
+@pytest.mark.parametrize(
+    "manifest",
+    [
+        [{"max_workers": 4}],
+        [{"url": "https://example.com/", "workers": 4}],
+        [{"url": "https://example.com/"}, {"url": "https://example.com/recipes"}],
+    ],
+)
+def test_scrape_sites_invalid_manifest(manifest):
+    """Test that invalid manifests are rejected before any site is scraped."""
+    with pytest.raises(InputException):
+        scrape_sites(manifest, "Hungry Scraper")
@@ -0,0 +1,127 @@
+import gzip
+import pytest
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from tempfile import TemporaryDirectory
+from recipe_database_scraper.sitemap_cache import SitemapCache, index_lastmods
+from recipe_database_scraper.sitemap_scraper import SitemapScraper
+
+SITEMAP_INDEX = """<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+<sitemap><loc>{base_url}/sitemap-2023.xml</loc><lastmod>2023-12-31</lastmod></sitemap>
+<sitemap><loc>{base_url}/sitemap-2024.xml</loc><lastmod>{lastmod_2024}</lastmod></sitemap>
+</sitemapindex>"""
+
+PAGES_SITEMAP = """<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+<url><loc>{base_url}/{page}</loc></url>
+</urlset>"""
+
+
+@pytest.fixture
+def sitemap_site():
+    """Local site with a sitemap index listing a lastmod per sub-sitemap. The index supports ETag validation"""
+    requested_paths = []
+
+    class SitemapHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requested_paths.append(self.path)
+            base_url = f"http://localhost:{self.server.server_port}"
+            pages = {
+                "/robots.txt": f"Sitemap: {base_url}/sitemap_index.xml",
+                "/sitemap_index.xml": SITEMAP_INDEX.format(
+                    base_url=base_url, lastmod_2024=self.server.lastmod_2024
+                ),
+                "/sitemap-2023.xml": PAGES_SITEMAP.format(
+                    base_url=base_url, page="recipe-2023"
+                ),
+                "/sitemap-2024.xml": PAGES_SITEMAP.format(
+                    base_url=base_url, page="recipe-2024"
+                ),
+            }
+            body = pages.get(self.path)
+            etag = f'"{hash(body)}"'
+            if body and self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200 if body else 404)
+            if body:
+                self.send_header("ETag", etag)
+            self.end_headers()
+            if body:
+                self.wfile.write(body.encode())
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SitemapHandler)
+    server.lastmod_2024 = "2024-06-30"
+    server.requested_paths = requested_paths
+    server.base_url = f"http://localhost:{server.server_port}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def scrape_page_urls(homepage, sitemap_cache):
+    sitemap_scraper = SitemapScraper(homepage, sitemap_cache=sitemap_cache)
+    sitemap_scraper._scrape_domain()
+    return sorted(page.page_url for page in sitemap_scraper.pages), sitemap_scraper
+
+
+@pytest.mark.sitemap
+def test_sitemap_cache_conditional_refresh(sitemap_site):
+    """Test that only sub-sitemaps with a changed index lastmod are fetched again."""
+    expected_urls = [
+        sitemap_site.base_url + "/recipe-2023",
+        sitemap_site.base_url + "/recipe-2024",
+    ]
+    with TemporaryDirectory() as tmp_dir:
+        page_urls, _ = scrape_page_urls(
+            sitemap_site.base_url + "/", SitemapCache(tmp_dir)
+        )
+        assert page_urls == expected_urls
+        assert sitemap_site.requested_paths.count("/sitemap-2023.xml") == 1
+
+        # Unchanged sub-sitemaps are served from the cache, the index is revalidated
+        sitemap_site.requested_paths.clear()
+        page_urls, sitemap_scraper = scrape_page_urls(
+            sitemap_site.base_url + "/", SitemapCache(tmp_dir)
+        )
+        assert page_urls == expected_urls
+        assert "/sitemap-2023.xml" not in sitemap_site.requested_paths
+        assert "/sitemap-2024.xml" not in sitemap_site.requested_paths
+        assert sitemap_scraper.web_client.served_from_cache == 2
+        assert sitemap_scraper.web_client.not_modified >= 1
+
+        # A changed index lastmod refreshes that sub-sitemap only
+        sitemap_site.lastmod_2024 = "2024-07-31"
+        sitemap_site.requested_paths.clear()
+        page_urls, _ = scrape_page_urls(
+            sitemap_site.base_url + "/", SitemapCache(tmp_dir)
+        )
+        assert page_urls == expected_urls
+        assert "/sitemap-2023.xml" not in sitemap_site.requested_paths
+        assert sitemap_site.requested_paths.count("/sitemap-2024.xml") == 1
+
+
+@pytest.mark.sitemap
+def test_index_lastmods():
+    """Test reading the lastmod of sub-sitemaps from plain & gzipped sitemap indexes with namespace prefixes."""
+    index = (
+        b'<?xml version="1.0"?><sm:sitemapindex xmlns:sm="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        b"<sm:sitemap><sm:loc>https://example.com/a.xml?x=1&amp;y=2</sm:loc><sm:lastmod>2024-01-01</sm:lastmod></sm:sitemap>"
+        b"<sm:sitemap><sm:loc>https://example.com/b.xml</sm:loc></sm:sitemap>"
+        b"</sm:sitemapindex>"
+    )
+    expected_lastmods = {"https://example.com/a.xml?x=1&y=2": "2024-01-01"}
+
+    assert index_lastmods(index) == expected_lastmods
+    assert index_lastmods(gzip.compress(index)) == expected_lastmods
+    assert (
+        index_lastmods(b"<urlset><url><loc>https://example.com/</loc></url></urlset>")
+        == {}
+    )
@@ -1,5 +1,8 @@
 import pytest
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch, MagicMock
+from usp.objects.sitemap import AbstractIndexSitemap, InvalidSitemap
 from recipe_database_scraper._exceptions import SitemapScraperException
 from recipe_database_scraper.sitemap_scraper import (
     SitemapScraper,
@@ -109,37 +112,68 @@ def test_sub_sitemaps_filtering(mock_sitemap_tree_for_homepage):
 
 
 @pytest.mark.sitemap
-def test_sitemap_get_pages():
-    """Test the get pages logic of the SitemapScraper."""
+def test_sitemap_iter_pages():
+    """Test that the single pass over the sitemap tree yields every page once, classified as kept or filtered."""
     scraper = SitemapScraper("https://example.com")
     scraper.sitemap_tree = mock_sitemap_sms
 
-    all_pages = scraper._get_all_pages()
+    classified_urls = {page.url: filtered for page, filtered in scraper._iter_pages()}
 
-    all_pages_urls = [page.url for page in all_pages]
+    assert len(classified_urls) == 7
+    assert classified_urls["https://example.com/blog/post1"] is False
+    assert classified_urls["https://example.com/recipes/page1"] is False
+    # Pages of sub-sitemaps matching the filter keywords are filtered out
+    assert classified_urls["https://example.com/sub-sitemap2/page1"] is True
+    assert classified_urls["https://example.com/sub-sitemap3/page2"] is True
 
-    test_urls = [
-        "https://example.com/recipes/page1",
-        "https://example.com/sub-sitemap2/page1",
-        "https://example.com/blog/post1",
+
+@pytest.mark.sitemap
+def test_sitemap_iter_pages_index_sitemap():
+    """Test that pages of an index sitemap are only taken from its sub-sitemaps & urls with the same canonical url are dropped."""
+    sub_sitemap = MagicMock(url="https://example.com/recipes-sitemap.xml")
+    sub_sitemap.all_pages.return_value = [
+        MagicMock(url="https://example.com/recipes/page1", last_modified=None),
+        MagicMock(
+            url="https://EXAMPLE.com:443/recipes/page1/?utm_source=feed",
+            last_modified=None,
+        ),
+        MagicMock(url="https://example.com/recipes/page2.jpg", last_modified=None),
     ]
+    sub_sitemap.sub_sitemaps = []
+    index_sitemap = MagicMock(
+        spec=AbstractIndexSitemap, url="https://example.com/sitemap_index.xml"
+    )
+    index_sitemap.sub_sitemaps = [sub_sitemap]
+
+    scraper = SitemapScraper("https://example.com")
+    scraper.sitemap_tree = index_sitemap
 
-    assert len(all_pages) == 7
-    for test_url in test_urls:
-        assert test_url in all_pages_urls
+    classified_urls = [(page.url, filtered) for page, filtered in scraper._iter_pages()]
+
+    assert classified_urls == [
+        ("https://example.com/recipes/page1", False),
+        ("https://example.com/recipes/page2.jpg", True),
+    ]
+    index_sitemap.all_pages.assert_not_called()
+    assert scraper.failed_sitemaps == []
 
 
 @pytest.mark.sitemap
-def test_sitemap_scraper_url_filtering():
-    """Test the filtering logic of the SitemapScraper."""
-    scraper = SitemapScraper("https://example.com")
-    scraper.sitemap_tree = mock_sitemap_sms
+def test_sitemap_iter_pages_failed_sub_sitemap():
+    """Test that sub-sitemaps that could not be fetched are tracked, so missing pages are not taken as removed."""
+    invalid_sitemap = InvalidSitemap(
+        url="https://example.com/broken-sitemap.xml", reason="Server error"
+    )
+    index_sitemap = MagicMock(
+        spec=AbstractIndexSitemap, url="https://example.com/sitemap_index.xml"
+    )
+    index_sitemap.sub_sitemaps = [invalid_sitemap]
 
-    filtered_urls = scraper._get_filter_urls()
+    scraper = SitemapScraper("https://example.com")
+    scraper.sitemap_tree = index_sitemap
 
-    # Since the URL "https://example.com/sub-sitemap2/page1" should match the filter keywords, it should be filtered out
-    assert "https://example.com/sub-sitemap2/page1" in filtered_urls
-    assert "https://example.com/recipes/page1" not in filtered_urls
+    assert list(scraper._iter_pages()) == []
+    assert scraper.failed_sitemaps == ["https://example.com/broken-sitemap.xml"]
 
 
 @pytest.mark.sitemap
@@ -180,3 +214,155 @@ def test_pages_class():
     assert len(pages) == 2
     assert pages[0] == page_1
     assert list(pages) == [page_1, page_2]
+
+
+@pytest.mark.sitemap
+@pytest.mark.parametrize(
+    "last_modified",
+    [
+        None,
+        "2024-10-18",
+        "2024-10-18T10:15:00",
+        "2024-10-18T10:15:00+02:00",
+        "2024-10-18T10:15:00-05:30",
+        "2024-10-18T10:15:00.250000+00:00",  # Sub-second precision is kept as string
+        "2024-10-18T10:15:00Z",
+        "October 18, 2024",
+    ],
+)
+def test_pages_last_modified_round_trip(last_modified):
+    """Test that Pages returns the exact last modified string it was given, also when it is not stored as epoch seconds."""
+    pages = Pages()
+    pages.add(Page("https://example.com/recipe/1", last_modified))
+
+    assert pages[0].last_modified == last_modified
+
+
+@pytest.mark.sitemap
+def test_pages_compact_storage():
+    """Test that Pages interns host prefixes & drops urls in bulk while keeping the order & dates of the other pages."""
+    pages = Pages()
+    pages.add_list(
+        [
+            Page(f"https://example.com/recipe/{str(number)}", "2024-10-18")
+            for number in range(5)
+        ]
+        + [Page("https://other.com", None), Page("https://example.com/é", None)]
+    )
+
+    assert pages._hosts == ["https://example.com", "https://other.com"]
+    assert pages[-1].page_url == "https://example.com/é"
+
+    pages.drop_url_list(
+        ["https://example.com/recipe/1", "https://example.com/recipe/3"]
+    )
+
+    assert [page.page_url for page in pages] == [
+        "https://example.com/recipe/0",
+        "https://example.com/recipe/2",
+        "https://example.com/recipe/4",
+        "https://other.com",
+        "https://example.com/é",
+    ]
+    assert [page.last_modified for page in pages[:3]] == ["2024-10-18"] * 3
+
+
+SITEMAP_INDEX = """<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+<sitemap><loc>{base_url}/recipe-sitemap.xml</loc></sitemap>
+<sitemap><loc>{base_url}/news-sitemap.xml</loc></sitemap>
+</sitemapindex>"""
+
+PAGES_SITEMAP = """<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+{urls}
+</urlset>"""
+
+
+@pytest.fixture
+def sitemap_site():
+    """Local site serving robots.txt, a sitemap index & two sub-sitemaps. Records the requested paths & user agents.
+    The news sub-sitemap is only served once release is set
+    """
+    requested_paths = []
+    served_paths = []
+    user_agents = []
+    release = threading.Event()
+
+    class SitemapHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requested_paths.append(self.path)
+            user_agents.append(self.headers.get("User-Agent"))
+            base_url = f"http://localhost:{self.server.server_port}"
+            pages = {
+                "/robots.txt": f"Sitemap: {base_url}/sitemap_index.xml",
+                "/sitemap_index.xml": SITEMAP_INDEX.format(base_url=base_url),
+                "/recipe-sitemap.xml": PAGES_SITEMAP.format(
+                    urls=f"<url><loc>{base_url}/recipe-1</loc><lastmod>2024-01-01</lastmod></url>"
+                    f"<url><loc>{base_url}/recipe-1.jpg</loc></url>"
+                ),
+                "/news-sitemap.xml": PAGES_SITEMAP.format(
+                    urls=f"<url><loc>{base_url}/news-1</loc></url>"
+                ),
+            }
+            if self.path == "/news-sitemap.xml":
+                release.wait(timeout=5)
+            body = pages.get(self.path)
+            self.send_response(200 if body else 404)
+            self.end_headers()
+            if body:
+                self.wfile.write(body.encode())
+            served_paths.append(self.path)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SitemapHandler)
+    server.requested_paths = requested_paths
+    server.served_paths = served_paths
+    server.user_agents = user_agents
+    server.release = release
+    server.base_url = f"http://localhost:{server.server_port}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.sitemap
+def test_sitemap_stream(sitemap_site):
+    """Test that streamed pages are available before the remaining sub-sitemaps are fetched."""
+    stream = SitemapScraper(sitemap_site.base_url + "/").stream()
+
+    page, filtered = next(stream)
+    assert (page.page_url, page.last_modified, filtered) == (
+        sitemap_site.base_url + "/recipe-1",
+        "2024-01-01T00:00:00",
+        False,
+    )
+    assert "/news-sitemap.xml" not in sitemap_site.served_paths
+
+    sitemap_site.release.set()
+    remaining = [(page.page_url, filtered) for page, filtered in stream]
+
+    assert remaining == [
+        (sitemap_site.base_url + "/recipe-1.jpg", True),
+        (sitemap_site.base_url + "/news-1", True),
+    ]
+    # Every sitemap is fetched once
+    assert sitemap_site.requested_paths.count("/news-sitemap.xml") == 1
+    assert sitemap_site.requested_paths.count("/sitemap_index.xml") == 1
+
+
+@pytest.mark.sitemap
+def test_sitemap_user_agent(sitemap_site):
+    """Test that sitemaps are requested with the user agent of the scraper."""
+    sitemap_site.release.set()
+
+    SitemapScraper(
+        sitemap_site.base_url + "/", user_agent="Hungry Scraper"
+    )._scrape_domain()
+
+    assert sitemap_site.user_agents
+    assert set(sitemap_site.user_agents) == {"Hungry Scraper"}
@@ -0,0 +1,127 @@
+import os
+import pytest
+from tempfile import TemporaryDirectory
+from recipe_database_scraper.sqlite_store import RecipeDatabase
+from recipe_database_scraper._utils import REMOVED_PAGE, PageWithoutRecipe
+
+
+@pytest.mark.util
+def test_recipe_database_upsert_and_load():
+    """Test that upserted records load per host in the json output format, with fetch metadata merged back."""
+    with TemporaryDirectory() as tmp_dir:
+        with RecipeDatabase(os.path.join(tmp_dir, "recipes.sqlite")) as database:
+            database.upsert(
+                [
+                    (
+                        "https://example.com/recipe",
+                        {"title": "Recipe", "last_modified": "2024-01-01"},
+                    ),
+                    ("https://example.com/about", None),
+                    ("https://other.com/recipe", {"title": "Other"}),
+                ]
+            )
+            database.upsert(
+                [
+                    (
+                        "https://example.com/about",
+                        {"title": "About", "last_modified": None, "etag": '"v1"'},
+                    )
+                ]
+            )
+
+            assert database.load_site("https://example.com/") == {
+                "https://example.com/recipe": {
+                    "title": "Recipe",
+                    "last_modified": "2024-01-01",
+                },
+                "https://example.com/about": {
+                    "title": "About",
+                    "last_modified": None,
+                    "etag": '"v1"',
+                },
+            }
+            assert database.load_site("https://unknown.com/") is None
+
+            # Fetch metadata is stored in its own table
+            assert database.connection.execute(
+                "SELECT url, etag FROM fetch_metadata"
+            ).fetchall() == [("https://example.com/about", '"v1"')]
+
+
+@pytest.mark.util
+def test_recipe_database_upsert_unchanged_rows():
+    """Test that upserting unchanged recipes does not touch their rows."""
+    with TemporaryDirectory() as tmp_dir:
+        with RecipeDatabase(os.path.join(tmp_dir, "recipes.sqlite")) as database:
+            record = ("https://example.com/recipe", {"title": "Recipe"})
+            database.upsert([record])
+            changes_before = database.connection.total_changes
+
+            database.upsert([record])
+            assert database.connection.total_changes == changes_before
+
+            database.upsert([("https://example.com/recipe", {"title": "New"})])
+            assert database.connection.total_changes == changes_before + 1
+
+            database.upsert([("https://example.com/recipe", None)])
+            assert database.load_site("https://example.com/") == {
+                "Pages without Recipe": ["https://example.com/recipe"]
+            }
+
+
+@pytest.mark.util
+def test_recipe_database_upsert_removed_pages():
+    """Test that removed pages are deleted from all tables."""
+    with TemporaryDirectory() as tmp_dir:
+        with RecipeDatabase(os.path.join(tmp_dir, "recipes.sqlite")) as database:
+            database.upsert(
+                [
+                    ("https://example.com/recipe", {"title": "Recipe"}),
+                    ("https://example.com/gone", {"title": "Gone", "etag": '"v1"'}),
+                    ("https://example.com/about", None),
+                ]
+            )
+            database.upsert(
+                [
+                    ("https://example.com/gone", REMOVED_PAGE),
+                    ("https://example.com/about", REMOVED_PAGE),
+                ]
+            )
+
+            assert database.load_site("https://example.com/") == {
+                "https://example.com/recipe": {"title": "Recipe"}
+            }
+            assert (
+                database.connection.execute(
+                    "SELECT COUNT(*) FROM fetch_metadata"
+                ).fetchone()[0]
+                == 0
+            )
+
+
+@pytest.mark.util
+def test_recipe_database_exclusions_last_modified():
+    """Test that the last modified date of pages without recipe is stored & updated, also in databases created without the column."""
+    with TemporaryDirectory() as tmp_dir:
+        filename = os.path.join(tmp_dir, "recipes.sqlite")
+        with RecipeDatabase(filename) as database:
+            database.connection.execute("DROP TABLE exclusions")
+            database.connection.execute(
+                "CREATE TABLE exclusions (url TEXT PRIMARY KEY, host TEXT NOT NULL, updated_at TEXT NOT NULL)"
+            )
+
+        with RecipeDatabase(filename) as database:
+            database.upsert(
+                [
+                    ("https://example.com/about", PageWithoutRecipe("2024-01-01")),
+                    ("https://example.com/contact", None),
+                ]
+            )
+            database.upsert(
+                [("https://example.com/about", PageWithoutRecipe("2024-02-01"))]
+            )
+
+            assert database.load_exclusions("https://example.com/") == {
+                "https://example.com/about": "2024-02-01",
+                "https://example.com/contact": None,
+            }
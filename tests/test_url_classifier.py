@@ -0,0 +1,142 @@
+import os
+import pytest
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+from recipe_database_scraper.url_classifier import (
+    UrlClassifier,
+    UrlClassifierStore,
+    url_features,
+)
+from recipe_database_scraper.recipe_scraper import (
+    PREDICTED_NO_RECIPE,
+    Recipe,
+    RecipeScraper,
+)
+from recipe_database_scraper.sitemap_scraper import Page
+
+shop_urls = [f"https://example.com/shop/kitchen/item-{str(i)}" for i in range(60)]
+recipe_urls = [f"https://example.com/recipes/soup-{str(i)}" for i in range(60)]
+
+
+@pytest.mark.util
+@pytest.mark.parametrize(
+    "url, expected_features",
+    [
+        (
+            "https://example.com/shop/kitchen/pan-large/",
+            ["prefix:/shop/", "prefix:/shop/kitchen/", "slug:pan"],
+        ),
+        (
+            "https://example.com/Roundups/10-best-soups",
+            ["prefix:/roundups/", "slug:#"],
+        ),
+        ("https://example.com/about", ["slug:about"]),
+        ("https://example.com/", []),
+    ],
+)
+def test_url_features(url, expected_features):
+    """Test that urls are classified on their leading path sections & the first word of their slug."""
+    assert url_features(url) == expected_features
+
+
+@pytest.mark.util
+def test_url_classifier_skip():
+    """Test that only pages of which every well observed feature predicts no recipe are skipped, and that skipped pages are not learned."""
+    url_classifier = UrlClassifier(verification_rate=0)
+    url_classifier.learn_results(recipe_urls, shop_urls)
+
+    assert url_classifier.skip("https://example.com/shop/kitchen/item-new")
+    assert not url_classifier.skip("https://example.com/recipes/soup-new")
+    # Too few observations of /blog/ & 'post' to predict anything
+    assert not url_classifier.skip("https://example.com/blog/post")
+    assert url_classifier.skipped_pages == 1
+
+    counts = dict(url_classifier.counts)
+    url_classifier.learn("https://example.com/shop/kitchen/item-new", False)
+    assert url_classifier.counts == counts
+
+
+@pytest.mark.util
+def test_url_classifier_verification():
+    """Test that a verification sample of predicted pages is fetched, and that recipes among them are learned."""
+    url_classifier = UrlClassifier(verification_rate=1)
+    url_classifier.learn_results(recipe_urls, shop_urls)
+
+    assert not url_classifier.skip("https://example.com/shop/kitchen/item-soup-kit")
+    url_classifier.learn("https://example.com/shop/kitchen/item-soup-kit", True)
+
+    assert url_classifier.verified_pages == 1
+    assert url_classifier.verified_recipes == 1
+    assert url_classifier.counts["prefix:/shop/"] == [1, 60]
+
+
+@pytest.mark.util
+def test_url_classifier_store():
+    """Test that a classifier starts from the input of a site, and is stored per site."""
+    with TemporaryDirectory() as tmp_dir:
+        store = UrlClassifierStore(tmp_dir, min_samples=10)
+        url_classifier = store.load(
+            "https://example.com/",
+            input_dict=dict.fromkeys(recipe_urls, {}),
+            exclusions=dict.fromkeys(shop_urls),
+        )
+        assert url_classifier.counts["prefix:/shop/"] == [0, 60]
+        assert url_classifier.min_samples == 10
+
+        store.save("https://example.com/", url_classifier)
+        assert os.path.isfile(
+            os.path.join(tmp_dir, "_recipe_scraper_classifier", "example.com.json")
+        )
+
+        stored_classifier = store.load("https://example.com/", input_dict={})
+        assert stored_classifier.counts == url_classifier.counts
+        assert store.load("https://other.com/").counts == {}
+
+
+@pytest.mark.util
+def test_url_classifier_store_settings():
+    """Test that classifier settings outside of their range are refused."""
+    with pytest.raises(ValueError):
+        UrlClassifierStore("classifier", threshold=1.5)
+    with pytest.raises(ValueError):
+        UrlClassifierStore("classifier", verification_rate=-0.1)
+
+
+@pytest.mark.recipe
+@patch("recipe_database_scraper.recipe_scraper.RecipeScraper._scrape_recipe_page")
+def test_scrape_page_classifier_skip(mock_scrape_recipe_page):
+    """Test that pages predicted not to contain a recipe are skipped without a request, and are not stored as pages without recipe."""
+    url_classifier = UrlClassifier(verification_rate=0)
+    url_classifier.learn_results(recipe_urls, shop_urls)
+    recipe_scraper = RecipeScraper(
+        "https://example.com", "test-agent", url_classifier=url_classifier
+    )
+    recipe_scraper.robots_parser = None
+    page = Page("https://example.com/shop/kitchen/item-new", None)
+
+    recipe = recipe_scraper._scrape_page(1, page, None, 1)
+    recipe_scraper._record_page(page, recipe, None, None)
+
+    assert recipe is PREDICTED_NO_RECIPE
+    mock_scrape_recipe_page.assert_not_called()
+    assert recipe_scraper.recipes.pages_without_recipe == {}
+    assert recipe_scraper.recipes.unwritten_records == []
+    assert url_classifier.skipped_pages == 1
+
+
+@pytest.mark.recipe
+def test_record_page_classifier_learns_fetched_pages():
+    """Test that the url classifier does not learn from recipes reused from the input."""
+    url_classifier = UrlClassifier()
+    recipe_scraper = RecipeScraper(
+        "https://example.com", "test-agent", url_classifier=url_classifier
+    )
+    page = Page("https://example.com/recipes/soup", "2024-01-01")
+
+    recipe_scraper._record_page(
+        page, Recipe({"title": "Soup"}, reused=True), None, None
+    )
+    assert url_classifier.counts == {}
+
+    recipe_scraper._record_page(page, Recipe({"title": "Soup"}), None, None)
+    assert url_classifier.counts == {"prefix:/recipes/": [1, 0], "slug:soup": [1, 0]}
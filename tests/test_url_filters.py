@@ -0,0 +1,86 @@
+import re
+import pytest
+from recipe_database_scraper.url_filters import (
+    UrlFilter,
+    compile_rules,
+    url_extension,
+)
+from recipe_database_scraper.sitemap_scraper import (
+    SITEMAP_FILTER_KEYWORDS,
+    URL_FILTER_KEYWORDS,
+    SitemapScraper,
+)
+
+
+@pytest.mark.util
+@pytest.mark.parametrize(
+    "url, expected_extension",
+    [
+        ("https://example.com/image.JPG", ".jpg"),
+        ("https://example.com/files/menu.pdf?download=1", ".pdf"),
+        ("https://example.com/video.mp4#t=10", ".mp4"),
+        ("https://example.com/recipes.modern/soup", ""),
+        ("https://example.com/recipe/", ""),
+        ("https://example.com/recipe?page=2.5", ""),
+    ],
+)
+def test_url_extension(url, expected_extension):
+    """Test that only the extension of the last path segment is taken, ignoring query & fragment."""
+    assert url_extension(url) == expected_extension
+
+
+@pytest.mark.util
+@pytest.mark.parametrize(
+    "url",
+    [
+        "https://example.com/news-sitemap.xml",
+        "https://example.com/sitemap-ADS-1.xml",
+        "https://example.com/post_tag-sitemap.xml",
+        "https://example.com/recipe-sitemap.xml",
+        "https://example.com/sitemap.xml",
+    ],
+)
+def test_url_filter_matches_keyword_scan(url):
+    """Test that the compiled sitemap keywords filter the same sitemaps as a scan per keyword."""
+    url_filter = UrlFilter(SITEMAP_FILTER_KEYWORDS, URL_FILTER_KEYWORDS)
+
+    assert url_filter.sitemap_filtered(url) == any(
+        word in url.lower() for word in SITEMAP_FILTER_KEYWORDS
+    )
+
+
+@pytest.mark.util
+def test_url_filter_rules():
+    """Test that pages are filtered on extension, exclude rules & include rules, with globs & regexes."""
+    url_filter = UrlFilter(
+        (),
+        URL_FILTER_KEYWORDS,
+        include=["https://example.com/recipes/*", re.compile(r"/\d{4}/\d{2}/")],
+        exclude=["*/print/*", re.compile("amp$", re.IGNORECASE)],
+    )
+
+    assert not url_filter.page_filtered("https://example.com/recipes/soup")
+    assert not url_filter.page_filtered("https://example.com/2024/10/soup")
+    assert url_filter.page_filtered("https://example.com/about")
+    assert url_filter.page_filtered("https://example.com/recipes/soup.jpg")
+    assert url_filter.page_filtered("https://example.com/recipes/print/soup")
+    assert url_filter.page_filtered("https://example.com/recipes/soup/AMP")
+
+
+@pytest.mark.util
+def test_compile_rules_invalid():
+    """Test that url rules other than globs & compiled str regexes are refused."""
+    assert compile_rules(None) is None
+    with pytest.raises(TypeError):
+        compile_rules([42])
+
+
+@pytest.mark.sitemap
+def test_sitemap_scraper_url_rules():
+    """Test that the include & exclude rules of a site are applied to its sitemap pages."""
+    scraper = SitemapScraper(
+        "https://example.com", exclude_urls=["https://example.com/blog/*"]
+    )
+
+    assert scraper.url_filter.page_filtered("https://example.com/blog/post")
+    assert not scraper.url_filter.page_filtered("https://example.com/recipe/1")